@@ -0,0 +1,64 @@
+"""
+File: cache.py
+Author: agent
+Date: 2026-10-17
+Brief: Least recently used cache with hit/miss statistics
+"""
+
+import threading
+from collections import OrderedDict
+
+class LRUCache():
+    """
+    Thread-safe cache which evicts the least recently used entry when full
+    """
+    def __init__(self, capacity):
+        """
+        @param capacity: Maximum number of entries
+        """
+        self.capacity = max(1, int(capacity))
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Return cached value and mark it as recently used
+        @return: Cached value or None if the key is not cached
+        """
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries[key] = value # Move to the end (most recently used)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            if key in self.entries:
+                del self.entries[key]
+            elif len(self.entries) >= self.capacity:
+                self.entries.popitem(last=False) # Remove least recently used
+                self.evictions += 1
+            self.entries[key] = value
+
+    def discard(self, key):
+        """ Remove the key if cached """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def size(self):
+        return len(self.entries)
+
+    def getHitRatio(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
@@ -0,0 +1,209 @@
+"""
+File: connection.py
+Author: agent
+Date: 2026-10-17
+Brief: Persistent connection to VBoxWebSrv. The connection is checked only
+       when it has been idle for some time and it is reestablished only
+       when the webservice session is lost.
+"""
+
+import errno
+import socket
+import threading
+import time
+
+# Fragments of error messages which mean that the webservice session is gone.
+# Refused connection is not among them, the server is down and reconnection cannot help.
+SESSION_FAULTS = ["invalid managed object reference",
+                  "not logged on",
+                  "websession",
+                  "connection reset",
+                  "broken pipe",
+                  ]
+
+# Socket errors which mean that an established connection was lost
+LOST_CONNECTION = [errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED]
+
+# Fragments of error messages which mean that a cached object reference is stale
+STALE_HANDLES = ["object is not ready",
+                 "is not accessible",
+                 "inaccessible",
+                 "object not found",
+                 "session is not locked",
+                 ]
+
+class Connection():
+    """
+    Keeps the vbox handle of an environment alive
+    """
+    def __init__(self, env, idleThreshold=60):
+        """
+        @param env: Environment whose connection is managed
+        @param idleThreshold: Number of seconds after which an idle connection
+                              is probed before use. Default value: 60
+        """
+        self.env = env
+        self.idleThreshold = idleThreshold
+        self.lock = threading.RLock()
+        self.lastUsed = time.time()
+        self.generation = 0 # Incremented with every (re)connection
+        self.disconnected = False # Logged off by disconnect, the next use logs in again
+        self.reconnects = 0
+        self.probes = 0
+        self.failedProbes = 0
+        self.callbacks = [] # Called after successful reconnection
+        self.invalidators = [] # Called when a cached object reference is stale
+
+    def addCallback(self, callback):
+        """
+        Register callable which is invoked after every reconnection.
+        Object references from previous webservice session are invalid then.
+        """
+        self.callbacks.append(callback)
+
+    def addInvalidator(self, invalidator):
+        """
+        Register callable which drops cached object references. It is invoked
+        when a call fails because of stale reference, before the call is retried.
+        """
+        self.invalidators.append(invalidator)
+
+    def touch(self):
+        self.lastUsed = time.time()
+
+    def getIdleTime(self):
+        return time.time() - self.lastUsed
+
+    def ensure(self):
+        """
+        Make sure the connection is usable. The connection is probed only
+        if it has been idle longer than the threshold.
+        @return: vbox object of the environment
+        """
+        with self.lock:
+            if not self.env.isOpen(): # Host was unreachable so far
+                self.env.open()
+                self.generation += 1
+            elif self.disconnected: # Log in before the call, the call would fail otherwise
+                self.reconnect()
+            elif self.env.remote and self.getIdleTime() > self.idleThreshold:
+                if not self.probe():
+                    self.reconnect()
+            self.touch()
+            return self.env.vbox
+
+    def probe(self):
+        """
+        Check the connection with a cheap call
+        @return: True if the connection is alive, False otherwise
+        """
+        self.probes += 1
+        try:
+            self.env.vbox.version
+        except Exception:
+            self.failedProbes += 1
+            return False
+        return True
+
+    def isSessionFault(self, exc):
+        """
+        Check if the exception means that the webservice session was lost
+        @param exc: Exception raised by VirtualBox API call
+        """
+        if not self.env.remote:
+            return False
+        if isinstance(exc, socket.error):
+            return exc.errno in LOST_CONNECTION
+        message = str(exc).lower()
+        return any(fault in message for fault in SESSION_FAULTS)
+
+    def isStaleHandle(self, exc):
+        """
+        Check if the exception means that an object reference is not valid anymore
+        @param exc: Exception raised by VirtualBox API call
+        """
+        message = str(exc).lower()
+        return any(fault in message for fault in STALE_HANDLES)
+
+    def connect(self):
+        """
+        Log in to the webservice. Object references of the previous webservice
+        session are invalid after a new login, so callbacks are invoked.
+        """
+        with self.lock:
+            env = self.env
+            if not env.isOpen(): # The first connection creates the manager
+                env.open()
+                relogged = False
+            else:
+                env.vbox = env.mgr.platform.connect(env.url, env.user, env.password)
+                relogged = True
+            self.disconnected = False
+            self.generation += 1
+            self.touch()
+            if relogged:
+                for callback in self.callbacks:
+                    callback()
+            return env.vbox
+
+    def disconnect(self):
+        """ Log off from the webservice, do nothing if already disconnected """
+        with self.lock:
+            if not self.env.isOpen() or self.disconnected:
+                return
+            try:
+                self.env.mgr.platform.disconnect()
+            except Exception:
+                pass
+            self.disconnected = True
+
+    def reconnect(self, generation=None):
+        """
+        Reestablish the webservice session.
+        @param generation: Generation of the connection which failed. If the
+                           connection was already renewed by another thread
+                           meanwhile, nothing is done. Default value: None
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return self.env.vbox # Somebody else already reconnected
+            self.disconnect()
+            self.connect()
+            self.reconnects += 1
+            return self.env.vbox
+
+    def recover(self, exc, generation=None):
+        """
+        Repair the connection after a failed call, so the next call can succeed.
+        Lost webservice session is reestablished, stale cached references are dropped.
+        @param exc: Exception raised by VirtualBox API call
+        @param generation: Generation of the connection used by the call. Default value: None
+        @return: True if the connection was repaired, False if the failure has another cause
+        """
+        if self.isSessionFault(exc):
+            self.reconnect(generation)
+        elif self.isStaleHandle(exc) and len(self.invalidators):
+            for invalidator in self.invalidators:
+                invalidator()
+        else:
+            return False
+        return True
+
+    def call(self, func, args, retry=False):
+        """
+        Call a command which uses the connection. If it fails because of lost
+        webservice session or stale object reference, the connection is repaired.
+        The command is called once more only if it is read only, command with
+        side effects (reset, power off, clone, ...) must never run twice.
+        @param func: Command function
+        @param args: Command arguments
+        @param retry: Command may be repeated after repair. Default value: False
+        """
+        self.ensure()
+        generation = self.generation
+        try:
+            return func(args)
+        except Exception as e:
+            if not self.recover(e, generation) or not retry:
+                raise
+        return func(args)
@@ -0,0 +1,150 @@
+"""
+File: credentials.py
+Author: agent
+Date: 2026-10-17
+Brief: Index of machine credentials keyed by (host, machine). Credentials
+       registered to the host take precedence over credentials of groups,
+       groups are ordered by the time they were registered.
+"""
+
+import threading
+
+def isUsable(credentials):
+    """ Only complete credentials are used for commands """
+    return credentials is not None and bool(credentials.get('user')) and bool(credentials.get('password'))
+
+class CredentialIndex():
+    """
+    Keeps credentials of every known machine, the answer of lookup is
+    resolved when credentials change, so lookup is a single dictionary access.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hostCredentials = {} # (host, machine) -> credentials registered to host
+        self.groupCredentials = {} # (host, machine) -> {group name: credentials}
+        self.order = {} # Group name -> registration number
+        self.sequence = 0
+        self.resolved = {} # (host, machine) -> (user, password)
+        self.followed = [] # Environments and groups reporting their changes to index
+
+    def resolve(self, key):
+        """ Recompute the answer for single machine, lock must be held """
+        credentials = self.hostCredentials.get(key)
+        if not isUsable(credentials):
+            credentials = None
+            groups = self.groupCredentials.get(key, {})
+            for name in sorted(groups.keys(), key=self.order.get):
+                if isUsable(groups[name]):
+                    credentials = groups[name]
+                    break
+        if credentials is None:
+            self.resolved.pop(key, None)
+        else:
+            self.resolved[key] = (credentials['user'], credentials['password'])
+
+    def lookup(self, host, machname):
+        """
+        @return: Tuple (user, password) or None if no complete credentials are known
+        """
+        return self.resolved.get((host, machname))
+
+    def setHostMachine(self, host, machname, credentials):
+        with self.lock:
+            self.hostCredentials[(host, machname)] = credentials
+            self.resolve((host, machname))
+
+    def removeHostMachine(self, host, machname):
+        with self.lock:
+            if self.hostCredentials.pop((host, machname), None) is not None:
+                self.resolve((host, machname))
+
+    def setGroupMachine(self, group, host, machname, credentials):
+        with self.lock:
+            self.groupCredentials.setdefault((host, machname), {})[group] = credentials
+            self.resolve((host, machname))
+
+    def removeGroupMachine(self, group, host, machname):
+        with self.lock:
+            groups = self.groupCredentials.get((host, machname))
+            if groups is not None and groups.pop(group, None) is not None:
+                if not len(groups):
+                    del self.groupCredentials[(host, machname)]
+                self.resolve((host, machname))
+
+    def addEnvironment(self, env):
+        """ Index machines of environment and keep following its changes """
+        env.index = self
+        self.followed.append(env)
+        for machname, credentials in env.getMachines().items():
+            self.setHostMachine(env.getName(), machname, credentials)
+
+    def removeEnvironment(self, env):
+        self.unfollow(env)
+        for machname in env.getMachines().keys():
+            self.removeHostMachine(env.getName(), machname)
+
+    def addGroup(self, group):
+        """
+        Index machines of group and keep following its changes. A group
+        registered again under the same name keeps its precedence.
+        """
+        with self.lock:
+            if group.getName() not in self.order:
+                self.sequence += 1
+                self.order[group.getName()] = self.sequence
+        group.index = self
+        self.followed.append(group)
+        for host, machines in group.getMachines().items():
+            for machname, credentials in machines.items():
+                self.setGroupMachine(group.getName(), host, machname, credentials)
+
+    def removeGroup(self, group):
+        self.unfollow(group)
+        for host, machines in group.getMachines().items():
+            for machname in machines.keys():
+                self.removeGroupMachine(group.getName(), host, machname)
+        with self.lock:
+            self.order.pop(group.getName(), None)
+
+    def unfollow(self, item):
+        if item.index is self:
+            item.index = None
+        if item in self.followed:
+            self.followed.remove(item)
+
+    def rebuild(self, envs, groups):
+        """
+        Index environments and groups from scratch, used when configuration
+        is replaced at once. Known groups keep their precedence, new groups
+        follow in the given order.
+        @param envs: Iterable of Environment objects
+        @param groups: Iterable of Group objects
+        """
+        groups = list(groups)
+        self.unfollowAll() # Replaced objects must not change the index anymore
+        with self.lock:
+            self.hostCredentials = {}
+            self.groupCredentials = {}
+            self.resolved = {}
+            names = set(group.getName() for group in groups)
+            self.order = dict((name, number) for name, number in self.order.items() if name in names)
+        for env in envs:
+            self.addEnvironment(env)
+        # New groups are sorted after the known ones, sort is stable
+        for group in sorted(groups, key=lambda group: (group.getName() not in self.order, self.order.get(group.getName()))):
+            self.addGroup(group)
+
+    def unfollowAll(self):
+        for item in self.followed:
+            if item.index is self:
+                item.index = None
+        self.followed = []
+
+    def clear(self):
+        self.unfollowAll()
+        with self.lock:
+            self.hostCredentials = {}
+            self.groupCredentials = {}
+            self.resolved = {}
+            self.order = {}
+            self.sequence = 0
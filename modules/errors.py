@@ -24,4 +24,28 @@ class CommandException(Exception):
         self.message = message
     
     def __str__(self):
-        return self.message  
\ No newline at end of file
+        return self.message  
+class ConfigurationException(Exception):
+    """
+    Raises when configuration file contains an error
+    """
+    def __init__(self, message="", line=0):
+        super(Exception, self).__init__(message)
+
+        self.message = message
+        self.line = line
+    
+    def __str__(self):
+        return self.message
+
+class TransferException(Exception):
+    """
+    Raises when file transfer between host and guest fails
+    """
+    def __init__(self, message=""):
+        super(Exception, self).__init__(message)
+
+        self.message = message
+    
+    def __str__(self):
+        return self.message
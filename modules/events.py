@@ -0,0 +1,119 @@
+"""
+File: events.py
+Author: agent
+Date: 2026-10-17
+Brief: Passive listener of VirtualBox event source. Events are fetched
+       in a background thread and dispatched to registered handlers.
+"""
+
+import threading
+import time
+
+class EventWatcher():
+    """
+    Watches events of a single environment
+    """
+    def __init__(self, env, timeout=1000, retryDelay=5):
+        """
+        @param env: Environment whose events are watched
+        @param timeout: Time in miliseconds to wait for a single event. Default value: 1000
+        @param retryDelay: Seconds to wait before subscribing again after an error. Default value: 5
+        """
+        self.env = env
+        self.timeout = timeout
+        self.retryDelay = retryDelay
+        self.handlers = {} # Event type -> list of (interface name, handler)
+        self.subscribeCallbacks = [] # Called after every subscription
+        self.lock = threading.Lock()
+        self.source = None
+        self.listener = None
+        self.thread = None
+        self.running = False
+        self.subscribed = False
+        self.received = 0
+        self.errors = 0
+
+    def addHandler(self, eventType, interface, handler):
+        """
+        Register handler for event type. Watcher has to be restarted to apply new types.
+        @param eventType: VBoxEventType constant
+        @param interface: Name of interface the event is queried for, e.g. 'IMachineStateChangedEvent'
+        @param handler: Callable called with the queried event
+        """
+        with self.lock:
+            self.handlers.setdefault(int(eventType), []).append((interface, handler))
+
+    def addSubscribeCallback(self, callback):
+        """
+        Register callable invoked after every (re)subscription. Events might
+        have been missed before it, so cached data should be refreshed.
+        """
+        self.subscribeCallbacks.append(callback)
+
+    def start(self):
+        with self.lock:
+            if self.running or not len(self.handlers):
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def resubscribe(self):
+        """
+        Drop the current listener, e.g. after reconnection when the old
+        listener reference is not valid anymore
+        """
+        self.listener = None
+        self.subscribed = False
+
+    def subscribe(self):
+        """ Register a passive listener for all handled event types """
+        self.source = self.env.vbox.eventSource
+        self.listener = self.source.createListener()
+        self.source.registerListener(self.listener, self.handlers.keys(), False)
+        self.subscribed = True
+        for callback in self.subscribeCallbacks:
+            callback()
+
+    def run(self):
+        """ Body of watcher thread """
+        mgr = self.env.mgr
+        if hasattr(mgr, 'initPerThread'):
+            mgr.initPerThread()
+        try:
+            while self.running:
+                try:
+                    if self.listener is None:
+                        self.subscribe()
+                    event = self.source.getEvent(self.listener, self.timeout)
+                    if event is None:
+                        continue
+                    try:
+                        self.dispatch(event)
+                    finally:
+                        self.source.eventProcessed(self.listener, event)
+                except Exception: # Connection lost, subscribe again later
+                    self.errors += 1
+                    self.resubscribe()
+                    time.sleep(self.retryDelay)
+            if self.listener is not None:
+                try:
+                    self.source.unregisterListener(self.listener)
+                except Exception:
+                    pass
+        finally:
+            if hasattr(mgr, 'deinitPerThread'):
+                mgr.deinitPerThread()
+
+    def dispatch(self, event):
+        """ Pass event to all handlers of its type """
+        self.received += 1
+        for interface, handler in self.handlers.get(int(event.type), []):
+            try:
+                handler(self.env.mgr.queryInterface(event, interface))
+            except Exception:
+                pass
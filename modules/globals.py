@@ -7,4 +7,27 @@ Brief: Definition of global variables
 
 historySupport = False
 cmdCompleter = False
-maxHistoryLen = 100
\ No newline at end of file
+maxHistoryLen = 100
+maxWorkers = 16 # Maximum number of commands executed concurrently by group commands
+connectionIdleThreshold = 60 # Idle time in seconds after which the webservice connection is probed
+machineCacheSize = 256 # Maximum number of machine handles cached per host
+inventoryTTL = 60 # Number of seconds a snapshot of host machines is reused
+sessionIdleTimeout = 30 # Number of seconds after which unused shared session is unlocked
+progressCancelTimeout = 10 # Maximum number of seconds to wait for cancelled operation to end
+batchHostConcurrency = 4 # Maximum number of background batch steps running on one host
+logFile = 'manager_log.txt' # Log of automatic mode, records are appended
+logMaxBytes = 10485760 # Size of log file which triggers rotation
+logBackups = 5 # Number of rotated log files kept
+logFlushInterval = 1.0 # Maximum number of seconds a log record waits in buffer
+hostConnectTimeout = 10 # Maximum number of seconds to wait for connection to a host
+hostConnectWorkers = 32 # Maximum number of hosts connected concurrently
+guestReadMin = 16384 # Initial size of a single read of guest process output
+guestReadMax = 1048576 # Maximum size of a single read of guest process output
+guestPollInterval = 0.5 # Maximum number of seconds to wait for guest process output at once
+transferChunkSize = 1048576 # Size of a single chunk of file transfer between host and guest
+transferInflight = 8 # Number of chunks of file transfer in flight at once
+distributeHostConcurrency = 4 # Maximum number of machines of one host receiving distributed file at once
+applianceHostConcurrency = 2 # Maximum number of appliances exported or imported on one host at once
+applianceBandwidth = 0 # Maximum throughput of appliance export and import in MB/s, 0 means unlimited
+cloneWorkers = 8 # Maximum number of clones created at once
+cloneSnapshotName = "Linked clone base" # Snapshot taken by clone command when template has none
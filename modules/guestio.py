@@ -0,0 +1,148 @@
+"""
+File: guestio.py
+Author: agent
+Date: 2026-10-17
+Brief: Streaming of guest process output. Stdout and stderr are read
+       repeatedly until the process terminates, the read size grows while
+       the buffers are full and shrinks when output is sparse. The pump can
+       run in background while input is passed to the process.
+"""
+
+import hashlib
+import threading
+import time
+
+STDIN = 0 # Handles of guest process input and output
+STDOUT = 1
+STDERR = 2
+
+class CapturedOutput():
+    """
+    Output of guest process written to file. Only digest and beginning
+    of the output are kept in memory, so outputs can be compared.
+    """
+    def __init__(self, filename, headSize=4096):
+        """
+        @param filename: Path to file, where the whole output is written
+        @param headSize: Number of bytes kept in memory. Default value: 4096
+        """
+        self.filename = filename
+        self.headSize = headSize
+        self.fp = open(filename, 'wb')
+        self.hash = hashlib.sha1()
+        self.head = ""
+        self.size = 0
+
+    def write(self, data):
+        self.fp.write(data)
+        self.hash.update(data)
+        if len(self.head) < self.headSize:
+            self.head += data[:self.headSize - len(self.head)]
+        self.size += len(data)
+
+    def getDigest(self):
+        return self.hash.hexdigest()
+
+    def close(self):
+        self.fp.close()
+
+class OutputPump():
+    """
+    Moves output of guest process to sinks
+    """
+    def __init__(self, proc, const, sinks, minRead=16384, maxRead=1048576, interval=0.5):
+        """
+        @param proc: IGuestProcess object
+        @param const: VirtualBox constants
+        @param sinks: Dictionary handle -> callable called with every piece of data
+        @param minRead: Initial and minimum size of a single read in bytes. Default value: 16 kB
+        @param maxRead: Maximum size of a single read in bytes. Default value: 1 MB
+        @param interval: Maximum number of seconds to wait for output at once. Default value: 0.5
+        """
+        self.proc = proc
+        self.const = const
+        self.sinks = sinks
+        self.minRead = minRead
+        self.maxRead = maxRead
+        self.interval = interval
+        self.readSize = dict((handle, minRead) for handle in sinks.keys())
+        self.received = dict((handle, 0) for handle in sinks.keys())
+        self.waitSupported = True # Old guest additions cannot wait for output
+        self.stopped = False
+        self.terminated = False
+
+    def isRunning(self):
+        return self.proc.status in [self.const.ProcessStatus_Starting, self.const.ProcessStatus_Started,
+                                    self.const.ProcessStatus_Paused, self.const.ProcessStatus_Terminating]
+
+    def wait(self):
+        """
+        Wait until there is some output or the process terminates
+        @return: True if the process terminated
+        """
+        const = self.const
+        timeout = int(self.interval * 1000)
+        if self.waitSupported:
+            flags = [const.ProcessWaitForFlag_Terminate]
+            if STDOUT in self.sinks:
+                flags.append(const.ProcessWaitForFlag_StdOut)
+            if STDERR in self.sinks:
+                flags.append(const.ProcessWaitForFlag_StdErr)
+            result = self.proc.waitForArray(flags, timeout)
+            if result != const.ProcessWaitResult_WaitFlagNotSupported:
+                return result in [const.ProcessWaitResult_Terminate, const.ProcessWaitResult_Error]
+            self.waitSupported = False
+        time.sleep(min(self.interval, 0.05)) # Poll output of old guest additions
+        return not self.isRunning()
+
+    def read(self, handle):
+        """
+        Read available output of single handle and pass it to its sink
+        @return: Number of bytes read
+        """
+        size = self.readSize[handle]
+        data = self.proc.read(handle, size, 0)
+        if not data:
+            return 0
+        if len(data) >= size: # Buffer is filled, more output is likely waiting
+            self.readSize[handle] = min(size * 2, self.maxRead)
+        elif len(data) < size / 4:
+            self.readSize[handle] = max(size / 2, self.minRead)
+        self.received[handle] += len(data)
+        self.sinks[handle](str(data))
+        return len(data)
+
+    def drain(self):
+        """ Read output left after the process terminated """
+        while sum(self.read(handle) for handle in self.sinks.keys()):
+            pass
+
+    def run(self, timeout=None):
+        """
+        Pump output until the process terminates
+        @param timeout: Maximum number of seconds to wait for the process. If None, wait forever. Default value: None
+        @return: True if the process terminated, False on timeout
+        """
+        end = time.time() + timeout if timeout is not None else None
+        while not self.terminated and not self.stopped:
+            self.terminated = self.wait()
+            while sum(self.read(handle) for handle in self.sinks.keys()): # Read while output keeps coming
+                pass
+            if end is not None and time.time() >= end:
+                break
+        self.drain()
+        return self.terminated
+
+    def stop(self):
+        """ End run method of another thread after the current wait """
+        self.stopped = True
+
+    def start(self):
+        """
+        Pump output in background thread
+        @return: Started thread, it ends when the process terminates or the pump is stopped
+        """
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+        return thread
@@ -0,0 +1,75 @@
+"""
+File: history.py
+Author: agent
+Date: 2026-10-17
+Brief: Latency history of commands. Average durations are stored between
+       runs and used to estimate duration of batch steps.
+"""
+
+import json
+import threading
+
+class LatencyHistory():
+    """
+    Exponentially weighted average of command durations
+    """
+    def __init__(self, filename, weight=0.3):
+        """
+        @param filename: File where the history is stored
+        @param weight: Weight of the newest sample. Default value: 0.3
+        """
+        self.filename = filename
+        self.weight = weight
+        self.lock = threading.Lock()
+        self.entries = {} # Key -> {'mean': seconds, 'count': number of samples}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.filename, 'r') as fp:
+                self.entries = json.load(fp)
+        except (IOError, ValueError): # No history yet or corrupted file
+            self.entries = {}
+
+    def save(self):
+        with self.lock:
+            data = json.dumps(self.entries, indent=1, sort_keys=True)
+        try:
+            with open(self.filename, 'w') as fp:
+                fp.write(data)
+        except IOError:
+            pass
+
+    def getKey(self, command, host=None, group=False):
+        key = command + (":group" if group else "")
+        if host is not None:
+            key += "@" + host
+        return key
+
+    def record(self, command, duration, host=None, group=False):
+        """
+        Add a new sample
+        @param command: Command name
+        @param duration: Duration in seconds
+        @param host: Host the command was executed on. Default value: None
+        @param group: True if the command was executed for a group. Default value: False
+        """
+        keys = [self.getKey(command, None, group)]
+        if host is not None:
+            keys.append(self.getKey(command, host, group))
+        with self.lock:
+            for key in keys:
+                entry = self.entries.setdefault(key, {'mean': duration, 'count': 0})
+                entry['mean'] += self.weight * (duration - entry['mean'])
+                entry['count'] += 1
+
+    def estimate(self, command, host=None, group=False):
+        """
+        Return estimated duration of command, host specific history is preferred
+        @return: Duration in seconds or None if the command was never recorded
+        """
+        with self.lock:
+            for key in [self.getKey(command, host, group), self.getKey(command, None, group)]:
+                if key in self.entries:
+                    return self.entries[key]['mean']
+        return None
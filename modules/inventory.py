@@ -0,0 +1,102 @@
+"""
+File: inventory.py
+Author: agent
+Date: 2026-10-17
+Brief: Snapshot of machines and host information. All attributes are read
+       in a single concurrent sweep and reused until the snapshot expires.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from modules.workers import WorkerPool
+
+# Only attributes shown by commands are read, every attribute is a round trip
+MachineRecord = namedtuple('MachineRecord', ['name', 'osType'])
+
+class Snapshot():
+    """
+    Machines and host information read at one moment
+    """
+    def __init__(self, machines, host):
+        self.machines = machines # List of MachineRecord tuples
+        self.host = host # Dictionary of host attributes
+        self.taken = time.time()
+        self.duration = 0.0 # Time needed to take the snapshot
+
+    def getAge(self):
+        return time.time() - self.taken
+
+class Inventory():
+    """
+    Inventory of a single host
+    """
+    def __init__(self, env, ttl=60, workers=16):
+        """
+        @param env: Environment whose machines are read
+        @param ttl: Number of seconds the snapshot is valid. Default value: 60
+        @param workers: Number of concurrent readers. Default value: 16
+        """
+        self.env = env
+        self.ttl = ttl
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.refreshes = 0
+
+    def get(self):
+        """
+        Return valid snapshot, take a new one if the current one expired
+        @return: Snapshot object
+        """
+        with self.lock:
+            if self.snapshot is None or self.snapshot.getAge() > self.ttl:
+                self.snapshot = self.take()
+            return self.snapshot
+
+    def peek(self):
+        """ Return current snapshot even if it expired, never contacts the server """
+        return self.snapshot
+
+    def refresh(self):
+        """ Take a new snapshot regardless of its age """
+        with self.lock:
+            self.snapshot = self.take()
+            return self.snapshot
+
+    def invalidate(self):
+        self.snapshot = None
+
+    def take(self):
+        """ Read all attributes of machines and host concurrently """
+        started = time.time()
+        mgr = self.env.mgr
+        machines = mgr.getArray(self.env.vbox, 'machines')
+        pool = WorkerPool(self.workers,
+                          getattr(mgr, 'initPerThread', None),
+                          getattr(mgr, 'deinitPerThread', None))
+        hostResult = pool.submit('host', self.readHost)
+        results = [pool.submit(index, self.reader(mach)) for index, mach in enumerate(machines)]
+        pool.run()
+        records = [result.value for result in results if result.isOk()] # Skip inaccessible machines
+        snapshot = Snapshot(records, hostResult.value if hostResult.isOk() else {})
+        snapshot.duration = time.time() - started
+        self.refreshes += 1
+        return snapshot
+
+    def reader(self, mach):
+        def read():
+            return MachineRecord(str(mach.name), str(mach.OSTypeId))
+        return read
+
+    def readHost(self):
+        host = self.env.vbox.host
+        return {'nameServers': [str(ns) for ns in host.nameServers],
+                'processor': str(host.getProcessorDescription(0)),
+                'processorCoreCount': int(host.processorCoreCount),
+                'processorCount': int(host.processorCount),
+                'operatingSystem': str(host.operatingSystem),
+                'OSVersion': str(host.OSVersion),
+                'memorySize': int(host.memorySize),
+                }
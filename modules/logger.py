@@ -0,0 +1,120 @@
+"""
+File: logger.py
+Author: agent
+Date: 2026-10-17
+Brief: Buffered writer of structured log. Records are written as JSON lines
+       by a background thread, the log file is rotated by size.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from Queue import Queue, Empty
+
+class LogWriter():
+    """
+    Writes log records in background
+    """
+    def __init__(self, filename, maxBytes=10485760, backups=5, flushInterval=1.0, batchSize=500):
+        """
+        @param filename: Path to log file. Records are appended to it.
+        @param maxBytes: Size of log file which triggers rotation. Default value: 10 MB
+        @param backups: Number of rotated files kept. Default value: 5
+        @param flushInterval: Maximum time in seconds a record waits in buffer. Default value: 1.0
+        @param batchSize: Maximum number of records written at once. Default value: 500
+        """
+        self.filename = filename
+        self.maxBytes = maxBytes
+        self.backups = backups
+        self.flushInterval = flushInterval
+        self.batchSize = batchSize
+        self.queue = Queue()
+        self.flushed = threading.Condition()
+        self.written = 0 # Number of records written to file
+        self.received = 0 # Number of records passed to writer
+        self.fp = open(filename, 'a')
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, message, **fields):
+        """
+        Add record to the log. The call does not touch the disk.
+        @param message: Text of the record
+        @param fields: Additional fields, e.g. command, host, machine, duration, outcome
+        """
+        now = datetime.now()
+        record = {'time': now.strftime("%Y-%m-%dT%H:%M:%S.") + "%03d"%(now.microsecond / 1000),
+                  'message': message}
+        for key, value in fields.items():
+            if value is not None:
+                record[key] = value
+        self.received += 1
+        self.queue.put(record)
+
+    def run(self):
+        """ Body of writer thread """
+        while self.running or not self.queue.empty():
+            records = []
+            deadline = time.time() + self.flushInterval
+            # Collect records until the batch is full or the flush interval passed
+            while len(records) < self.batchSize:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    records.append(self.queue.get(True, timeout))
+                except Empty:
+                    break
+            if len(records):
+                self.writeRecords(records)
+            with self.flushed:
+                self.flushed.notify_all()
+
+    def writeRecords(self, records):
+        data = "".join(json.dumps(record, sort_keys=True) + "\n" for record in records)
+        try:
+            self.fp.write(data)
+            self.fp.flush()
+            self.written += len(records)
+            if self.fp.tell() >= self.maxBytes:
+                self.rotate()
+        except (IOError, ValueError): # Disk full or file closed, logging must not break commands
+            pass
+
+    def rotate(self):
+        """ Rename log.txt to log.txt.1, log.txt.1 to log.txt.2 etc. and open a new file """
+        self.fp.close()
+        for index in range(self.backups - 1, 0, -1):
+            src = "%s.%d"%(self.filename, index)
+            if os.path.exists(src):
+                os.rename(src, "%s.%d"%(self.filename, index + 1))
+        if self.backups > 0:
+            os.rename(self.filename, self.filename + ".1")
+        else:
+            os.remove(self.filename)
+        self.fp = open(self.filename, 'a')
+
+    def flush(self, timeout=5.0):
+        """
+        Wait until all records passed so far are written
+        @param timeout: Maximum time to wait in seconds. Default value: 5.0
+        """
+        end = time.time() + timeout
+        target = self.received
+        with self.flushed:
+            while self.written < target and self.thread.is_alive() and time.time() < end:
+                self.flushed.wait(0.1)
+
+    def close(self):
+        """ Write all buffered records and close the file """
+        if not self.running:
+            return
+        self.running = False
+        self.thread.join(self.flushInterval + 5)
+        self.fp.close()
@@ -0,0 +1,135 @@
+"""
+File: metrics.py
+Author: agent
+Date: 2026-10-17
+Brief: Latency histograms of commands. Durations are measured at several
+       stages (command dispatch, group fan-out, session locking, progress
+       waits) and kept per command and host.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of histogram buckets in seconds
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0]
+
+class Histogram():
+    """
+    Counts of durations in fixed buckets
+    """
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, duration):
+        index = 0
+        while index < len(self.bounds) and duration > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += duration
+        self.max = max(self.max, duration)
+
+    def merge(self, other):
+        """ Add counts of another histogram with the same bounds """
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def getPercentile(self, percent):
+        """
+        Estimate percentile by linear interpolation inside the bucket
+        @param percent: Percentile in range 0-100
+        @return: Duration in seconds or None if nothing was observed
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def getMean(self):
+        return self.sum / self.count if self.count else None
+
+class Metrics():
+    """
+    Histograms keyed by (stage, command, host)
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, stage, command, host, duration):
+        """
+        Record a single duration
+        @param stage: Measured stage, e.g. 'dispatch', 'group', 'lock', 'progress'
+        @param command: Command name
+        @param host: Host name
+        @param duration: Duration in seconds
+        """
+        key = (stage, command or "-", host or "-")
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(duration)
+
+    @contextmanager
+    def timer(self, stage, command, host):
+        """ Measure duration of the block, failed blocks are measured too """
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(stage, command, host, time.time() - started)
+
+    def getHistograms(self, stage=None):
+        """
+        @param stage: Return only histograms of given stage. Default value: None
+        @return: List of ((stage, command, host), Histogram) tuples sorted by key
+        """
+        with self.lock:
+            items = self.histograms.items()
+        return sorted(item for item in items if stage is None or item[0][0] == stage)
+
+    def clear(self):
+        with self.lock:
+            self.histograms = {}
+
+    def formatPrometheus(self, prefix="vbox_manager"):
+        """ Return histograms in Prometheus text exposition format """
+        name = prefix + "_latency_seconds"
+        lines = ["# HELP %s Latency of commands by stage, command and host"%name,
+                 "# TYPE %s histogram"%name]
+        for (stage, command, host), histogram in self.getHistograms():
+            labels = 'stage="%s",command="%s",host="%s"'%(escape(stage), escape(command), escape(host))
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append('%s_bucket{%s,le="%s"} %d'%(name, labels, bound, cumulative))
+            lines.append('%s_sum{%s} %.6f'%(name, labels, histogram.sum))
+            lines.append('%s_count{%s} %d'%(name, labels, histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def exportPrometheus(self, filename):
+        """ Write histograms to file, the file is replaced atomically """
+        tmp = filename + ".tmp"
+        with open(tmp, 'w') as fp:
+            fp.write(self.formatPrometheus())
+        os.rename(tmp, filename)
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
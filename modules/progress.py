@@ -0,0 +1,274 @@
+"""
+File: progress.py
+Author: agent
+Date: 2026-10-17
+Brief: Tracker of running VirtualBox operations. A single background thread
+       watches all IProgress objects, finishes completed operations, calls
+       their callbacks and renders the combined status. Callers either
+       register a callback or wait for the operation to end.
+"""
+
+import sys
+import threading
+import time
+
+class Operation():
+    """
+    A single tracked IProgress object
+    """
+    def __init__(self, opid, progress, label, mgr=None):
+        self.id = opid
+        self.progress = progress
+        self.label = label
+        self.mgr = mgr # VirtualBox manager the progress belongs to
+        self.percent = 0
+        self.resultCode = None
+        self.error = None
+        self.cancelled = False
+        self.started = time.time()
+        self.finished = None
+        self.callbacks = []
+        self.done = threading.Event()
+        self.lock = threading.Lock() # Callbacks are not lost when the operation ends meanwhile
+
+    def addCallback(self, callback):
+        """
+        Register callable which is called with this operation as argument when
+        the operation ends. If the operation already ended, callback is called immediately.
+        """
+        with self.lock:
+            if not self.done.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def finish(self):
+        """
+        Mark the operation as ended
+        @return: Callbacks to call
+        """
+        with self.lock:
+            self.finished = time.time()
+            self.done.set()
+            return list(self.callbacks)
+
+    def wait(self, timeout=None):
+        """
+        Wait for the operation to end
+        @param timeout: Maximum time to wait in seconds. If None, wait forever. Default value: None
+        @return: True if the operation ended, False on timeout
+        """
+        end = None if timeout is None else time.time() + timeout
+        # Short waits, so the waiting thread still receives KeyboardInterrupt
+        while not self.done.is_set():
+            wait = 0.2 if end is None else min(0.2, end - time.time())
+            if wait <= 0:
+                break
+            self.done.wait(wait)
+        return self.done.is_set()
+
+    def cancel(self):
+        """
+        Cancel the operation if VirtualBox allows it
+        @return: True if the cancel request was passed, False otherwise
+        """
+        if self.done.is_set() or not self.progress.cancelable:
+            return False
+        self.progress.cancel()
+        self.cancelled = True
+        return True
+
+    def isOk(self):
+        return self.done.is_set() and self.resultCode == 0
+
+    def getStatus(self):
+        if not self.done.is_set():
+            return "running"
+        if self.cancelled:
+            return "cancelled"
+        return "done" if self.resultCode == 0 else "failed"
+
+    def getElapsed(self):
+        return (self.finished or time.time()) - self.started
+
+class ProgressTracker():
+    """
+    Watches many IProgress objects at once
+    """
+    def __init__(self, interval=0.5, pollInterval=0.1, output=None, keepFinished=20):
+        """
+        @param interval: Interval of status rendering in seconds. Default value: 0.5
+        @param pollInterval: Longest time an operation waits before its state is read in seconds. Default value: 0.1
+        @param output: File object the status is rendered to. Default value: sys.stdout
+        @param keepFinished: Number of finished operations kept for listing. Default value: 20
+        """
+        self.interval = interval
+        self.pollInterval = pollInterval
+        self.output = output if output is not None else sys.stdout
+        self.keepFinished = keepFinished
+        self.lock = threading.Lock()
+        self.operations = [] # Running operations
+        self.finished = [] # Recently finished operations
+        self.lastId = 0
+        self.waiters = 0 # Number of threads waiting in wait method
+        self.rendered = 0 # Number of lines rendered last time
+        self.thread = None
+
+    def track(self, progress, label, callback=None, mgr=None):
+        """
+        Start tracking an IProgress object
+        @param progress: IProgress object (from VirtualBox API)
+        @param label: Description of the operation shown in status
+        @param callback: Callable called with Operation object when the operation ends,
+                         it is called by the tracker thread. Default value: None
+        @param mgr: VirtualBox manager of the progress, the tracker thread is initialized
+                    for it. Default value: None
+        @return: Operation object
+        """
+        with self.lock:
+            self.lastId += 1
+            op = Operation(self.lastId, progress, label, mgr)
+            if callback is not None:
+                op.callbacks.append(callback)
+            self.operations.append(op)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.poll)
+                self.thread.daemon = True
+                self.thread.start()
+        return op
+
+    def wait(self, op, timeout=None):
+        """
+        Wait until the tracker thread finishes the operation. Status of all
+        running operations is rendered meanwhile.
+        @param op: Operation to wait for
+        @param timeout: Maximum time to wait in seconds. Default value: None
+        @return: True if the operation ended, False on timeout
+        """
+        with self.lock:
+            self.waiters += 1
+        try:
+            return op.wait(timeout)
+        finally:
+            with self.lock:
+                self.waiters -= 1
+                if not self.waiters:
+                    self.rendered = 0 # Next status starts on a new line
+
+    def getOperation(self, opid):
+        with self.lock:
+            for op in self.operations + self.finished:
+                if op.id == opid:
+                    return op
+        return None
+
+    def getOperations(self):
+        """ Return running and recently finished operations """
+        with self.lock:
+            return list(self.finished) + list(self.operations)
+
+    def cancel(self, opid):
+        """
+        Cancel running operation
+        @param opid: Identifier of operation
+        @return: True if cancel request was passed, False otherwise
+        """
+        op = self.getOperation(opid)
+        if op is None:
+            return False
+        return op.cancel()
+
+    def drop(self, op):
+        """
+        Stop watching operation which is not expected to end, e.g. when its
+        cancel does not finish. The operation is listed as finished.
+        """
+        with self.lock:
+            if op.done.is_set():
+                return
+            op.error = "Operation is not watched anymore"
+            op.finish()
+            if op in self.operations:
+                self.operations.remove(op)
+            self.finished.append(op)
+            self.finished = self.finished[-self.keepFinished:]
+
+    def poll(self):
+        """
+        Body of the tracker thread. It waits shortly for the oldest operation,
+        then reads the state of all of them, so completion is noticed without
+        a full render interval. The thread ends when no operation is running.
+        """
+        initialized = [] # Managers the thread was initialized for
+        lastRender = 0
+        try:
+            while True:
+                with self.lock:
+                    if not len(self.operations):
+                        self.thread = None
+                        return
+                    operations = list(self.operations)
+                    render = self.waiters > 0
+                for op in operations:
+                    if op.mgr is not None and op.mgr not in initialized:
+                        if hasattr(op.mgr, 'initPerThread'):
+                            op.mgr.initPerThread()
+                        initialized.append(op.mgr)
+                try:
+                    operations[0].progress.waitForCompletion(max(1, int(self.pollInterval * 1000)))
+                except Exception:
+                    pass # Failure is read by update
+                for op in operations:
+                    self.update(op)
+                if render and time.time() - lastRender >= self.interval:
+                    self.render(operations)
+                    lastRender = time.time()
+        finally:
+            for mgr in initialized:
+                if hasattr(mgr, 'deinitPerThread'):
+                    mgr.deinitPerThread()
+
+    def update(self, op):
+        """ Read the state of operation and finish it if completed, called by tracker thread """
+        try:
+            if not op.progress.completed:
+                op.percent = int(op.progress.percent)
+                return
+            op.percent = 100
+            op.resultCode = int(op.progress.resultCode)
+            if op.resultCode != 0:
+                op.error = str(op.progress.errorInfo.text)
+        except Exception as e: # Object reference is lost, operation cannot be watched anymore
+            op.resultCode = -1
+            op.error = str(e)
+        with self.lock:
+            if op.done.is_set(): # Dropped meanwhile
+                return
+            callbacks = op.finish()
+            if op in self.operations:
+                self.operations.remove(op)
+            self.finished.append(op)
+            self.finished = self.finished[-self.keepFinished:]
+        for callback in callbacks:
+            try:
+                callback(op)
+            except Exception:
+                pass
+
+    def render(self, operations):
+        """ Print combined status of operations, one line per operation """
+        lines = []
+        for op in operations:
+            bar = "[" + op.percent/2 * "=" + ">" + (50 - op.percent/2) * " " + "]"
+            lines.append("%3d %-30s %s %3d%% %s"%(op.id, op.label[:30], bar, op.percent, op.getStatus()))
+        if not self.output.isatty():
+            return # Do not flood logs with status lines
+        text = ""
+        if self.rendered:
+            text += "\x1b[%dA"%self.rendered # Move cursor to the beginning of previous status
+        for line in lines:
+            text += "\x1b[K" + line + "\n"
+        text += (self.rendered - len(lines)) * "\x1b[K\n" # Clear lines of finished operations
+        self.output.write(text)
+        self.output.flush()
+        self.rendered = max(self.rendered, len(lines))
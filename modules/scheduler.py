@@ -0,0 +1,245 @@
+"""
+File: scheduler.py
+Author: agent
+Date: 2026-10-17
+Brief: Scheduler of batch steps. Foreground steps run one after another in
+       order of the batch file, background steps run in parallel with them
+       as soon as their dependencies end. Only 'wait' waits for background steps.
+"""
+
+import threading
+import time
+
+class Step():
+    """
+    A single command of batch file
+    """
+    def __init__(self, index, args, line=0, name=None, background=False):
+        """
+        @param index: Position of the step in batch
+        @param args: Command with arguments, empty list for 'wait' barrier
+        @param line: Line of batch file. Default value: 0
+        @param name: Name used in 'after=' of other steps. Default value: None
+        @param background: Run in parallel with other steps. Default value: False
+        """
+        self.index = index
+        self.args = args
+        self.line = line
+        self.name = name
+        self.background = background
+        self.after = [] # Explicit dependencies, step is skipped if any of them fails
+        self.order = [] # Implicit dependencies given by position in batch
+        self.launched = [] # Background steps which must be started before this step, they take the active host
+        self.host = None
+        self.status = "PENDING"
+        self.estimate = None # Expected duration in seconds
+        self.error = None
+        self.retval = 0
+        self.started = None
+        self.finished = None
+
+    def isBarrier(self):
+        return not len(self.args)
+
+    def isDone(self):
+        return self.status in ["OK", "FAILED", "SKIPPED"]
+
+    def getDuration(self):
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+    def getLabel(self):
+        if self.isBarrier():
+            return "wait (line %d)"%self.line
+        label = " ".join(self.args)
+        if self.name:
+            label = "@" + self.name + " " + label
+        return label
+
+class BatchScheduler():
+    """
+    Executes steps with respect to their dependencies and concurrency limits
+    """
+    def __init__(self, execute, getHost, maxWorkers=16, hostLimit=4):
+        """
+        @param execute: Callable executing a step in current thread, returns command return value
+        @param getHost: Callable returning name of host the step will be executed on
+        @param maxWorkers: Maximum number of steps running at the same time. Default value: 16
+        @param hostLimit: Maximum number of steps running on one host. Default value: 4
+        """
+        self.execute = execute
+        self.getHost = getHost
+        self.maxWorkers = max(1, maxWorkers)
+        self.hostLimit = max(1, hostLimit)
+        self.steps = []
+        self.names = {}
+        self.barrier = None # Last 'wait'
+        self.sinceBarrier = [] # Steps added after the last 'wait'
+        self.foreground = None # Last foreground step after the last 'wait'
+        self.launching = [] # Background steps added after the last foreground step
+        self.condition = threading.Condition()
+        self.running = {} # Host -> number of running steps
+        self.stopped = False
+        self.wallTime = 0.0
+
+    def add(self, step):
+        """
+        Add step to the plan. Every step runs after the previous foreground
+        step, foreground steps do not wait for background ones, they only
+        wait until background steps before them are started. 'wait' runs
+        after all steps since the previous 'wait'.
+        """
+        if step.name is not None:
+            self.names[step.name] = step
+        if step.isBarrier():
+            step.order.extend(self.sinceBarrier)
+            if self.barrier is not None:
+                step.order.append(self.barrier)
+            self.barrier = step
+            self.sinceBarrier = []
+            self.foreground = None
+            self.launching = []
+        else:
+            previous = self.foreground or self.barrier
+            if previous is not None:
+                step.order.append(previous)
+            if step.background:
+                self.launching.append(step)
+            else:
+                # Background steps before take the host active before this step
+                step.launched = self.launching
+                self.launching = []
+                self.foreground = step
+            self.sinceBarrier.append(step)
+        self.steps.append(step)
+
+    def addDependency(self, step, name):
+        """
+        Make step dependent on step with given name
+        @return: True if the name is known, False otherwise
+        """
+        dependency = self.names.get(name)
+        if dependency is None or dependency is step:
+            return False
+        step.after.append(dependency)
+        return True
+
+    def isReady(self, step):
+        return (all(dep.isDone() for dep in step.after + step.order) and
+                all(dep.status != "PENDING" for dep in step.launched))
+
+    def run(self):
+        """
+        Execute all steps
+        @return: False if the batch was stopped by a step, True otherwise
+        """
+        started = time.time()
+        pending = list(self.steps)
+        try:
+            while len(pending) and not self.stopped:
+                with self.condition:
+                    ready = [step for step in pending if self.isReady(step)]
+                    dispatched = []
+                    for step in ready:
+                        if any(dep.status != "OK" for dep in step.after):
+                            step.status = "SKIPPED"
+                            step.error = "Dependency failed"
+                            dispatched.append(step)
+                        elif step.isBarrier():
+                            step.status = "OK"
+                            dispatched.append(step)
+                        elif not step.background:
+                            dispatched.append(step)
+                            break # Foreground step is executed in this thread
+                        elif self.canStart(step):
+                            self.start(step)
+                            dispatched.append(step)
+                    for step in dispatched:
+                        pending.remove(step)
+                    if not len(dispatched):
+                        self.condition.wait(0.2)
+                        continue
+                for step in dispatched:
+                    if step.status == "PENDING": # Foreground step
+                        self.runStep(step)
+        finally:
+            with self.condition: # Let running steps end
+                while sum(self.running.values()):
+                    self.condition.wait(0.2)
+                for step in pending: # Batch was stopped before them
+                    if step.status == "PENDING":
+                        step.status = "NOT RUN"
+            self.wallTime = time.time() - started
+        return not self.stopped
+
+    def canStart(self, step):
+        """ Check concurrency limits. Condition must be held. """
+        step.host = self.getHost()
+        if sum(self.running.values()) >= self.maxWorkers:
+            return False
+        return self.running.get(step.host, 0) < self.hostLimit
+
+    def start(self, step):
+        """ Run background step in a new thread. Condition must be held. """
+        self.running[step.host] = self.running.get(step.host, 0) + 1
+        step.status = "RUNNING"
+        thread = threading.Thread(target=self.runBackground, args=(step,))
+        thread.daemon = True
+        thread.start()
+
+    def runBackground(self, step):
+        try:
+            self.runStep(step)
+        finally:
+            with self.condition:
+                self.running[step.host] -= 1
+                self.condition.notify_all()
+
+    def runStep(self, step):
+        if step.host is None:
+            step.host = self.getHost()
+        step.status = "RUNNING"
+        step.started = time.time()
+        try:
+            step.retval = self.execute(step)
+            status = "OK"
+            if step.retval: # Command asked to stop the batch (exit, quit)
+                self.stopped = True
+        except Exception as e:
+            status = "FAILED"
+            step.error = str(e)
+        step.finished = time.time()
+        with self.condition:
+            step.status = status # Dependent steps may start now
+            self.condition.notify_all()
+
+    def getCriticalPath(self, duration=None):
+        """
+        Find the longest chain of dependent steps
+        @param duration: Callable returning duration of step. If None, measured
+                         durations are used. Default value: None
+        @return: Tuple (list of steps, duration of the chain in seconds)
+        """
+        if duration is None:
+            duration = Step.getDuration
+        longest = {} # Step -> (duration of longest chain ending with step, previous step)
+        for step in self.steps: # Dependencies are always before the step
+            best = (0.0, None)
+            for dep in step.after + step.order:
+                if longest[dep][0] > best[0]:
+                    best = (longest[dep][0], dep)
+            longest[step] = (best[0] + duration(step), best[1])
+        if not len(self.steps):
+            return [], 0.0
+        last = max(self.steps, key=lambda step: longest[step][0])
+        total = longest[last][0]
+        path = []
+        while last is not None:
+            path.insert(0, last)
+            last = longest[last][1]
+        return [step for step in path if not step.isBarrier()], total
+
+    def getSerialTime(self):
+        """ Sum of durations of all steps, i.e. time of serial execution """
+        return sum(step.getDuration() for step in self.steps)
@@ -0,0 +1,291 @@
+"""
+File: sessions.py
+Author: agent
+Date: 2026-10-17
+Brief: Management of machine sessions. Locks are handed out as context
+       managers, so they are always released. Shared sessions are reused
+       by consecutive console operations and released when idle. Guest
+       sessions are pooled in shared sessions of their machines.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+class SharedSession():
+    """
+    Session holding shared lock of a single machine
+    """
+    def __init__(self, machine, session, machid):
+        self.machine = machine
+        self.session = session
+        self.machid = machid
+        self.users = 0 # Number of threads using the session now
+        self.lastUsed = time.time()
+        self.guests = {} # (user, password) -> list of idle guest sessions
+        self.detached = False # Removed from manager while in use, the last user unlocks it
+
+class SessionManager():
+    """
+    Hands out session locks of machines of a single host
+    """
+    def __init__(self, env, idleTimeout=30):
+        """
+        @param env: Environment whose machines are locked
+        @param idleTimeout: Number of seconds after which unused shared session
+                            is released. Default value: 30
+        """
+        self.env = env
+        self.idleTimeout = idleTimeout
+        self.lock = threading.Lock()
+        self.sessions = {} # Machine UUID -> SharedSession
+        self.ids = {} # Machine name or UUID -> machine UUID, known for machines with open session
+        self.reaper = None
+        self.locks = 0 # Number of lockMachine calls
+        self.reuses = 0 # Number of shared locks served by an open session
+        self.guestLogons = 0 # Number of created guest sessions
+        self.guestReuses = 0 # Number of guest sessions served from pool
+
+    def register(self, eventWatcher):
+        """ Release shared session when its machine stops running """
+        eventWatcher.addHandler(self.env.const.VBoxEventType_OnMachineStateChanged,
+                                'IMachineStateChangedEvent', self.onStateChanged)
+
+    def onStateChanged(self, event):
+        const = self.env.const
+        if const.MachineState_FirstOnline <= int(event.state) <= const.MachineState_LastOnline:
+            return
+        machid = str(event.machineId)
+        with self.lock:
+            entry = self.sessions.get(machid)
+            if entry is None or entry.users:
+                return
+            self.remove(machid)
+        self.unlock(entry)
+
+    @contextmanager
+    def shared(self, machname):
+        """
+        Shared lock of machine, yields (machine, session) tuple. Session
+        stays open after the block and it is reused by the next call.
+        @param machname: Machine name or UUID
+        """
+        entry = self.acquire(machname)
+        try:
+            yield entry.machine, entry.session
+        finally:
+            self.leave(entry)
+
+    @contextmanager
+    def write(self, machname):
+        """
+        Write lock of machine, yields (machine, session) tuple. Mutable
+        machine is available as session.machine. The lock is released after the block.
+        @param machname: Machine name or UUID
+        """
+        self.release(machname) # Our own shared lock would block the write lock, sessions in use are unlocked by their users
+        session = self.env.mgr.getSessionObject(self.env.vbox)
+        def lock(machine):
+            machine.lockMachine(session, self.env.const.LockType_Write)
+            return machine
+        machine = self.env.withMachine(machname, lock)
+        self.locks += 1
+        try:
+            yield machine, session
+        finally:
+            session.unlockMachine()
+
+    @contextmanager
+    def launching(self, machname):
+        """
+        Unlocked session used to launch machine process, yields the session.
+        The session is unlocked after the block.
+        @param machname: Machine name or UUID
+        """
+        self.release(machname)
+        session = self.env.mgr.getSessionObject(self.env.vbox)
+        try:
+            yield session
+        finally:
+            try:
+                session.unlockMachine()
+            except Exception: # Launch failed, session was not locked
+                pass
+
+    @contextmanager
+    def guest(self, machname, user, password, timeout=10000):
+        """
+        Guest session of machine logged on with given credentials, yields
+        (machine, session, guestSession) tuple. The guest session is returned
+        to the pool after the block unless the block failed, it is closed
+        together with the shared session of machine.
+        @param machname: Machine name or UUID
+        @param timeout: Time in miliseconds to wait for a new guest session to start. Default value: 10000
+        """
+        entry = self.acquire(machname)
+        key = (user, password)
+        guestSession = None
+        failed = False
+        try:
+            guestSession = self.checkoutGuest(entry, key, timeout)
+            yield entry.machine, entry.session, guestSession
+        except:
+            failed = True
+            raise
+        finally:
+            with self.lock:
+                pooled = guestSession is not None and not failed and self.sessions.get(entry.machid) is entry
+                if pooled:
+                    entry.guests.setdefault(key, []).append(guestSession)
+            if guestSession is not None and not pooled:
+                self.closeGuest(guestSession)
+            self.leave(entry)
+
+    def checkoutGuest(self, entry, key, timeout):
+        """ Take healthy idle guest session from pool or log on a new one """
+        while True:
+            with self.lock:
+                idle = entry.guests.get(key)
+                guestSession = idle.pop() if idle else None
+            if guestSession is None:
+                break
+            if self.isGuestAlive(guestSession):
+                self.guestReuses += 1
+                return guestSession
+            self.closeGuest(guestSession)
+        guestSession = entry.session.console.guest.createSession(key[0], key[1], '', '')
+        self.guestLogons += 1
+        guestSession.waitFor(self.env.const.GuestSessionWaitForFlag_Start, timeout) # Wait for session to start
+        return guestSession
+
+    def isGuestAlive(self, guestSession):
+        """ Health check of pooled guest session, e.g. guest could be rebooted meanwhile """
+        try:
+            return guestSession.status == self.env.const.GuestSessionStatus_Started
+        except Exception: # Session object is not valid anymore
+            return False
+
+    def closeGuest(self, guestSession):
+        try:
+            guestSession.close()
+        except Exception: # Session was already closed by guest
+            pass
+
+    def acquire(self, machname):
+        """ Return open shared session of machine, open a new one if needed """
+        with self.lock:
+            entry = self.sessions.get(self.ids.get(machname))
+            if entry is not None:
+                entry.users += 1
+                self.reuses += 1
+                return entry
+        # The same machine named by name and by UUID shares one session
+        machine, machid = self.env.withMachine(machname, lambda machine: (machine, str(machine.id)))
+        with self.lock:
+            entry = self.sessions.get(machid)
+            if entry is not None:
+                self.ids[machname] = machid
+                entry.users += 1
+                self.reuses += 1
+                return entry
+        session = self.env.mgr.getSessionObject(self.env.vbox)
+        machine.lockMachine(session, self.env.const.LockType_Shared)
+        self.locks += 1
+        entry = SharedSession(machine, session, machid)
+        entry.users += 1
+        with self.lock:
+            other = self.sessions.get(machid)
+            if other is not None: # Another thread opened the session meanwhile
+                other.users += 1
+                entry.users -= 1
+            else:
+                self.sessions[machid] = entry
+            self.ids[machname] = machid
+            self.ids[machid] = machid
+            self.startReaper()
+        if other is not None:
+            self.unlock(entry)
+            return other
+        return entry
+
+    def leave(self, entry):
+        """ End use of shared session, detached session is unlocked by its last user """
+        with self.lock:
+            entry.users -= 1
+            entry.lastUsed = time.time()
+            last = entry.detached and not entry.users
+        if last:
+            self.unlock(entry)
+
+    def remove(self, machid):
+        """ Remove session and names of machine from manager. Lock must be held. """
+        for name in [name for name, value in self.ids.items() if value == machid]:
+            del self.ids[name]
+        return self.sessions.pop(machid, None)
+
+    def release(self, machname):
+        """
+        Unlock shared session of machine if any. Session used by another
+        thread is detached, it is unlocked when its last user leaves.
+        """
+        with self.lock:
+            entry = self.remove(self.ids.get(machname, machname))
+            if entry is not None and entry.users:
+                entry.detached = True
+                entry = None
+        if entry is not None:
+            self.unlock(entry)
+
+    def releaseAll(self):
+        """ Unlock all shared sessions, e.g. when their references are not valid anymore """
+        with self.lock:
+            entries = self.sessions.values()
+            self.sessions = {}
+            self.ids = {}
+        for entry in entries:
+            self.unlock(entry)
+
+    def releaseIdle(self):
+        """ Unlock shared sessions which were not used for idle timeout """
+        now = time.time()
+        with self.lock:
+            machids = [machid for machid, entry in self.sessions.items()
+                       if not entry.users and now - entry.lastUsed > self.idleTimeout]
+            entries = [self.remove(machid) for machid in machids]
+        for entry in entries:
+            self.unlock(entry)
+
+    def unlock(self, entry):
+        for guests in entry.guests.values():
+            for guestSession in guests:
+                self.closeGuest(guestSession)
+        entry.guests = {}
+        try:
+            entry.session.unlockMachine()
+        except Exception: # Session was already closed by server
+            pass
+
+    def startReaper(self):
+        """ Start the thread releasing idle sessions. Lock must be held. """
+        if self.reaper is not None and self.reaper.is_alive():
+            return
+        self.reaper = threading.Thread(target=self.reap)
+        self.reaper.daemon = True
+        self.reaper.start()
+
+    def reap(self):
+        """ Body of reaper thread, ends when there are no open sessions """
+        while True:
+            time.sleep(max(1, self.idleTimeout / 2.0))
+            self.releaseIdle()
+            with self.lock:
+                if not len(self.sessions):
+                    self.reaper = None
+                    return
+
+    def getOpenCount(self):
+        return len(self.sessions)
+
+    def getIdleGuestCount(self):
+        with self.lock:
+            return sum(len(guests) for entry in self.sessions.values() for guests in entry.guests.values())
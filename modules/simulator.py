@@ -0,0 +1,1210 @@
+"""
+File: simulator.py
+Author: agent
+Date: 2026-10-17
+Brief: In-process stand-in of VirtualBox API. It implements the part of the
+       API used by the manager (machines, sessions, console, progress,
+       guest sessions, appliances and events) with configurable latency of
+       every call, injected failures and size of the machine fleet, so the
+       manager can be run and measured without VirtualBox installed.
+"""
+
+import copy
+import hashlib
+import os
+import random
+import threading
+import time
+import uuid
+from Queue import Queue, Empty
+
+class SimulatedError(Exception):
+    """
+    Raises when a simulated call fails
+    """
+    def __init__(self, message=""):
+        super(Exception, self).__init__(message)
+
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+class Constants():
+    """
+    Constants of VirtualBox API with the same values as VirtualBox 5.0
+    """
+    ENUMS = {
+        'MachineState': [('Null', 0), ('PoweredOff', 1), ('Saved', 2), ('Teleported', 3), ('Aborted', 4),
+                         ('Running', 5), ('Paused', 6), ('Stuck', 7), ('Teleporting', 8), ('LiveSnapshotting', 9),
+                         ('Starting', 10), ('Stopping', 11), ('Saving', 12), ('Restoring', 13),
+                         ('TeleportingPausedVM', 14), ('TeleportingIn', 15), ('FaultTolerantSyncing', 16),
+                         ('DeletingSnapshotOnline', 17), ('DeletingSnapshotPaused', 18), ('RestoringSnapshot', 19),
+                         ('DeletingSnapshot', 20), ('SettingUp', 21)],
+        'SessionState': [('Null', 0), ('Unlocked', 1), ('Locked', 2), ('Spawning', 3), ('Unlocking', 4)],
+        'LockType': [('Null', 0), ('Shared', 1), ('Write', 2), ('VM', 3)],
+        'VBoxEventType': [('Invalid', 0), ('Any', 1), ('OnMachineStateChanged', 32), ('OnMachineDataChanged', 33),
+                          ('OnMachineRegistered', 35), ('OnSessionStateChanged', 36)],
+        'CleanupMode': [('UnregisterOnly', 1), ('DetachAllReturnNone', 2), ('DetachAllReturnHardDisksOnly', 3), ('Full', 4)],
+        'AccessMode': [('ReadOnly', 1), ('ReadWrite', 2)],
+        'DeviceType': [('Null', 0), ('Floppy', 1), ('DVD', 2), ('HardDisk', 3), ('Network', 4), ('USB', 5), ('SharedFolder', 6)],
+        'MediumVariant': [('Standard', 0), ('VmdkSplit2G', 1), ('VmdkRawDisk', 2), ('VmdkStreamOptimized', 4), ('Fixed', 65536)],
+        'StorageBus': [('Null', 0), ('IDE', 1), ('SATA', 2), ('SCSI', 3), ('Floppy', 4), ('SAS', 5)],
+        'PathStyle': [('DOS', 1), ('UNIX', 2), ('Unknown', 50)],
+        'ProcessStatus': [('Undefined', 0), ('Starting', 10), ('Started', 100), ('Paused', 110), ('Terminating', 480),
+                          ('TerminatedNormally', 500), ('TerminatedSignal', 510), ('TerminatedAbnormally', 520),
+                          ('TimedOutKilled', 530), ('TimedOutAbnormally', 540), ('Down', 600), ('Error', 800)],
+        'ProcessWaitForFlag': [('None', 0), ('Start', 1), ('Terminate', 2), ('StdIn', 4), ('StdOut', 8), ('StdErr', 16)],
+        'FsObjType': [('Unknown', 1), ('Fifo', 2), ('DevChar', 3), ('Directory', 4), ('DevBlock', 5), ('File', 6),
+                      ('Symlink', 7), ('Socket', 8), ('WhiteOut', 9)],
+        'FileAccessMode': [('ReadOnly', 1), ('WriteOnly', 2), ('ReadWrite', 3), ('AppendOnly', 4), ('AppendRead', 5)],
+        'FileOpenAction': [('OpenExisting', 1), ('OpenOrCreate', 2), ('CreateNew', 3), ('CreateOrReplace', 4),
+                           ('OpenExistingTruncated', 5), ('AppendOrCreate', 6)],
+        'DirectoryCreateFlag': [('None', 0), ('Parents', 1)],
+        'ProcessInputFlag': [('None', 0), ('EndOfFile', 1)],
+        'CloneMode': [('MachineState', 1), ('MachineAndChildStates', 2), ('AllStates', 3)],
+        'CloneOptions': [('Link', 1), ('KeepAllMACs', 2), ('KeepNATMACs', 3), ('KeepDiskNames', 4)],
+        'ProcessWaitResult': [('None', 0), ('Start', 1), ('Terminate', 2), ('Status', 3), ('Error', 4), ('Timeout', 5),
+                              ('StdIn', 6), ('StdOut', 7), ('StdErr', 8), ('WaitFlagNotSupported', 9)],
+        'GuestSessionWaitForFlag': [('None', 0), ('Start', 1), ('Terminate', 2), ('Status', 4)],
+        'GuestSessionStatus': [('Undefined', 0), ('Starting', 10), ('Started', 100), ('Terminating', 480), ('Terminated', 500),
+                               ('TimedOutKilled', 512), ('TimedOutAbnormally', 513), ('Down', 600), ('Error', 800)],
+        'GuestSessionWaitResult': [('None', 0), ('Start', 1), ('Terminate', 2), ('Status', 3), ('Error', 4), ('Timeout', 5)],
+        }
+    ALIASES = {'MachineState_FirstOnline': 5, 'MachineState_LastOnline': 18,
+               'MachineState_FirstTransient': 8, 'MachineState_LastTransient': 21}
+
+    def __init__(self):
+        for enum, values in self.ENUMS.items():
+            for name, value in values:
+                setattr(self, enum + "_" + name, value)
+        for name, value in self.ALIASES.items():
+            setattr(self, name, value)
+
+    def all_values(self, enum):
+        """ Return name -> value dictionary of enumeration """
+        return dict(self.ENUMS[enum])
+
+C = Constants()
+
+def remote(name):
+    """ Attribute read from the server, every access costs a call """
+    def getter(self):
+        self.backend.call()
+        if getattr(self, 'released', False):
+            raise SimulatedError("The object is not ready")
+        return getattr(self, '_' + name)
+    return property(getter)
+
+class Backend():
+    """
+    Shared state of a simulated server: latency, failures and locking
+    """
+    def __init__(self, latency=0.0, failureRate=0.0, operationTime=0.5, seed=None):
+        """
+        @param latency: Duration of every call in seconds. Default value: 0.0
+        @param failureRate: Probability that a call fails, 0.0 - 1.0. Default value: 0.0
+        @param operationTime: Duration of long operations (start, export, ...) in seconds. Default value: 0.5
+        @param seed: Seed of random generator. Default value: None
+        """
+        self.latency = latency
+        self.failureRate = failureRate
+        self.operationTime = operationTime
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.calls = 0
+        self.failures = 0
+        self.loggedOn = True # Calls fail with session fault after log off
+
+    def call(self, failing=True):
+        """
+        Account a single call to the server
+        @param failing: The call may fail. Default value: True
+        @raise SimulatedError: Injected failure or the client is logged off
+        """
+        with self.lock:
+            self.calls += 1
+            if not self.loggedOn:
+                raise SimulatedError("Invalid managed object reference, the client is not logged on")
+            fail = failing and self.failureRate > 0 and self.random.random() < self.failureRate
+            if fail:
+                self.failures += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if fail:
+            raise SimulatedError("Simulated failure of call to VirtualBox server")
+
+class ErrorInfo():
+    def __init__(self, text):
+        self.text = text
+
+class Progress():
+    """
+    IProgress of an operation lasting a given time
+    """
+    def __init__(self, backend, duration, onComplete=None, description="operation"):
+        """
+        @param duration: Duration of the operation in seconds
+        @param onComplete: Callable executed when the operation ends successfully,
+                           SimulatedError raised by it makes the operation fail
+        """
+        self.backend = backend
+        self.description = description
+        self.duration = duration
+        self.onComplete = onComplete
+        self.started = time.time()
+        self.canceled = False
+        self.cancelable = True
+        self.lock = threading.Lock()
+        self.finished = False
+        self._resultCode = 0
+        self._errorText = ""
+        # A part of operations fails as other calls do
+        if backend.failureRate > 0 and backend.random.random() < backend.failureRate:
+            self._resultCode = -2135228412 # VBOX_E_IPRT_ERROR
+            self._errorText = "Simulated failure of %s"%description
+
+    def update(self):
+        """ End the operation if its time passed """
+        with self.lock:
+            if self.finished or (not self.canceled and time.time() - self.started < self.duration):
+                return self.finished
+            self.finished = True
+            if self.canceled:
+                self._resultCode = -2147467260 # E_ABORT
+                self._errorText = "Operation was canceled"
+            elif self._resultCode == 0 and self.onComplete is not None:
+                try:
+                    self.onComplete()
+                except SimulatedError as e:
+                    self._resultCode = -2135228412
+                    self._errorText = str(e)
+            return True
+
+    @property
+    def completed(self):
+        self.backend.call(False)
+        return self.update()
+
+    @property
+    def percent(self):
+        self.backend.call(False)
+        if self.update():
+            return 100
+        if self.duration <= 0:
+            return 0
+        return min(99, int(100 * (time.time() - self.started) / self.duration))
+
+    @property
+    def resultCode(self):
+        self.backend.call(False)
+        return self._resultCode
+
+    @property
+    def errorInfo(self):
+        return ErrorInfo(self._errorText) if self._errorText else None
+
+    def cancel(self):
+        self.backend.call()
+        self.canceled = True
+
+    def waitForCompletion(self, timeout):
+        """ @param timeout: Time in miliseconds, -1 waits forever """
+        end = None if timeout < 0 else time.time() + timeout / 1000.0
+        while not self.update():
+            if end is not None and time.time() >= end:
+                return
+            time.sleep(0.01)
+
+class Event():
+    """
+    Event delivered through event source. It implements all queried interfaces.
+    """
+    def __init__(self, type, machineId, state=None, registered=None):
+        self.type = type
+        self.machineId = machineId
+        self.state = state
+        self.registered = registered
+
+class Listener():
+    def __init__(self):
+        self.queue = Queue()
+        self.types = []
+        self.registered = False
+
+class EventSource():
+    """
+    Passive event source, events are fetched by getEvent
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.listeners = []
+
+    def createListener(self):
+        self.backend.call()
+        return Listener()
+
+    def registerListener(self, listener, types, active):
+        self.backend.call()
+        listener.types = [int(type) for type in types]
+        listener.registered = True
+        with self.lock:
+            self.listeners.append(listener)
+
+    def unregisterListener(self, listener):
+        listener.registered = False
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def getEvent(self, listener, timeout):
+        """ @param timeout: Time in miliseconds to wait for event """
+        if not listener.registered:
+            raise SimulatedError("Listener is not registered")
+        try:
+            return listener.queue.get(True, max(0, timeout) / 1000.0)
+        except Empty:
+            return None
+
+    def eventProcessed(self, listener, event):
+        pass
+
+    def fire(self, event):
+        """ Deliver event to all interested listeners """
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            if event.type in listener.types or C.VBoxEventType_Any in listener.types:
+                listener.queue.put(event)
+
+class Host():
+    def __init__(self, backend, cpus):
+        self.backend = backend
+        self._nameServers = ['10.0.0.1', '10.0.0.2']
+        self._processorCoreCount = cpus
+        self._processorCount = cpus * 2
+        self._operatingSystem = "Linux (simulated)"
+        self._OSVersion = "4.4.0"
+        self._memorySize = 65536
+
+    nameServers = remote('nameServers')
+    processorCoreCount = remote('processorCoreCount')
+    processorCount = remote('processorCount')
+    operatingSystem = remote('operatingSystem')
+    OSVersion = remote('OSVersion')
+    memorySize = remote('memorySize')
+
+    def getProcessorDescription(self, cpuId):
+        self.backend.call()
+        return "Simulated CPU @ 2.40GHz"
+
+class Medium():
+    def __init__(self, backend, location, deviceType):
+        self.backend = backend
+        self.location = location
+        self.deviceType = deviceType
+        self.id = str(uuid.uuid4())
+        self.size = 0
+        self.parent = None # Base medium of differencing disk
+
+    def createBaseStorage(self, size, variant):
+        self.backend.call()
+        def create():
+            self.size = size
+        return Progress(self.backend, self.backend.operationTime, create, "creating storage")
+
+class Attachment():
+    def __init__(self, controller, port, device, type, medium):
+        self.controller = controller
+        self.port = port
+        self.device = device
+        self.type = type
+        self.medium = medium
+
+class Snapshot():
+    """
+    ISnapshot, its machine is a frozen copy of the machine when the snapshot was taken
+    """
+    def __init__(self, machine, name, description, parent):
+        self.backend = machine.backend
+        self._id = str(uuid.uuid4())
+        self._name = name
+        self._description = description
+        self._parent = parent
+        self._children = []
+        self._timeStamp = int(time.time() * 1000)
+        self._machine = machine.freeze()
+
+    id = remote('id')
+    name = remote('name')
+    description = remote('description')
+    parent = remote('parent')
+    children = remote('children')
+    timeStamp = remote('timeStamp')
+    machine = remote('machine')
+
+    def walk(self):
+        """ Yield this snapshot and all its descendants """
+        yield self
+        for child in self._children:
+            for snapshot in child.walk():
+                yield snapshot
+
+class Machine():
+    """
+    IMachine. Mutable machine of write-locked session shares the data with
+    the registered machine.
+    """
+    def __init__(self, vbox, name, osType, memorySize=1024, cpuCount=1, state=None):
+        self.backend = vbox.backend
+        self.vbox = vbox
+        self._name = name
+        self._id = str(uuid.uuid4())
+        self._OSTypeId = osType
+        self._state = state if state is not None else C.MachineState_PoweredOff
+        self.boots = 0
+        self._sessionState = C.SessionState_Unlocked
+        self._memorySize = memorySize
+        self._CPUCount = cpuCount
+        self.attachments = []
+        self.controllers = []
+        self.sessions = [] # Sessions holding a lock of this machine
+        self.writeSession = None
+        self.registered = False
+        self.files = {} # Guest file system, path -> data
+        self.directories = set() # Created guest directories, other directories exist implicitly by their files
+        self.mtimes = {} # Path -> modification time of files written through file handles
+        self.snapshots = None # Root snapshot
+        self._currentSnapshot = None
+        self.frozen = False # Machine of snapshot
+        self.released = False # Handle is stale, e.g. the server released the object
+
+    name = remote('name')
+    id = remote('id')
+    OSTypeId = remote('OSTypeId')
+    state = remote('state')
+    sessionState = remote('sessionState')
+    memorySize = remote('memorySize')
+    CPUCount = remote('CPUCount')
+    currentSnapshot = remote('currentSnapshot')
+
+    @property
+    def snapshotCount(self):
+        self.call()
+        return len(list(self.snapshots.walk())) if self.snapshots else 0
+
+    def findSnapshot(self, nameOrId):
+        """ Empty name finds the root snapshot """
+        self.call()
+        for snapshot in self.snapshots.walk() if self.snapshots else []:
+            if not nameOrId or nameOrId in [snapshot._name, snapshot._id]:
+                return snapshot
+        raise SimulatedError("Could not find a snapshot named '%s'"%nameOrId)
+
+    def freeze(self):
+        """ Copy of settings, disks and guest files for a snapshot """
+        machine = Machine(self.vbox, self._name, self._OSTypeId, self._memorySize, self._CPUCount)
+        machine.attachments = list(self.attachments)
+        machine.controllers = list(self.controllers)
+        machine.files = dict(self.files)
+        machine.directories = set(self.directories)
+        machine.mtimes = dict(self.mtimes)
+        machine.frozen = True
+        return machine
+
+    def addSnapshot(self, name, description):
+        """ Called by console when the snapshot is taken """
+        with self.backend.lock:
+            snapshot = Snapshot(self, name, description, self._currentSnapshot)
+            if self._currentSnapshot is None:
+                self.snapshots = snapshot
+            else:
+                self._currentSnapshot._children.append(snapshot)
+            self._currentSnapshot = snapshot
+        # Disks of snapshot are read only, machine writes to differencing disks
+        attachments = []
+        for attachment in self.attachments:
+            medium = attachment.medium
+            if medium is not None and attachment.type == C.DeviceType_HardDisk:
+                medium = Medium(self.backend, attachment.medium.location + "." + snapshot._id, C.DeviceType_HardDisk)
+                medium.parent = attachment.medium
+            attachments.append(Attachment(attachment.controller, attachment.port, attachment.device, attachment.type, medium))
+        self.attachments = attachments
+        return snapshot
+
+    def cloneTo(self, target, mode, options):
+        self.call()
+        link = C.CloneOptions_Link in options
+        if link and not self.frozen:
+            raise SimulatedError("Linked clone can only be created from a snapshot")
+        attachments = list(self.attachments)
+        def cloned():
+            target._OSTypeId = self._OSTypeId
+            target._memorySize = self._memorySize
+            target._CPUCount = self._CPUCount
+            target.controllers = list(self.controllers)
+            target.files = dict(self.files)
+            target.directories = set(self.directories)
+            target.mtimes = dict(self.mtimes)
+            for attachment in attachments:
+                medium = attachment.medium
+                if medium is not None and attachment.type == C.DeviceType_HardDisk:
+                    medium = Medium(self.backend, "%s/%s.vdi"%(target._name, target._name), C.DeviceType_HardDisk)
+                    if link: # Differencing disk holds only changes of the clone
+                        medium.parent = attachment.medium
+                    else:
+                        medium.size = attachment.medium.size
+                target.attachments.append(Attachment(attachment.controller, attachment.port, attachment.device,
+                                                     attachment.type, medium))
+        # Linked clone only creates empty differencing disks
+        return Progress(self.backend, self.backend.operationTime / 10 if link else self.backend.operationTime,
+                        cloned, "cloning " + self._name)
+
+    @property
+    def mediumAttachments(self):
+        self.call()
+        return list(self.attachments)
+
+    def call(self):
+        self.backend.call()
+        if self.released:
+            raise SimulatedError("The object is not ready")
+
+    def release(self):
+        """
+        Make this handle stale, the machine is available through a new handle.
+        Machine must not be locked by a session.
+        @return: New Machine object
+        """
+        with self.backend.lock:
+            handle = copy.copy(self)
+            self.released = True
+            self.vbox.registered[self.vbox.registered.index(self)] = handle
+            self.vbox.byName[self._name] = self.vbox.byId[self._id] = handle
+        return handle
+
+    def isOnline(self):
+        return C.MachineState_FirstOnline <= self._state <= C.MachineState_LastOnline
+
+    def setState(self, state):
+        if not self.isOnline():
+            self.boots += 1 # Guest sessions of previous run are gone
+        self._state = state
+        self.vbox.eventSource.fire(Event(C.VBoxEventType_OnMachineStateChanged, self._id, state))
+
+    def setSessionState(self, state):
+        self._sessionState = state
+        self.vbox.eventSource.fire(Event(C.VBoxEventType_OnSessionStateChanged, self._id, state))
+
+    def lockMachine(self, session, lockType):
+        self.call()
+        with self.backend.lock:
+            if session.machine is not None:
+                raise SimulatedError("The given session is busy")
+            if not self.registered:
+                raise SimulatedError("Machine '%s' is not registered"%self._name)
+            if lockType == C.LockType_Write:
+                if self.writeSession is not None or self.isOnline():
+                    raise SimulatedError("The machine '%s' is already locked for a session (or being unlocked)"%self._name)
+                self.writeSession = session
+                self.setSessionState(C.SessionState_Locked)
+            elif lockType == C.LockType_Shared:
+                if not self.isOnline():
+                    raise SimulatedError("The machine '%s' is not locked by a session"%self._name)
+            else:
+                raise SimulatedError("Invalid lock type %d"%lockType)
+            self.sessions.append(session)
+            session.lock(self, lockType)
+
+    def unlock(self, session):
+        """ Called by session when it is unlocked """
+        with self.backend.lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+            if self.writeSession is session:
+                self.writeSession = None
+                if not self.isOnline():
+                    self.setSessionState(C.SessionState_Unlocked)
+
+    def launchVMProcess(self, session, type, environment):
+        self.call()
+        with self.backend.lock:
+            if self.isOnline() or self.writeSession is not None:
+                raise SimulatedError("The machine '%s' is already locked by a session (or being locked or unlocked)"%self._name)
+            if not self.registered:
+                raise SimulatedError("Machine '%s' is not registered"%self._name)
+            self.sessions.append(session)
+            session.lock(self, C.LockType_Write)
+            self.setSessionState(C.SessionState_Spawning)
+        def started():
+            self.setState(C.MachineState_Running)
+            self.setSessionState(C.SessionState_Locked)
+        return Progress(self.backend, self.backend.operationTime, started, "starting " + self._name)
+
+    def unregister(self, cleanupMode):
+        self.call()
+        with self.backend.lock:
+            if self.isOnline() or self.writeSession is not None:
+                raise SimulatedError("Cannot unregister the machine '%s' while it is locked"%self._name)
+            self.vbox.unregister(self)
+        media = [attachment.medium for attachment in self.attachments if attachment.medium is not None]
+        if cleanupMode != C.CleanupMode_UnregisterOnly:
+            self.attachments = []
+        return media
+
+    def deleteConfig(self, media):
+        self.call()
+        return Progress(self.backend, self.backend.operationTime / 5, None, "deleting " + self._name)
+
+    def exportTo(self, appliance, location):
+        self.call()
+        appliance.machines.append(self)
+        return VirtualSystemDescription(self)
+
+    def addStorageController(self, name, bus):
+        self.call()
+        self.controllers.append((name, bus))
+        return name
+
+    def saveSettings(self):
+        self.call()
+
+    def setMemorySize(self, size):
+        self.call()
+        self._memorySize = int(size)
+
+    def setCPUCount(self, count):
+        self.call()
+        self._CPUCount = int(count)
+
+    def attachDevice(self, controller, port, device, type, medium):
+        self.call()
+        self.attachments.append(Attachment(controller, port, device, type, medium))
+
+    def detachDevice(self, controller, port, device):
+        self.call()
+        self.attachments = [a for a in self.attachments
+                            if (a.controller, a.port, a.device) != (controller, port, device)]
+
+class Session():
+    """
+    ISession, holds a lock of a single machine
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.machine = None
+        self.lockType = None
+        self.console = None
+
+    def lock(self, machine, lockType):
+        self.machine = machine
+        self.lockType = lockType
+        self.console = Console(machine)
+
+    def unlockMachine(self):
+        self.backend.call(False)
+        if self.machine is None:
+            raise SimulatedError("The session is not locked (session state: Unlocked)")
+        machine = self.machine
+        self.machine = None
+        self.console = None
+        machine.unlock(self)
+
+class Console():
+    """
+    IConsole of running machine
+    """
+    def __init__(self, machine):
+        self.machine = machine
+        self.backend = machine.backend
+        self.guest = Guest(machine)
+
+    def checkState(self, *states):
+        self.backend.call()
+        if self.machine._state not in states:
+            raise SimulatedError("Invalid machine state: %d"%self.machine._state)
+
+    def pause(self):
+        self.checkState(C.MachineState_Running)
+        self.machine.setState(C.MachineState_Paused)
+
+    def resume(self):
+        self.checkState(C.MachineState_Paused)
+        self.machine.setState(C.MachineState_Running)
+
+    def reset(self):
+        self.checkState(C.MachineState_Running)
+
+    def powerButton(self):
+        self.checkState(C.MachineState_Running)
+        self.powerDown()
+
+    def sleepButton(self):
+        self.checkState(C.MachineState_Running)
+
+    def powerDown(self):
+        self.checkState(C.MachineState_Running, C.MachineState_Paused, C.MachineState_Stuck)
+        machine = self.machine
+        def stopped():
+            with self.backend.lock:
+                machine.setState(C.MachineState_PoweredOff)
+                for session in list(machine.sessions): # Server closes all sessions of stopped machine
+                    session.machine = None
+                    session.console = None
+                machine.sessions = []
+                machine.writeSession = None
+                machine.setSessionState(C.SessionState_Unlocked)
+        return Progress(self.backend, self.backend.operationTime / 2, stopped, "powering off " + machine._name)
+
+    def takeSnapshot(self, name, description):
+        self.backend.call()
+        machine = self.machine
+        def taken():
+            machine.addSnapshot(name, description)
+        return Progress(self.backend, self.backend.operationTime, taken, "taking snapshot of " + machine._name)
+
+class Guest():
+    def __init__(self, machine):
+        self.machine = machine
+        self.backend = machine.backend
+
+    def createSession(self, user, password, domain, sessionName):
+        self.backend.call()
+        if not self.machine.isOnline():
+            raise SimulatedError("Machine '%s' is not running"%self.machine._name)
+        return GuestSession(self.machine, user)
+
+class GuestSession():
+    """
+    IGuestSession, guest programs are simulated by echoing their arguments.
+    Logon to guest takes operation time.
+    """
+    def __init__(self, machine, user):
+        self.machine = machine
+        self.backend = machine.backend
+        self.user = user
+        self.pathStyle = C.PathStyle_DOS if machine._OSTypeId.startswith('Windows') else C.PathStyle_UNIX
+        self.closed = False
+        self.boot = machine.boots
+        self.ready = time.time() + self.backend.operationTime
+
+    def waitFor(self, flags, timeout):
+        self.backend.call()
+        if flags & C.GuestSessionWaitForFlag_Start:
+            time.sleep(max(0, min(self.ready - time.time(), timeout / 1000.0)))
+        return C.GuestSessionWaitResult_Start if time.time() >= self.ready else C.GuestSessionWaitResult_Timeout
+
+    @property
+    def status(self):
+        self.backend.call(False)
+        if self.closed or self.boot != self.machine.boots or not self.machine.isOnline():
+            return C.GuestSessionStatus_Terminated
+        return C.GuestSessionStatus_Started if time.time() >= self.ready else C.GuestSessionStatus_Starting
+
+    def processCreate(self, executable, args, environment, flags, timeout):
+        self.backend.call()
+        if self.closed:
+            raise SimulatedError("Guest session is closed")
+        return Process(self, executable, list(args or []))
+
+    def fileExists(self, path, followSymlinks):
+        self.backend.call()
+        return path in self.machine.files
+
+    def directoryExists(self, path, followSymlinks):
+        self.backend.call()
+        return self.isDirectory(path)
+
+    def isDirectory(self, path):
+        prefix = path.rstrip('/') + '/'
+        return (path.rstrip('/') in self.machine.directories or
+                any(name.startswith(prefix) for name in list(self.machine.files) + list(self.machine.directories)))
+
+    def fsObjQueryInfo(self, path, followSymlinks):
+        self.backend.call()
+        if path in self.machine.files:
+            return FsObjInfo(path.rstrip('/').split('/')[-1], C.FsObjType_File, len(self.machine.files[path]),
+                             self.machine.mtimes.get(path, 0))
+        if self.isDirectory(path):
+            return FsObjInfo(path.rstrip('/').split('/')[-1], C.FsObjType_Directory, 0, 0)
+        raise SimulatedError("Path '%s' not found"%path)
+
+    def directoryCreate(self, path, mode, flags):
+        self.backend.call()
+        parent = path.rstrip('/').rsplit('/', 1)[0]
+        if C.DirectoryCreateFlag_Parents not in flags and parent and not self.isDirectory(parent):
+            raise SimulatedError("Parent of directory '%s' does not exist"%path)
+        self.machine.directories.add(path.rstrip('/'))
+
+    def directoryOpen(self, path, filter, flags):
+        self.backend.call()
+        if not self.isDirectory(path):
+            raise SimulatedError("Directory '%s' not found"%path)
+        return GuestDirectory(self, path)
+
+    def fileOpen(self, path, accessMode, openAction, creationMode):
+        self.backend.call()
+        if path not in self.machine.files and openAction in [C.FileOpenAction_OpenExisting, C.FileOpenAction_OpenExistingTruncated]:
+            raise SimulatedError("File '%s' not found"%path)
+        if path in self.machine.files and openAction == C.FileOpenAction_CreateNew:
+            raise SimulatedError("File '%s' already exists"%path)
+        return GuestFile(self, path, accessMode, openAction)
+
+    def fileCopyToGuest(self, source, destination, flags):
+        self.backend.call()
+        with open(source, 'rb') as fp:
+            data = fp.read()
+        def copied():
+            self.machine.files[destination] = data
+        return Progress(self.backend, self.backend.operationTime, copied, "copying " + source)
+
+    def directoryCopyToGuest(self, source, destination, flags):
+        self.backend.call()
+        files = {}
+        for root, dirs, names in os.walk(source):
+            for name in names:
+                local = os.path.join(root, name)
+                with open(local, 'rb') as fp:
+                    files[destination.rstrip('/') + '/' + os.path.relpath(local, source).replace(os.sep, '/')] = fp.read()
+        def copied():
+            self.machine.files.update(files)
+        return Progress(self.backend, self.backend.operationTime, copied, "copying " + source)
+
+    def fileCopyFromGuest(self, source, destination, flags):
+        self.backend.call()
+        def copied():
+            with open(destination, 'wb') as fp:
+                fp.write(self.machine.files[source])
+        return Progress(self.backend, self.backend.operationTime, copied, "copying " + source)
+
+    def directoryCopyFromGuest(self, source, destination, flags):
+        self.backend.call()
+        prefix = source.rstrip('/') + '/'
+        def copied():
+            for name, data in self.machine.files.items():
+                if not name.startswith(prefix):
+                    continue
+                local = os.path.join(destination, *name[len(prefix):].split('/'))
+                if not os.path.isdir(os.path.dirname(local)):
+                    os.makedirs(os.path.dirname(local))
+                with open(local, 'wb') as fp:
+                    fp.write(data)
+        return Progress(self.backend, self.backend.operationTime, copied, "copying " + source)
+
+    def close(self):
+        self.backend.call(False)
+        self.closed = True
+
+class FsObjInfo():
+    """ IGuestFsObjInfo """
+    def __init__(self, name, type, objectSize, modificationTime):
+        self.name = name
+        self.type = type
+        self.objectSize = objectSize
+        self.modificationTime = modificationTime
+
+class GuestDirectory():
+    """ IGuestDirectory, read raises error when there are no more entries """
+    def __init__(self, session, path):
+        self.backend = session.backend
+        machine = session.machine
+        prefix = path.rstrip('/') + '/'
+        entries = {}
+        for name in list(machine.files) + list(machine.directories):
+            if name.startswith(prefix):
+                child = name[len(prefix):].split('/')
+                if len(child) > 1 or name in machine.directories:
+                    entries[child[0]] = FsObjInfo(child[0], C.FsObjType_Directory, 0, 0)
+                else:
+                    entries[child[0]] = FsObjInfo(child[0], C.FsObjType_File, len(machine.files[name]), machine.mtimes.get(name, 0))
+        self.entries = [entries[name] for name in sorted(entries)]
+
+    def read(self):
+        self.backend.call(False)
+        if not len(self.entries):
+            raise SimulatedError("No more entries")
+        return self.entries.pop(0)
+
+    def close(self):
+        self.backend.call(False)
+
+class GuestFile():
+    """
+    IGuestFile. Data are kept in buffer and stored to guest file system
+    when the handle is closed.
+    """
+    def __init__(self, session, path, accessMode, openAction):
+        self.session = session
+        self.backend = session.backend
+        self.machine = session.machine
+        self.path = path
+        self.accessMode = accessMode
+        self.lock = threading.Lock()
+        if openAction in [C.FileOpenAction_CreateOrReplace, C.FileOpenAction_OpenExistingTruncated]:
+            self.machine.files[path] = ""
+        else:
+            self.machine.files.setdefault(path, "")
+        self.buffer = bytearray(self.machine.files[path])
+        self.closed = False
+
+    def checkOpen(self):
+        if self.closed or self.session.closed:
+            raise SimulatedError("File '%s' is closed"%self.path)
+
+    def readAt(self, offset, toRead, timeout):
+        self.backend.call(False)
+        with self.lock:
+            self.checkOpen()
+            return str(self.buffer[offset:offset + toRead])
+
+    def writeAt(self, offset, data, timeout):
+        self.backend.call(False)
+        with self.lock:
+            self.checkOpen()
+            if self.accessMode == C.FileAccessMode_ReadOnly:
+                raise SimulatedError("File '%s' is opened for reading"%self.path)
+            if offset > len(self.buffer):
+                self.buffer.extend('\0' * (offset - len(self.buffer)))
+            self.buffer[offset:offset + len(data)] = data
+        return len(data)
+
+    def queryInfo(self):
+        self.backend.call(False)
+        return FsObjInfo(self.path.rstrip('/').split('/')[-1], C.FsObjType_File, len(self.buffer), self.machine.mtimes.get(self.path, 0))
+
+    def close(self):
+        self.backend.call(False)
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.accessMode != C.FileAccessMode_ReadOnly:
+                self.machine.files[self.path] = str(self.buffer)
+                self.machine.mtimes[self.path] = int(time.time() * 1e9)
+
+class Process():
+    """
+    IGuestProcess. Shells echo their input, cat and sha1sum read guest files, other
+    programs print their arguments and end after operation time.
+    """
+    SHELLS = ['/bin/sh', '/bin/bash', r'C:\Windows\System32\cmd.exe']
+
+    def __init__(self, session, executable, args):
+        self.session = session
+        self.backend = session.backend
+        self.executable = executable
+        self.arguments = args
+        self.interactive = executable in self.SHELLS and len(args) <= 1
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.output = {1: "", 2: ""}
+        self._status = C.ProcessStatus_Started
+        self._exitCode = 0
+        self.PID = session.backend.random.randint(1000, 65535)
+        if self.interactive:
+            pass
+        elif executable.rsplit('/', 1)[-1] == 'cat':
+            for path in args[1:]:
+                if path in session.machine.files:
+                    self.output[1] += session.machine.files[path]
+                else:
+                    self.output[2] += "cat: %s: No such file or directory\n"%path
+                    self._exitCode = 1
+        elif executable.rsplit('/', 1)[-1] == 'sha1sum':
+            for path in args[1:]:
+                if path in session.machine.files:
+                    self.output[1] += "%s  %s\n"%(hashlib.sha1(session.machine.files[path]).hexdigest(), path)
+                else:
+                    self.output[2] += "sha1sum: %s: No such file or directory\n"%path
+                    self._exitCode = 1
+        else:
+            self.output[1] = " ".join(args[1:] if len(args) else [executable]) + "\n"
+
+    def update(self):
+        with self.lock:
+            if (not self.interactive and self._status == C.ProcessStatus_Started
+                    and time.time() - self.started >= self.backend.operationTime / 5):
+                self._status = C.ProcessStatus_TerminatedNormally
+
+    @property
+    def status(self):
+        self.backend.call(False)
+        self.update()
+        return self._status
+
+    @property
+    def exitCode(self):
+        self.backend.call(False)
+        self.update()
+        return self._exitCode
+
+    def waitFor(self, flags, timeout):
+        """ @param timeout: Time in miliseconds """
+        self.backend.call(False)
+        end = time.time() + timeout / 1000.0
+        if flags & C.ProcessWaitForFlag_Terminate:
+            while True:
+                self.update()
+                if self._status != C.ProcessStatus_Started:
+                    return C.ProcessWaitResult_Terminate
+                if time.time() >= end:
+                    return C.ProcessWaitResult_Timeout
+                time.sleep(0.01)
+        if flags & C.ProcessWaitForFlag_StdOut and not len(self.output[1]):
+            self.update()
+            return C.ProcessWaitResult_Timeout if self._status == C.ProcessStatus_Started else C.ProcessWaitResult_Terminate
+        return C.ProcessWaitResult_Start
+
+    def waitForArray(self, flags, timeout):
+        """ Wait for the first of events, output is reported only if there is some """
+        self.backend.call(False)
+        end = time.time() + timeout / 1000.0
+        events = [(C.ProcessWaitForFlag_StdOut, 1, C.ProcessWaitResult_StdOut),
+                  (C.ProcessWaitForFlag_StdErr, 2, C.ProcessWaitResult_StdErr)]
+        while True:
+            self.update()
+            for flag, handle, result in events:
+                if flag in flags and len(self.output[handle]):
+                    return result
+            if C.ProcessWaitForFlag_Terminate in flags and self._status != C.ProcessStatus_Started:
+                return C.ProcessWaitResult_Terminate
+            if time.time() >= end:
+                return C.ProcessWaitResult_Timeout
+            time.sleep(0.01)
+
+    def read(self, handle, toRead, timeout):
+        self.backend.call(False)
+        with self.lock:
+            data = self.output.get(handle, "")
+            self.output[handle] = data[toRead:]
+        return data[:toRead]
+
+    def write(self, handle, flags, data, timeout):
+        self.backend.call(False)
+        with self.lock:
+            if self._status != C.ProcessStatus_Started:
+                raise SimulatedError("Process is not running")
+            for line in data.splitlines():
+                if line.strip() == 'exit':
+                    self._status = C.ProcessStatus_TerminatedNormally
+                    break
+                self.output[1] += "%s\n"%line
+            if flags & C.ProcessInputFlag_EndOfFile: # Shell ends when its input is closed
+                self._status = C.ProcessStatus_TerminatedNormally
+        return len(data)
+
+    def terminate(self):
+        self.backend.call()
+        with self.lock:
+            self._status = C.ProcessStatus_TerminatedSignal
+            self._exitCode = 143
+
+class VirtualSystemDescription():
+    def __init__(self, machine):
+        self.machine = machine
+
+class Appliance():
+    """
+    IAppliance, exported file contains machine name, OS type, memory and CPU count
+    """
+    def __init__(self, vbox):
+        self.vbox = vbox
+        self.backend = vbox.backend
+        self.machines = [] # Machines to export
+        self.contents = [] # Read machine definitions
+
+    def write(self, format, options, path):
+        self.backend.call()
+        machines = list(self.machines)
+        def written():
+            with open(path, 'w') as fp:
+                for machine in machines:
+                    fp.write("%s %s %d %d\n"%(machine._name, machine._OSTypeId, machine._memorySize, machine._CPUCount))
+        return Progress(self.backend, self.backend.operationTime, written, "exporting " + path)
+
+    def read(self, path):
+        self.backend.call()
+        def read():
+            try:
+                with open(path, 'r') as fp:
+                    self.contents = [line.split() for line in fp if len(line.split()) == 4]
+            except IOError as e:
+                raise SimulatedError("Could not read appliance %s: %s"%(path, e))
+        return Progress(self.backend, self.backend.operationTime / 5, read, "reading " + path)
+
+    def interpret(self):
+        self.backend.call()
+
+    def importMachines(self, options):
+        self.backend.call()
+        contents = list(self.contents)
+        def imported():
+            for name, osType, memory, cpus in contents:
+                with self.backend.lock:
+                    while self.vbox.getByName(name) is not None:
+                        name += "_1"
+                    machine = Machine(self.vbox, name, osType, int(memory), int(cpus))
+                    self.vbox.register(machine)
+        return Progress(self.backend, self.backend.operationTime, imported, "importing")
+
+class VirtualBox():
+    """
+    IVirtualBox with a fleet of machines
+    """
+    def __init__(self, backend, machines=10, running=0.3):
+        """
+        @param machines: Number of machines registered on start. Default value: 10
+        @param running: Fraction of running machines. Default value: 0.3
+        """
+        self.backend = backend
+        self._version = "5.0.16_SIM"
+        self.eventSource = EventSource(backend)
+        self.host = Host(backend, 8)
+        self.registered = [] # Registered machines in registration order
+        self.byName = {}
+        self.byId = {}
+        osTypes = ['Ubuntu_64', 'RedHat_64', 'Windows7_64']
+        for index in range(machines):
+            state = C.MachineState_Running if backend.random.random() < running else C.MachineState_PoweredOff
+            machine = Machine(self, "vm%04d"%index, osTypes[index % len(osTypes)], 1024, 1, state)
+            if state == C.MachineState_Running:
+                machine._sessionState = C.SessionState_Locked
+            self.register(machine, False)
+
+    version = remote('version')
+
+    @property
+    def machines(self):
+        self.backend.call()
+        with self.backend.lock:
+            return list(self.registered)
+
+    def getByName(self, name):
+        return self.byName.get(name)
+
+    def register(self, machine, notify=True):
+        """ Add machine to the registry. Backend lock must be held if notify is True. """
+        machine.registered = True
+        self.registered.append(machine)
+        self.byName[machine._name] = machine
+        self.byId[machine._id] = machine
+        if notify:
+            self.eventSource.fire(Event(C.VBoxEventType_OnMachineRegistered, machine._id, registered=True))
+
+    def unregister(self, machine):
+        """ Remove machine from the registry. Backend lock must be held. """
+        machine.registered = False
+        self.registered.remove(machine)
+        self.byName.pop(machine._name, None)
+        self.byId.pop(machine._id, None)
+        self.eventSource.fire(Event(C.VBoxEventType_OnMachineRegistered, machine._id, registered=False))
+
+    def findMachine(self, nameOrId):
+        self.backend.call()
+        with self.backend.lock:
+            machine = self.byName.get(nameOrId) or self.byId.get(nameOrId)
+        if machine is None:
+            raise SimulatedError("Could not find a registered machine named '%s'"%nameOrId)
+        return machine
+
+    def createMachine(self, settingsFile, name, groups, osTypeId, flags):
+        self.backend.call()
+        return Machine(self, name, osTypeId)
+
+    def registerMachine(self, machine):
+        self.backend.call()
+        with self.backend.lock:
+            if machine._name in self.byName:
+                raise SimulatedError("Machine '%s' already exists"%machine._name)
+            self.register(machine)
+
+    def openMachine(self, settingsFile):
+        self.backend.call()
+        raise SimulatedError("Could not open settings file '%s'"%settingsFile)
+
+    def createMedium(self, format, location, accessMode, deviceType):
+        self.backend.call()
+        return Medium(self.backend, location, deviceType)
+
+    def createAppliance(self):
+        self.backend.call()
+        return Appliance(self)
+
+class Platform():
+    """
+    Webservice connection of simulated manager
+    """
+    def __init__(self, manager):
+        self.manager = manager
+        self.connected = True
+
+    def connect(self, url, user, password):
+        self.manager.backend.loggedOn = True
+        self.manager.backend.call()
+        self.connected = True
+        return self.manager.vbox
+
+    def disconnect(self):
+        self.manager.backend.loggedOn = False
+        self.connected = False
+
+class SimulatedManager():
+    """
+    Replacement of vboxapi.VirtualBoxManager. Every instance simulates its own server.
+    """
+    # Parameters of created managers, set by configure()
+    latency = 0.0
+    failureRate = 0.0
+    machines = 10
+    operationTime = 0.5
+    seed = None
+    unreachable = [] # Hosts which do not answer
+    unreachableDelay = 30.0 # Time after which the connection to unreachable host is refused
+
+    def __init__(self, style=None, params=None):
+        self.style = style
+        self.params = params
+        url = (params or {}).get('url') or ""
+        host = url.split('://')[-1].split(':')[0].split('/')[0]
+        if host in self.unreachable:
+            time.sleep(self.unreachableDelay)
+            raise SimulatedError("Connection refused by %s"%url)
+        self.backend = Backend(self.latency, self.failureRate, self.operationTime, self.seed)
+        self.backend.call(False) # Logon
+        self.vbox = VirtualBox(self.backend, self.machines)
+        self.constants = C
+        self.platform = Platform(self)
+
+    @classmethod
+    def configure(cls, latency=0.0, failureRate=0.0, machines=10, operationTime=0.5, seed=None, unreachable=None):
+        """
+        Set parameters of managers created later
+        @param latency: Duration of every call in seconds. Default value: 0.0
+        @param failureRate: Probability that a call fails, 0.0 - 1.0. Default value: 0.0
+        @param machines: Number of machines of every simulated host. Default value: 10
+        @param operationTime: Duration of long operations in seconds. Default value: 0.5
+        @param seed: Seed of random generator. Default value: None
+        @param unreachable: List of host names which do not answer. Default value: None
+        """
+        cls.unreachable = unreachable or []
+        cls.latency = latency
+        cls.failureRate = failureRate
+        cls.machines = machines
+        cls.operationTime = operationTime
+        cls.seed = seed
+
+    def getSessionObject(self, vbox):
+        return Session(self.backend)
+
+    def getArray(self, obj, attribute):
+        return list(getattr(obj, attribute))
+
+    def queryInterface(self, obj, interface):
+        return obj
+
+    def initPerThread(self):
+        pass
+
+    def deinitPerThread(self):
+        pass
@@ -0,0 +1,140 @@
+"""
+File: states.py
+Author: agent
+Date: 2026-10-17
+Brief: In-memory table of machine states of a single host. The table is
+       filled once and kept up to date by VirtualBox events.
+"""
+
+import threading
+import time
+
+class StateTable():
+    """
+    Machine id -> state record of all machines registered on host
+    """
+    def __init__(self, env):
+        """
+        @param env: Environment whose machines are tracked
+        """
+        self.env = env
+        self.lock = threading.RLock()
+        self.machines = {} # Machine id -> {'id', 'name', 'osType', 'state', 'sessionState', 'updated'}
+        self.names = {} # Machine name -> machine id
+        self.synced = False
+        self.syncs = 0
+        self.stateNames = {} # Filled when VirtualBox constants are known, see register
+
+    def getEnumNames(self, enum):
+        """ Create value -> name mapping of VirtualBox enumeration """
+        try:
+            values = self.env.const.all_values(enum)
+        except Exception:
+            return {}
+        return dict((int(value), name) for name, value in values.items())
+
+    def register(self, eventWatcher):
+        """ Register handlers of machine state, registration and session state events """
+        const = self.env.const
+        self.stateNames = self.getEnumNames('MachineState')
+        eventWatcher.addHandler(const.VBoxEventType_OnMachineStateChanged, 'IMachineStateChangedEvent', self.onStateChanged)
+        eventWatcher.addHandler(const.VBoxEventType_OnMachineRegistered, 'IMachineRegisteredEvent', self.onRegistered)
+        eventWatcher.addHandler(const.VBoxEventType_OnSessionStateChanged, 'ISessionStateChangedEvent', self.onSessionStateChanged)
+
+    def invalidate(self):
+        """ Events might have been missed, read all states again on next access """
+        self.synced = False
+
+    def isCurrent(self):
+        """ Check if the table is kept up to date by events """
+        return self.synced and self.env.events.subscribed
+
+    def sync(self):
+        """ Read states of all machines from the server """
+        machines = {}
+        names = {}
+        for mach in self.env.mgr.getArray(self.env.vbox, 'machines'):
+            record = self.readMachine(mach)
+            machines[record['id']] = record
+            names[record['name']] = record['id']
+        with self.lock:
+            self.machines = machines
+            self.names = names
+            self.synced = True
+            self.syncs += 1
+
+    def ensure(self):
+        """ Sync the table if it is not kept up to date by events """
+        if not self.isCurrent():
+            self.sync()
+
+    def readMachine(self, mach):
+        return {'id': str(mach.id),
+                'name': str(mach.name),
+                'osType': str(mach.OSTypeId),
+                'state': int(mach.state),
+                'sessionState': int(mach.sessionState),
+                'updated': time.time(),
+                }
+
+    def onStateChanged(self, event):
+        machid = str(event.machineId)
+        with self.lock:
+            record = self.machines.get(machid)
+            if record is not None:
+                record['state'] = int(event.state)
+                record['updated'] = time.time()
+                return
+        self.onRegistered(event, True) # Unknown machine, read it whole
+
+    def onSessionStateChanged(self, event):
+        with self.lock:
+            record = self.machines.get(str(event.machineId))
+            if record is not None:
+                record['sessionState'] = int(event.state)
+                record['updated'] = time.time()
+
+    def onRegistered(self, event, registered=None):
+        machid = str(event.machineId)
+        if registered is None:
+            registered = event.registered
+        if registered:
+            record = self.readMachine(self.env.vbox.findMachine(machid))
+            with self.lock:
+                self.machines[machid] = record
+                self.names[record['name']] = machid
+        else:
+            with self.lock:
+                record = self.machines.pop(machid, None)
+                if record is not None:
+                    self.names.pop(record['name'], None)
+
+    def isOnline(self, state):
+        """ Check if machine state means that the machine is running """
+        const = self.env.const
+        return const.MachineState_FirstOnline <= state <= const.MachineState_LastOnline
+
+    def getStateName(self, state):
+        return self.stateNames.get(state, str(state))
+
+    def getRecord(self, machname):
+        """
+        Return state record of machine
+        @param machname: Machine name or UUID
+        @return: Record dictionary or None if the machine is unknown
+        """
+        self.ensure()
+        with self.lock:
+            machid = self.names.get(machname, machname)
+            record = self.machines.get(machid)
+            return dict(record) if record else None
+
+    def getRecords(self):
+        """ Return records of all machines on host """
+        self.ensure()
+        with self.lock:
+            return [dict(record) for record in self.machines.values()]
+
+    def getRunning(self):
+        """ Return records of running machines """
+        return [record for record in self.getRecords() if self.isOnline(record['state'])]
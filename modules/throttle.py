@@ -0,0 +1,103 @@
+"""
+File: throttle.py
+Author: agent
+Date: 2026-10-17
+Brief: Admission control of operations reading and writing host storage.
+       Running VirtualBox operation cannot be slowed down, so the bandwidth
+       limit is kept by starting a new operation only when the measured
+       throughput of running operations leaves room for it.
+"""
+
+import threading
+import time
+
+class Slot():
+    """
+    Admitted operation, release it when the operation ends
+    """
+    def __init__(self, limiter, size):
+        """
+        @param limiter: BandwidthLimiter which admitted the operation
+        @param size: Expected number of bytes moved by the operation
+        """
+        self.limiter = limiter
+        self.size = size
+        self.started = time.time()
+        self.op = None # Object with percent attribute, the operation is measured by it
+
+    def watch(self, op):
+        """
+        Measure throughput by progress of operation
+        @param op: Object with percent attribute, e.g. Operation of progress tracker
+        """
+        self.op = op
+        self.started = time.time()
+
+    def getThroughput(self):
+        """
+        @return: Bytes per second or None if the operation was not measured long enough
+        """
+        elapsed = time.time() - self.started
+        if self.op is None or elapsed < self.limiter.warmup:
+            return None
+        return self.size * self.op.percent / 100.0 / elapsed
+
+    def release(self):
+        self.limiter.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.release()
+
+class BandwidthLimiter():
+    """
+    Admits operations while their combined throughput stays under the limit.
+    The next operation is expected to be as fast as an average running one.
+    Operation which is not measured yet holds the others back, so operations
+    started at once cannot exceed the limit together.
+    """
+    def __init__(self, rate, warmup=2.0, interval=0.2):
+        """
+        @param rate: Maximum throughput in bytes per second, 0 means unlimited
+        @param warmup: Number of seconds an operation runs before its throughput is trusted. Default value: 2.0
+        @param interval: Number of seconds between checks of waiting operation. Default value: 0.2
+        """
+        self.rate = rate
+        self.warmup = warmup
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.slots = [] # Running operations
+        self.waited = 0.0 # Total number of seconds operations waited for admission
+
+    def canAdmit(self):
+        """ Check if one more operation fits under the limit, lock must be held """
+        if not self.rate or not len(self.slots):
+            return True # The only operation always runs, even if it is faster than limit
+        throughputs = [slot.getThroughput() for slot in self.slots]
+        if None in throughputs:
+            return False
+        total = sum(throughputs)
+        return total + total / len(throughputs) <= self.rate
+
+    def admit(self, size):
+        """
+        Wait until an operation may start
+        @param size: Expected number of bytes moved by the operation
+        @return: Slot object, it has to be released when the operation ends
+        """
+        started = time.time()
+        while True:
+            with self.lock:
+                if self.canAdmit():
+                    slot = Slot(self, size)
+                    self.slots.append(slot)
+                    self.waited += time.time() - started
+                    return slot
+            time.sleep(self.interval)
+
+    def release(self, slot):
+        with self.lock:
+            if slot in self.slots:
+                self.slots.remove(slot)
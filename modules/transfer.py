@@ -0,0 +1,560 @@
+"""
+File: transfer.py
+Author: agent
+Date: 2026-10-17
+Brief: Transfer of files between host and guest built on guest file handles.
+       Files are moved in chunks, several chunks are in flight at once.
+       Checksums of confirmed chunks are kept in a journal, so interrupted
+       transfer continues from the last confirmed offset.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from Queue import Queue, Full
+
+from modules.cache import LRUCache
+from modules.errors import TransferException
+from modules.guestio import OutputPump, STDOUT
+
+class Journal():
+    """
+    Checksums of confirmed chunks of every file of a transfer. A file is
+    resumed only if its size, modification time and chunk size did not change.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.files = {} # File key -> {'size', 'mtime', 'chunkSize', 'digests'}
+        self.confirmed = {} # File key -> number of confirmed checksums, entry digests may be longer
+        try:
+            with open(filename, 'r') as fp:
+                self.files = json.load(fp).get('files', {})
+        except (IOError, ValueError): # No interrupted transfer or damaged journal
+            self.files = {}
+
+    def getDigests(self, key, size, mtime, chunkSize):
+        """ @return: Checksums of confirmed chunks from the start of file """
+        with self.lock:
+            entry = self.files.get(key)
+            if entry is None or [entry['size'], entry['mtime'], entry['chunkSize']] != [size, mtime, chunkSize]:
+                return []
+            return list(entry['digests'])
+
+    def update(self, key, size, mtime, chunkSize, digests, confirmed):
+        """
+        Record confirmed chunks of file. The list of checksums is not copied,
+        checksums of confirmed chunks must not change.
+        @param digests: Checksums of chunks, only the first confirmed ones are stored
+        @param confirmed: Number of confirmed chunks from the start of file
+        """
+        with self.lock:
+            self.files[key] = {'size': size, 'mtime': mtime, 'chunkSize': chunkSize, 'digests': digests}
+            self.confirmed[key] = confirmed
+
+    def discard(self, key):
+        """ File was transferred and verified, it is not needed for resume """
+        with self.lock:
+            self.files.pop(key, None)
+            self.confirmed.pop(key, None)
+
+    def save(self):
+        """ Write journal atomically, empty journal is removed """
+        with self.lock:
+            files = {}
+            for key, entry in self.files.items():
+                files[key] = dict(entry)
+                files[key]['digests'] = entry['digests'][:self.confirmed.get(key, len(entry['digests']))]
+        try:
+            if not len(files):
+                if os.path.exists(self.filename):
+                    os.remove(self.filename)
+                return
+            directory = os.path.dirname(self.filename)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            tmp = self.filename + ".tmp"
+            with open(tmp, 'w') as fp:
+                json.dump({'files': files}, fp)
+            os.rename(tmp, self.filename)
+        except (IOError, OSError): # Transfer goes on, only resume is affected
+            pass
+
+class SharedSource():
+    """
+    Local file sent to many machines at once. It is hashed once and chunks
+    read by concurrent transfers are cached, so the disk is read about once.
+    """
+    def __init__(self, filename, chunkSize=1048576, cacheChunks=64):
+        """
+        @param filename: Path to local file
+        @param chunkSize: Size of a single chunk in bytes, must match chunk size of transfers. Default value: 1 MB
+        @param cacheChunks: Maximum number of cached chunks. Default value: 64
+        """
+        info = os.stat(filename)
+        self.filename = filename
+        self.size = info.st_size
+        self.mtime = int(info.st_mtime)
+        self.chunkSize = chunkSize
+        self.cache = LRUCache(cacheChunks)
+        self.lock = threading.Lock()
+        self.fp = None
+        self.digest = None
+        self.reads = 0 # Number of chunks read from disk
+
+    def hash(self):
+        """ @return: SHA-1 checksum of the whole file """
+        sha = hashlib.sha1()
+        with open(self.filename, 'rb') as fp:
+            index = 0
+            while True:
+                data = fp.read(self.chunkSize)
+                if not data:
+                    break
+                sha.update(data)
+                self.reads += 1
+                if index < self.cache.capacity: # Beginning of file is needed first by transfers
+                    self.cache.put(index, data)
+                index += 1
+        self.digest = sha.hexdigest()
+        return self.digest
+
+    def read(self, index):
+        data = self.cache.get(index)
+        if data is not None:
+            return data
+        with self.lock:
+            data = self.cache.get(index) # Another transfer could read it meanwhile
+            if data is None:
+                if self.fp is None:
+                    self.fp = open(self.filename, 'rb')
+                self.fp.seek(index * self.chunkSize)
+                data = self.fp.read(self.chunkSize)
+                self.reads += 1
+                self.cache.put(index, data)
+        return data
+
+    def close(self):
+        with self.lock:
+            if self.fp is not None:
+                self.fp.close()
+                self.fp = None
+
+class FileJob():
+    """
+    Transfer of a single file
+    """
+    def __init__(self, key, source, destination, size, mtime):
+        """
+        @param key: Name of file in journal, path relative to transferred tree
+        """
+        self.key = key
+        self.source = source
+        self.destination = destination
+        self.size = size
+        self.mtime = mtime
+        self.digests = [] # Checksums of chunks in order, None for chunks not confirmed
+        self.confirmed = 0 # Number of confirmed chunks from the start of file
+        self.pending = 0 # Number of chunks processed by the current pass
+        self.guestFile = None
+        self.localFile = None
+        self.shared = None # SharedSource used instead of local file
+        self.lock = threading.Lock()
+
+    def getChunkCount(self, chunkSize):
+        return (self.size + chunkSize - 1) // chunkSize
+
+class FileTransfer():
+    """
+    Copies files and directory trees through a single guest session
+    """
+    def __init__(self, guestSession, const, journal, chunkSize=1048576, inflight=8, verify=True, retries=2, timeout=30000):
+        """
+        @param guestSession: Started IGuestSession
+        @param const: VirtualBox constants
+        @param journal: Journal object used to resume the transfer
+        @param chunkSize: Size of a single chunk in bytes. Default value: 1 MB
+        @param inflight: Number of chunks transferred at once. Default value: 8
+        @param verify: Compare checksums of destination with the source. Default value: True
+        @param retries: Number of repeated attempts of failed chunk. Default value: 2
+        @param timeout: Timeout of a single guest file operation in miliseconds. Default value: 30000
+        """
+        self.guestSession = guestSession
+        self.const = const
+        self.journal = journal
+        self.chunkSize = chunkSize
+        self.inflight = max(1, inflight)
+        self.verify = verify
+        self.retries = retries
+        self.timeout = timeout
+        self.separator = '\\' if guestSession.pathStyle == const.PathStyle_DOS else '/'
+        self.error = None
+        self.lastSave = time.time()
+        self.transferred = 0 # Number of bytes moved by this run
+        self.skipped = 0 # Number of bytes confirmed by previous runs
+        self.files = 0
+        self.lock = threading.Lock()
+
+    def joinGuest(self, directory, name):
+        return directory.rstrip('/\\') + self.separator + name
+
+    def getGuestInfo(self, guestPath):
+        """ @return: IGuestFsObjInfo object or None if the path does not exist """
+        try:
+            return self.guestSession.fsObjQueryInfo(guestPath, False)
+        except Exception:
+            return None
+
+    def isGuestDirectory(self, info):
+        return info is not None and info.type == self.const.FsObjType_Directory
+
+    def getUploadPath(self, source, destination):
+        """ Path of uploaded file in guest, file copied to directory keeps its name """
+        if destination.endswith(('/', '\\')) or self.isGuestDirectory(self.getGuestInfo(destination)):
+            return self.joinGuest(destination, os.path.basename(source))
+        return destination
+
+    def copyShared(self, shared, destination):
+        """
+        Copy shared local file to guest
+        @param shared: SharedSource object with the same chunk size
+        @param destination: Path of file in guest
+        """
+        job = FileJob(os.path.basename(shared.filename), shared.filename, destination, shared.size, shared.mtime)
+        job.shared = shared
+        self.run([job], True)
+
+    def getGuestDigest(self, guestPath, size):
+        """
+        SHA-1 checksum of guest file. Checksum tool of guest is used, if it is
+        not available, the file is read back.
+        @param size: Size of the file in bytes
+        @return: Checksum or None if the file does not exist
+        """
+        if self.separator == '/':
+            executable, arguments = '/usr/bin/sha1sum', ['sha1sum', guestPath]
+        else:
+            executable, arguments = r'C:\Windows\System32\certutil.exe', ['certutil', '-hashfile', guestPath, 'SHA1']
+        try:
+            proc = self.guestSession.processCreate(executable, arguments, None, [5, 6], 0)
+            output = []
+            if not OutputPump(proc, self.const, {STDOUT: output.append}).run(self.timeout / 1000.0):
+                proc.terminate()
+            elif proc.exitCode == 0:
+                for line in "".join(output).splitlines():
+                    tokens = line.lower().split()
+                    # sha1sum prints checksum before path, older certutil separates bytes by spaces
+                    for candidate in tokens[:1] + ["".join(tokens)]:
+                        if re.match(r'^[0-9a-f]{40}$', candidate):
+                            return candidate
+        except Exception: # Tool is missing, read the file
+            pass
+        if self.getGuestInfo(guestPath) is None:
+            return None
+        job = FileJob(guestPath, guestPath, None, size, 0)
+        sha = hashlib.sha1()
+        job.guestFile = self.guestSession.fileOpen(guestPath, self.const.FileAccessMode_ReadOnly, self.const.FileOpenAction_OpenExisting, 0)
+        try:
+            for index in range(job.getChunkCount(self.chunkSize)):
+                sha.update(self.readGuest(job, index))
+        finally:
+            self.closeJob(job)
+        return sha.hexdigest()
+
+    def copyTo(self, source, destination):
+        """
+        Copy local file or directory to guest
+        @return: Number of copied files
+        """
+        if os.path.isfile(source):
+            destination = self.getUploadPath(source, destination)
+            info = os.stat(source)
+            jobs = [FileJob(os.path.basename(source), source, destination, info.st_size, int(info.st_mtime))]
+        elif os.path.isdir(source):
+            jobs = []
+            for root, dirs, names in os.walk(source):
+                relative = os.path.relpath(root, source)
+                guestRoot = destination if relative == '.' else self.joinGuest(destination, relative.replace(os.sep, self.separator))
+                self.guestSession.directoryCreate(guestRoot, 0755, [self.const.DirectoryCreateFlag_Parents])
+                for name in sorted(names):
+                    local = os.path.join(root, name)
+                    info = os.stat(local)
+                    key = os.path.normpath(os.path.join(relative, name)).replace(os.sep, '/')
+                    jobs.append(FileJob(key, local, self.joinGuest(guestRoot, name), info.st_size, int(info.st_mtime)))
+        else:
+            raise TransferException("Source %s does not exist on host machine"%source)
+        self.run(jobs, True)
+        return len(jobs)
+
+    def copyFrom(self, source, destination):
+        """
+        Copy guest file or directory to local machine
+        @return: Number of copied files
+        """
+        info = self.getGuestInfo(source)
+        if info is None:
+            raise TransferException("Source %s does not exist on virtual machine"%source)
+        if not self.isGuestDirectory(info):
+            if os.path.isdir(destination):
+                destination = os.path.join(destination, source.replace('\\', '/').rstrip('/').split('/')[-1])
+            jobs = [FileJob(os.path.basename(destination), source, destination, int(info.objectSize), int(info.modificationTime))]
+        else:
+            jobs = []
+            self.listGuest(source, destination, "", jobs)
+        self.run(jobs, False)
+        return len(jobs)
+
+    def listGuest(self, guestDir, localDir, relative, jobs):
+        """ Create local copy of guest directory tree and collect its files """
+        if not os.path.isdir(localDir):
+            os.makedirs(localDir)
+        directory = self.guestSession.directoryOpen(guestDir, "", [])
+        entries = []
+        try:
+            while True:
+                try:
+                    entries.append(directory.read())
+                except Exception: # No more entries
+                    break
+        finally:
+            directory.close()
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if entry.name in ['.', '..']:
+                continue
+            key = relative + "/" + entry.name if relative else entry.name
+            if entry.type == self.const.FsObjType_Directory:
+                self.listGuest(self.joinGuest(guestDir, entry.name), os.path.join(localDir, entry.name), key, jobs)
+            elif entry.type == self.const.FsObjType_File:
+                jobs.append(FileJob(key, self.joinGuest(guestDir, entry.name), os.path.join(localDir, entry.name),
+                                    int(entry.objectSize), int(entry.modificationTime)))
+
+    def run(self, jobs, upload):
+        """
+        Transfer all files, verify them and remove them from journal
+        @param upload: True if files are copied to guest
+        """
+        for job in jobs:
+            job.digests = self.journal.getDigests(job.key, job.size, job.mtime, self.chunkSize)
+            if len(job.digests) and self.getDestinationSize(job, upload) < min(len(job.digests) * self.chunkSize, job.size):
+                job.digests = [] # Destination was removed or truncated, confirmed chunks are lost
+            job.confirmed = len(job.digests)
+            job.digests += [None] * (job.getChunkCount(self.chunkSize) - job.confirmed)
+            self.skipped += min(job.confirmed * self.chunkSize, job.size)
+        try:
+            self.process(jobs, self.uploadChunk if upload else self.downloadChunk, False, upload)
+            if self.verify and upload:
+                # Checksum computed by guest saves reading the file back, small files are read back at once
+                damaged = [job for job in jobs if job.size < self.chunkSize or not self.isUploadIntact(job)]
+                self.process(damaged, self.verifyUploaded, True, upload)
+                for job in damaged:
+                    if job.size >= self.chunkSize: # All chunks match, but the file does not
+                        self.reset(job)
+                        raise TransferException("Checksum mismatch of %s, run the command again to repair it"%job.destination)
+            elif self.verify:
+                self.process(jobs, self.verifyDownloaded, True, upload)
+        finally:
+            self.journal.save()
+        for job in jobs:
+            self.journal.discard(job.key)
+        self.journal.save()
+        self.files += len(jobs)
+
+    def getDestinationSize(self, job, upload):
+        """ @return: Size of destination file of job in bytes, -1 if it does not exist """
+        if upload:
+            info = self.getGuestInfo(job.destination)
+            return int(info.objectSize) if info is not None and not self.isGuestDirectory(info) else -1
+        return os.path.getsize(job.destination) if os.path.isfile(job.destination) else -1
+
+    def isUploadIntact(self, job):
+        """ Compare checksum of the whole uploaded file computed by guest with the local one """
+        if job.shared is not None and job.shared.digest is not None:
+            digest = job.shared.digest
+        else:
+            sha = hashlib.sha1()
+            with open(job.source, 'rb') as fp:
+                while True:
+                    data = fp.read(self.chunkSize)
+                    if not data:
+                        break
+                    sha.update(data)
+            digest = sha.hexdigest()
+        return self.getGuestDigest(job.destination, job.size) == digest
+
+    def reset(self, job):
+        """ Forget confirmed chunks of job, next run transfers the whole file """
+        with job.lock:
+            job.confirmed = 0
+            self.journal.update(job.key, job.size, job.mtime, self.chunkSize, [], 0)
+
+    def process(self, jobs, task, verifying, upload):
+        """
+        Execute task for chunks of all files by a number of threads
+        @param task: Callable with (job, index) arguments
+        @param verifying: All chunks are processed, otherwise only those not confirmed
+        """
+        queue = Queue(self.inflight * 2) # Chunks waiting for a worker, limits reading ahead
+        threads = []
+        for i in range(self.inflight):
+            thread = threading.Thread(target=self.worker, args=(queue, task, upload, verifying))
+            thread.daemon = True
+            threads.append(thread)
+            thread.start()
+        try:
+            for job in jobs:
+                indexes = range(len(job.digests)) if verifying else range(job.confirmed, len(job.digests))
+                job.pending = len(indexes)
+                if not len(indexes):
+                    if not verifying and job.size == 0: # Empty file only needs to be created
+                        self.openJob(job, upload, False)
+                        self.closeJob(job)
+                    continue
+                for index in indexes:
+                    while self.error is None:
+                        try:
+                            queue.put((job, index), True, 0.2)
+                            break
+                        except Full: # Workers are busy
+                            continue
+                    if self.error is not None:
+                        break
+                if self.error is not None:
+                    break
+        except KeyboardInterrupt:
+            self.error = "Transfer interrupted"
+            raise
+        finally:
+            for thread in threads:
+                queue.put(None)
+            for thread in threads:
+                while thread.is_alive(): # Join with timeout, so KeyboardInterrupt is received
+                    thread.join(0.2)
+            for job in jobs:
+                self.closeJob(job)
+        if self.error is not None:
+            raise TransferException(self.error)
+
+    def worker(self, queue, task, upload, verifying):
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            job, index = item
+            if self.error is not None: # Transfer failed, only empty the queue
+                continue
+            for attempt in range(self.retries + 1):
+                try:
+                    self.openJob(job, upload, verifying)
+                    task(job, index)
+                    break
+                except TransferException as e: # Checksum mismatch, repeating does not help
+                    self.error = str(e)
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        self.error = "Transfer of %s failed at offset %d: %s"%(job.source, index * self.chunkSize, str(e))
+            with job.lock:
+                job.pending -= 1
+                done = job.pending == 0
+            if done:
+                self.closeJob(job)
+
+    def openJob(self, job, upload, verifying):
+        """ Open guest and local file of job when its first chunk is processed """
+        with job.lock:
+            if job.guestFile is not None:
+                return
+            const = self.const
+            resume = job.confirmed > 0 or verifying
+            if upload:
+                job.localFile = open(job.source, 'rb') if job.shared is None else None
+                action = const.FileOpenAction_OpenOrCreate if resume else const.FileOpenAction_CreateOrReplace
+                job.guestFile = self.guestSession.fileOpen(job.destination, const.FileAccessMode_ReadWrite, action, 0644)
+            else:
+                job.guestFile = self.guestSession.fileOpen(job.source, const.FileAccessMode_ReadOnly,
+                                                           const.FileOpenAction_OpenExisting, 0)
+                if resume and os.path.exists(job.destination):
+                    job.localFile = open(job.destination, 'r+b')
+                    if not verifying: # Unconfirmed data is written again
+                        job.localFile.truncate(job.confirmed * self.chunkSize)
+                else:
+                    job.localFile = open(job.destination, 'wb')
+
+    def closeJob(self, job):
+        with job.lock:
+            guestFile, localFile = job.guestFile, job.localFile
+            job.guestFile = job.localFile = None
+        if guestFile is not None:
+            try:
+                guestFile.close()
+            except Exception: # Guest session is gone
+                pass
+        if localFile is not None:
+            localFile.close()
+
+    def readLocal(self, job, index):
+        if job.shared is not None:
+            return job.shared.read(index)
+        with job.lock:
+            job.localFile.seek(index * self.chunkSize)
+            return job.localFile.read(self.chunkSize)
+
+    def readGuest(self, job, index):
+        """ Read whole chunk from guest file, guest returns at most what it has buffered """
+        offset = index * self.chunkSize
+        size = min(self.chunkSize, job.size - offset)
+        data = ""
+        while len(data) < size:
+            piece = str(job.guestFile.readAt(offset + len(data), size - len(data), self.timeout))
+            if not len(piece):
+                raise TransferException("File %s is shorter than expected, it was probably changed during transfer"%job.source)
+            data += piece
+        return data
+
+    def uploadChunk(self, job, index):
+        data = self.readLocal(job, index)
+        offset = index * self.chunkSize
+        written = 0
+        while written < len(data):
+            written += job.guestFile.writeAt(offset + written, data[written:], self.timeout)
+        self.confirm(job, index, hashlib.sha1(data).hexdigest(), len(data))
+
+    def downloadChunk(self, job, index):
+        data = self.readGuest(job, index)
+        with job.lock:
+            job.localFile.seek(index * self.chunkSize)
+            job.localFile.write(data)
+        self.confirm(job, index, hashlib.sha1(data).hexdigest(), len(data))
+
+    def verifyUploaded(self, job, index):
+        self.compare(job, index, self.readGuest(job, index))
+
+    def verifyDownloaded(self, job, index):
+        self.compare(job, index, self.readLocal(job, index))
+
+    def compare(self, job, index, data):
+        if hashlib.sha1(data).hexdigest() == job.digests[index]:
+            return
+        with job.lock: # Chunks from the damaged one are transferred again by next run
+            job.confirmed = min(job.confirmed, index)
+            self.journal.update(job.key, job.size, job.mtime, self.chunkSize, job.digests, job.confirmed)
+        raise TransferException("Checksum mismatch of %s at offset %d, run the command again to repair it"
+                                %(job.destination, index * self.chunkSize))
+
+    def confirm(self, job, index, digest, size):
+        """ Record transferred chunk, journal contains only chunks confirmed from the start of file """
+        with job.lock:
+            job.digests[index] = digest
+            while job.confirmed < len(job.digests) and job.digests[job.confirmed] is not None:
+                job.confirmed += 1
+            self.journal.update(job.key, job.size, job.mtime, self.chunkSize, job.digests, job.confirmed)
+        with self.lock:
+            self.transferred += size
+            save = time.time() - self.lastSave >= 1.0
+            if save:
+                self.lastSave = time.time()
+        if save:
+            self.journal.save()
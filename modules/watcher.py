@@ -0,0 +1,62 @@
+"""
+File: watcher.py
+Author: agent
+Date: 2026-10-17
+Brief: Watcher of configuration file. Modification time and size of the
+       file are polled in a background thread.
+"""
+
+import os
+import threading
+import time
+
+class FileWatcher():
+    """
+    Calls a callback when the watched file changes
+    """
+    def __init__(self, filename, callback, interval=2.0):
+        """
+        @param filename: Path to watched file
+        @param callback: Callable called with filename as argument when the file changes
+        @param interval: Number of seconds between two checks. Default value: 2.0
+        """
+        self.filename = filename
+        self.callback = callback
+        self.interval = interval
+        self.stamp = self.getStamp()
+        self.running = False
+        self.thread = None
+        self.changes = 0
+
+    def getStamp(self):
+        """ Modification time and size of the file, None if it does not exist """
+        try:
+            info = os.stat(self.filename)
+        except OSError:
+            return None
+        return (info.st_mtime, info.st_size)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        """ Body of watcher thread """
+        while self.running:
+            time.sleep(self.interval)
+            stamp = self.getStamp()
+            if stamp is None or stamp == self.stamp: # File is missing while being replaced
+                continue
+            self.stamp = stamp
+            self.changes += 1
+            try:
+                self.callback(self.filename)
+            except Exception:
+                pass
@@ -0,0 +1,106 @@
+"""
+File: workers.py
+Author: agent
+Date: 2026-10-17
+Brief: Bounded pool of worker threads used to execute commands
+       concurrently across hosts and machines
+"""
+
+import threading
+import time
+from Queue import Queue, Empty
+
+class TaskResult():
+    """
+    Outcome of a single task executed by the worker pool
+    """
+    def __init__(self, key):
+        self.key = key
+        self.status = "PENDING"
+        self.value = None
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    def getLatency(self):
+        """ Task duration in seconds, None if the task did not run yet """
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def isOk(self):
+        return self.status == "OK"
+
+class WorkerPool():
+    """
+    Executes tasks on a bounded number of threads. Every task is a callable
+    without arguments, its return value or raised exception is stored
+    in a TaskResult object.
+    """
+    def __init__(self, size, threadInit=None, threadDeinit=None):
+        """
+        @param size: Maximum number of tasks running at the same time
+        @param threadInit: Callable invoked once in every worker thread before
+                           any task is executed. Default value: None
+        @param threadDeinit: Callable invoked in every worker thread when the
+                             thread ends. Default value: None
+        """
+        self.size = max(1, int(size))
+        self.threadInit = threadInit
+        self.threadDeinit = threadDeinit
+        self.tasks = [] # List of (TaskResult, callable) tuples
+
+    def submit(self, key, task):
+        """
+        Register a new task. Tasks are started by the run method.
+        @param key: Identification of the task, stored in TaskResult
+        @param task: Callable to execute
+        @return: TaskResult object which will be filled when the task ends
+        """
+        result = TaskResult(key)
+        self.tasks.append((result, task))
+        return result
+
+    def run(self):
+        """
+        Execute all submitted tasks and wait for them to end.
+        @return: List of TaskResult objects in order of submission
+        """
+        queue = Queue()
+        for item in self.tasks:
+            queue.put(item)
+        threads = []
+        for i in range(min(self.size, len(self.tasks))):
+            thread = threading.Thread(target=self.worker, args=(queue,))
+            thread.daemon = True
+            threads.append(thread)
+            thread.start()
+        for thread in threads:
+            # Join with timeout, so the main thread still receives KeyboardInterrupt
+            while thread.is_alive():
+                thread.join(0.2)
+        results = [result for result, task in self.tasks]
+        self.tasks = []
+        return results
+
+    def worker(self, queue):
+        """ Worker thread body, takes tasks from the queue until it is empty """
+        if self.threadInit:
+            self.threadInit()
+        try:
+            while True:
+                try:
+                    result, task = queue.get_nowait()
+                except Empty: # Queue is empty, nothing more to do
+                    break
+                result.started = time.time()
+                try:
+                    result.value = task()
+                    result.status = "OK"
+                except Exception as e:
+                    result.error = str(e)
+                    result.status = "FAILED"
+                result.finished = time.time()
+        finally:
+            if self.threadDeinit:
+                self.threadDeinit()
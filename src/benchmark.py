@@ -0,0 +1,267 @@
+"""
+File: benchmark.py
+Author: agent
+Date: 2026-10-17
+Brief: Benchmark of interpreter operations on a simulated fleet. Every
+       scenario drives Interpreter end to end against in-process simulated
+       servers, results are stored as JSON so runs of different commits
+       can be compared.
+"""
+
+import argparse # Argument parser
+import json
+import os # OS features
+from os import path # Paths handling
+import random
+import shutil
+import subprocess
+import sys # Basic system features handling
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Extend path for own modules
+sys.path.append(path.dirname(path.dirname(path.realpath(sys.argv[0]))))
+from modules.history import LatencyHistory
+from modules.metrics import Histogram
+from modules.simulator import SimulatedManager
+from src.manager import Environment, Interpreter
+
+@contextmanager
+def quiet():
+    """ Suppress output of interpreter commands """
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+def getPercentile(samples, percent):
+    if not len(samples):
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100.0))]
+
+def makeResult(scenario, hosts, machines, duration, operations, samples=None, **extra):
+    """
+    Create result record of a scenario
+    @param duration: Wall-clock time of the scenario in seconds
+    @param operations: Number of operations done, e.g. machines processed
+    @param samples: Latencies of single operations in seconds. Default value: None
+    """
+    result = {'scenario': scenario,
+              'hosts': hosts,
+              'machines': machines,
+              'duration': round(duration, 6),
+              'operations': operations,
+              'throughput': round(operations / duration, 3) if duration > 0 else None,
+              }
+    if samples:
+        for percent in [50, 95, 99]:
+            result['p%d'%percent] = round(getPercentile(samples, percent), 6)
+    result.update(extra)
+    return result
+
+class Benchmark():
+    """
+    Scenarios run on a fleet of given size
+    """
+    def __init__(self, hosts, machines, workdir, groupSize=200, lookups=10000, batchHosts=10, jobs=None):
+        """
+        @param hosts: Number of simulated hosts
+        @param machines: Number of machines of every host
+        @param workdir: Directory for generated configuration and batch files
+        @param groupSize: Maximum number of machines in group of group scenarios. Default value: 200
+        @param lookups: Number of credential lookups. Default value: 10000
+        @param batchHosts: Number of hosts used by batch scenario. Default value: 10
+        @param jobs: Number of workers of group commands. If None, interpreter default is used. Default value: None
+        """
+        self.hosts = hosts
+        self.machines = machines
+        self.workdir = workdir
+        self.groupSize = groupSize
+        self.lookups = lookups
+        self.batchHosts = batchHosts
+        self.jobs = jobs
+        self.interpreter = None
+        self.results = []
+
+    def getHostName(self, index):
+        return "host%03d"%index
+
+    def getMachineName(self, index):
+        return "vm%04d"%index
+
+    def writeConfiguration(self):
+        """ Every machine has credentials, every second one is also in group 'fleet' """
+        filename = path.join(self.workdir, "config_%dx%d.txt"%(self.hosts, self.machines))
+        with open(filename, 'w') as fp:
+            for host in range(self.hosts):
+                fp.write("host name=%s\n"%self.getHostName(host))
+            for host in range(self.hosts):
+                for mach in range(self.machines):
+                    fp.write("machine name=%s host=%s user=user%d password=secret\n"%(self.getMachineName(mach), self.getHostName(host), mach))
+                    if mach % 2:
+                        fp.write("machine name=%s host=%s group=fleet user=guser password=secret\n"%(self.getMachineName(mach), self.getHostName(host)))
+        return filename
+
+    def record(self, result):
+        self.results.append(result)
+        sys.stderr.write("%-15s %4d x %-5d %8.3f s %10s ops/s\n"%(result['scenario'], self.hosts, self.machines,
+                          result['duration'], result['throughput']))
+
+    def run(self):
+        try:
+            self.benchLoad()
+            self.benchListVms()
+            self.benchCredentials()
+            self.benchGroup()
+            self.benchBatch()
+        finally:
+            self.close()
+        return self.results
+
+    def benchLoad(self):
+        filename = self.writeConfiguration()
+        self.interpreter = Interpreter('WEBSERVICE')
+        self.interpreter.autoMode = True # Never prompt for credentials
+        self.interpreter.history = LatencyHistory(path.join(self.workdir, "latency.json"))
+        if self.jobs:
+            self.interpreter.maxWorkers = self.jobs
+        started = time.time()
+        with quiet():
+            self.interpreter.loadConfiguration(filename)
+        duration = time.time() - started
+        self.record(makeResult('load', self.hosts, self.machines, duration, self.hosts * self.machines,
+                               connected=len(self.interpreter.envs)))
+
+    def benchListVms(self):
+        """ Cold listing takes the inventory snapshot, warm listing reuses it """
+        for scenario in ['listvms-cold', 'listvms-warm']:
+            started = time.time()
+            with quiet():
+                self.interpreter.runArgs(['listhostvms'])
+            self.record(makeResult(scenario, self.hosts, self.machines, time.time() - started, self.machines))
+
+    def benchCredentials(self):
+        generator = random.Random(0)
+        hosts = self.interpreter.envs.values()
+        samples = []
+        started = time.time()
+        for index in range(self.lookups):
+            env = generator.choice(hosts)
+            machname = self.getMachineName(generator.randrange(self.machines))
+            lookupStarted = time.time()
+            self.interpreter.runInContext(env, self.interpreter.getCredentials, machname)
+            samples.append(time.time() - lookupStarted)
+        self.record(makeResult('credentials', self.hosts, self.machines, time.time() - started, self.lookups, samples))
+
+    def benchGroup(self):
+        """ Group commands on machines of group 'fleet', limited to group size """
+        interpreter = self.interpreter
+        fleet = interpreter.groups['fleet']
+        members = sorted((host, machname) for host, machines in fleet.getMachines().items() for machname in machines)
+        selected = members[::max(1, len(members) // self.groupSize)][:self.groupSize]
+        with quiet():
+            interpreter.cmdCreateGroup(['bench'])
+        for host, machname in selected:
+            interpreter.groups['bench'].addMachine(host, machname)
+        for cmd in ['start', 'restart', 'poweroff']:
+            interpreter.metrics.clear()
+            started = time.time()
+            with quiet():
+                interpreter.runArgs([cmd, 'bench'])
+            duration = time.time() - started
+            merged = Histogram() # Latencies of single machines on all hosts
+            for key, histogram in interpreter.metrics.getHistograms('group'):
+                merged.merge(histogram)
+            result = makeResult('group-' + cmd, self.hosts, self.machines, duration, len(selected))
+            if merged.count:
+                for percent in [50, 95, 99]:
+                    result['p%d'%percent] = round(merged.getPercentile(percent), 6)
+            self.record(result)
+
+    def benchBatch(self):
+        """ Background starts on several hosts followed by group power off """
+        hosts = sorted(self.interpreter.envs.keys())[:self.batchHosts]
+        filename = path.join(self.workdir, "batch_%dx%d.txt"%(self.hosts, self.machines))
+        steps = 0
+        with open(filename, 'w') as fp:
+            for host in hosts:
+                fp.write("switchhost %s\n"%host)
+                for machname in sorted(self.interpreter.groups['bench'].getMachines().get(host, {}))[:5]:
+                    fp.write("start %s &\n"%machname)
+                    steps += 1
+            fp.write("wait\n")
+            fp.write("poweroff bench\n")
+        started = time.time()
+        with quiet():
+            self.interpreter.runArgs(['batch', filename])
+        self.record(makeResult('batch', self.hosts, self.machines, time.time() - started, steps + 1,
+                               batchHosts=len(hosts)))
+
+    def close(self):
+        if self.interpreter is None:
+            return
+        envs = self.interpreter.envs.values()
+        for env in envs:
+            env.events.stop()
+        for env in envs: # Watchers must not outlive the interpreter
+            if env.events.thread is not None:
+                env.events.thread.join()
+        self.interpreter = None
+
+def getCommit():
+    """ Commit of the benchmarked tree, None outside of git repository """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=devnull,
+                                           cwd=path.dirname(path.realpath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parseSizes(text):
+    """ Parse sizes in format HOSTSxMACHINES separated by comma, e.g. 1x10,10x100 """
+    sizes = []
+    for size in text.split(','):
+        hosts, machines = size.lower().split('x')
+        sizes.append((int(hosts), int(machines)))
+    return sizes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of interpreter operations on simulated hosts")
+    parser.add_argument("-s", "--sizes", dest="sizes", default="1x10,10x100,100x1000", help = "Fleet sizes in format HOSTSxMACHINES separated by comma. Default value: 1x10,10x100,100x1000")
+    parser.add_argument("-o", "--output", dest="output", default="benchmark_results.json", help = "JSON file with results. Default value: benchmark_results.json")
+    parser.add_argument("--latency", dest="latency", type=float, default=0.5, help = "Latency of every call to simulated server in miliseconds. Default value: 0.5")
+    parser.add_argument("--operation-time", dest="operation_time", type=float, default=0.05, help = "Duration of long operations on simulated server in seconds. Default value: 0.05")
+    parser.add_argument("--group-size", dest="group_size", type=int, default=200, help = "Maximum number of machines of group scenarios. Default value: 200")
+    parser.add_argument("--lookups", dest="lookups", type=int, default=10000, help = "Number of credential lookups. Default value: 10000")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, help = "Maximum number of machines processed concurrently by group commands")
+    args = parser.parse_args(sys.argv[1:])
+
+    try:
+        sizes = parseSizes(args.sizes)
+    except ValueError:
+        print "Sizes in wrong format, exiting..."
+        sys.exit(1)
+    SimulatedManager.configure(args.latency / 1000.0, 0.0, 0, args.operation_time, 0)
+    Environment.managerClass = SimulatedManager
+    workdir = tempfile.mkdtemp(prefix="vmbench")
+    report = {'commit': getCommit(),
+              'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+              'parameters': {'latency': args.latency, 'operationTime': args.operation_time,
+                             'groupSize': args.group_size, 'lookups': args.lookups, 'jobs': args.jobs},
+              'results': [],
+              }
+    try:
+        for hosts, machines in sizes:
+            SimulatedManager.machines = machines
+            benchmark = Benchmark(hosts, machines, workdir, args.group_size, args.lookups, jobs=args.jobs)
+            report['results'] += benchmark.run()
+    finally:
+        shutil.rmtree(workdir, True)
+    with open(args.output, 'w') as fp:
+        json.dump(report, fp, indent=1, sort_keys=True)
+    print "Results written to " + args.output
@@ -13,18 +13,44 @@ import argparse # Argument parser
 from datetime import datetime
 from collections import OrderedDict
 import copy # Backup current configuration, see loadConfiguration method
+import hashlib # Names of transfer journals
+import json # Results of guest command fan-out
 import os # OS features
 from os import path # Paths handling
 import re # Regex matches
+import select # Waiting for user input of guest shell
 import shlex # shell-like parser
 import sys # Basic system features handling
+import threading # Worker thread context
 import time # Used for sleep
-from vboxapi import * # VirtualBox API module
+try: # VirtualBox API module, not needed by simulated backend
+    from vboxapi import VirtualBoxManager
+except ImportError:
+    VirtualBoxManager = None
 
 # Extend path for own modules
 sys.path.append(path.dirname(path.dirname(path.realpath(sys.argv[0]))))
 from modules.errors import *  # Custom exceptions
 from modules.globals import * # Some global constants
+from modules.workers import * # Worker pool for concurrent commands
+from modules.connection import * # Persistent webservice connections
+from modules.progress import * # Tracker of running operations
+from modules.cache import * # Cache of machine handles
+from modules.events import * # VirtualBox event listener
+from modules.states import * # Machine states kept up to date by events
+from modules.inventory import * # Snapshot of host machines
+from modules.sessions import * # Machine session locks
+from modules.scheduler import * # Parallel batch execution
+from modules.history import * # Latency history of commands
+from modules.logger import * # Structured log of automatic mode
+from modules.metrics import * # Latency histograms
+from modules.credentials import * # Index of machine credentials
+from modules.guestio import * # Streaming of guest process output
+from modules.transfer import * # Chunked file transfer between host and guest
+from modules.throttle import * # Bandwidth limit of appliance export and import
+from contextlib import contextmanager # Timed session locks
+from modules.simulator import SimulatedManager # Stand-in of VirtualBox API
+from modules.watcher import FileWatcher # Reload of changed configuration
 
 try: # Modules for history and autocompletion support
     import readline   # GNU readline
@@ -38,9 +64,13 @@ class commandCompleter(rlcompleter.Completer):
         """
         Class for command autocompletion
         """
-        def __init__(self, cmds):
-            """ Initiate with supported commands """
+        def __init__(self, cmds, argCompleter=None):
+            """
+            Initiate with supported commands
+            @param argCompleter: Callable returning possible argument values. Default value: None
+            """
             rlcompleter.Completer.__init__(self, cmds)
+            self.argCompleter = argCompleter
 
         def complete(self, text, state):
             """ Overload complete method """
@@ -71,6 +101,10 @@ class commandCompleter(rlcompleter.Completer):
                     for cmd in cmds:
                         if cmd[:length] == text: # Match found
                             matches.append(cmd)
+            elif self.argCompleter is not None: # Complete machine, group or host
+                for arg in self.argCompleter():
+                    if arg.startswith(text):
+                        matches.append(arg)
             return matches
 
 class Group():
@@ -81,6 +115,7 @@ class Group():
     def __init__(self, name):
         self.name = name
         self.machines = {}
+        self.index = None # Credential index following changes of this group
         return
     
     def addMachine(self, host, machname, user=None, password=None):
@@ -102,6 +137,8 @@ class Group():
             self.machines[host] = {machname: credentials}
         else:
             self.machines[host][machname] = credentials
+        if self.index is not None:
+            self.index.setGroupMachine(self.name, host, machname, credentials)
         return
     
     def removeMachine(self, host, machname = None):
@@ -114,9 +151,15 @@ class Group():
         """
         if host in self.machines.keys(): # Host exists
             if machname is None: # Remove the whole host
-                del self.machines[host]
+                removed = self.machines.pop(host).keys()
             elif machname in self.machines[host].keys(): # Remove a single machine       
                 del self.machines[host][machname]
+                removed = [machname]
+            else:
+                removed = []
+            if self.index is not None:
+                for name in removed:
+                    self.index.removeGroupMachine(self.name, host, name)
         return
     
     def getName(self):
@@ -129,9 +172,14 @@ class Environment():
     """
     A class representing a single host machine and stores all neccessary data
     """
-    def __init__(self, values):
+    managerClass = VirtualBoxManager # Backend creating VirtualBox objects, see --backend option
+    connectTimeout = hostConnectTimeout # Maximum time in seconds to wait for connection to webservice
+
+    def __init__(self, values, connect=True):
         """
         Constructor
+        @param connect: Connect to the server now. If False, the connection is
+                        made by open method or by the first network command. Default value: True
         @param values: Values passed in dictionary. Supported values are:
                        host: hostname or port of the server. Obligatory
                        port: port of HTTP server on host. Default value 18083
@@ -152,7 +200,7 @@ class Environment():
         self.host = values.get('host')
         self.port = values.get('port') if values.get('port') else 18083 
         self.user = values.get('user') if values.get('user') else ""
-        self.password = values.get('password') if values.get('port') else ""
+        self.password = values.get('password') if values.get('password') else ""
         self.name = values.get('name') if (values.get('name') and len(values.get('name'))) else self.host
         self.style = values.get('style')
         self.remote = (self.style == 'WEBSERVICE')
@@ -166,22 +214,179 @@ class Environment():
         self.mgr = None
         self.vbox = None
         self.const = None
-        params = None
+        self.params = None
+        self.opening = None # Thread connecting to webservice
+        self.openError = None # Exception of the last failed connection attempt
+        self.openCondition = threading.Condition()
         if self.remote: # Connect via webservice?
             self.url = 'http://' + self.host + ':' + str(self.port)        
-            params = {'url': self.url,
-                      'user': self.user,
-                      'password': self.password,
-                      }
-        # Try to connect to remote server (or create local manager via COM)
-        mgr = VirtualBoxManager(self.style, params)
-        self.mgr = mgr
-        self.vbox = mgr.vbox
-        self.const = mgr.constants
+            self.params = {'url': self.url,
+                           'user': self.user,
+                           'password': self.password,
+                           }
+        self.connection = Connection(self, connectionIdleThreshold)
+        self.machines = {} # Dictionary to store machines credentials
+        self.index = None # Credential index following changes of machines
+
+        # Machine handles, references from previous session are invalid after reconnection
+        self.machineCache = LRUCache(machineCacheSize)
+        self.connection.addCallback(self.invalidateMachines)
+        self.connection.addInvalidator(self.invalidateMachines)
+        # Watch for machine (un)registration to keep the cache valid
+        self.events = EventWatcher(self)
+        self.events.addSubscribeCallback(self.invalidateMachines)
+        # Machine states are read from events, not from the server
+        self.states = StateTable(self)
+        self.inventory = Inventory(self, inventoryTTL)
+        # Shared sessions are reused by console commands
+        self.sessions = SessionManager(self, sessionIdleTimeout)
+        self.connection.addCallback(self.sessions.releaseAll)
+        self.connection.addInvalidator(self.sessions.releaseAll)
+        self.events.addSubscribeCallback(self.states.invalidate)
+        self.connection.addCallback(self.events.resubscribe)
+        if connect:
+            self.open()
+
+    def isOpen(self):
+        """ Check if VirtualBox manager of this host was created """
+        return self.mgr is not None
+
+    def open(self, timeout=None):
+        """
+        Connect to the server (or create local manager via COM) if it was not
+        done yet. Webservice is connected in a background thread, so an
+        unreachable host blocks the caller only for the timeout. Concurrent
+        callers wait for the same connection attempt.
+        @param timeout: Maximum time to wait in seconds. If None, connectTimeout
+                        is used. Default value: None
+        @return: vbox object
+        @raise EnvironmentException: Connection failed or timed out
+        """
+        if self.managerClass is None:
+            raise EnvironmentException("VirtualBox API (vboxapi) is not available, use '--backend sim' to run without VirtualBox")
+        if not self.remote: # COM objects must be created in the thread which uses them
+            with self.openCondition:
+                if self.mgr is None:
+                    self.setManager(self.managerClass(self.style, self.params))
+                return self.vbox
+        timeout = self.connectTimeout if timeout is None else timeout
+        end = time.time() + timeout
+        with self.openCondition:
+            if self.mgr is not None:
+                return self.vbox
+            self.startOpen()
+            while self.mgr is None and self.opening is not None and time.time() < end:
+                self.openCondition.wait(min(0.2, max(0.01, end - time.time())))
+            if self.mgr is not None:
+                return self.vbox
+            if self.opening is not None:
+                raise EnvironmentException("Connection to host %s timed out after %g s"%(self.name, timeout))
+            raise EnvironmentException("Could not connect to host %s: %s"%(self.name, str(self.openError)))
+
+    def startOpen(self):
+        """
+        Start connecting to webservice in background if it is not connected
+        or being connected yet. The call does not wait for the connection.
+        """
+        with self.openCondition:
+            if self.mgr is not None or self.opening is not None or not self.remote:
+                return
+            if self.managerClass is None:
+                return
+            self.openError = None
+            self.opening = threading.Thread(target=self.connectManager)
+            self.opening.daemon = True
+            self.opening.start()
+
+    def getState(self):
+        """ Connection state shown in prompt """
+        if self.mgr is not None:
+            return "not connected" if self.connection.disconnected else "connected"
+        if self.opening is not None:
+            return "connecting"
+        return "not connected"
+
+    def getPrompt(self):
+        """ Prompt with connection state of this host """
+        return self.prompt[:-1] + " [" + self.getState() + "]>"
+
+    def connectManager(self):
+        """ Body of thread connecting to webservice """
+        mgr = None
+        error = None
+        try:
+            mgr = self.managerClass(self.style, self.params)
+        except Exception as e:
+            error = e
+        with self.openCondition:
+            try:
+                if error is None:
+                    self.setManager(mgr)
+            except Exception as e:
+                error = e
+            self.openError = error
+            self.opening = None
+            self.openCondition.notify_all()
+
+    def setManager(self, mgr):
+        """
+        Store VirtualBox objects of created manager. Event handlers are registered
+        after the first connection, because they need VirtualBox constants.
+        Condition must be held.
+        """
         # Something went wrong during initialization
-        if not any([self.mgr, self.vbox, self.const]):
+        if not any([mgr, mgr.vbox, mgr.constants]):
             raise EnvironmentException("Failed to initialize environment")
-        self.machines = {} # Dictionary to store machines credentials
+        self.vbox = mgr.vbox
+        self.const = mgr.constants
+        self.mgr = mgr # Set last, other threads test it
+        self.events.addHandler(self.const.VBoxEventType_OnMachineRegistered, 'IMachineRegisteredEvent', self.onMachineRegistered)
+        self.states.register(self.events)
+        self.sessions.register(self.events)
+        self.events.start()
+
+    def findMachine(self, machname):
+        """
+        Find machine by its name or UUID. Handles are cached, so repeated
+        lookups do not need to contact the server.
+        @param machname: Machine name or UUID
+        @return: IMachine object
+        """
+        machine = self.machineCache.get(machname)
+        if machine is None:
+            machine = self.vbox.findMachine(machname)
+            self.machineCache.put(machname, machine)
+        return machine
+
+    def withMachine(self, machname, func):
+        """
+        Call function with machine handle. Cached handle can be stale (e.g.
+        object released by the server), then it is dropped and the function
+        is called once more with handle found again. Function must use
+        the handle before any other side effect.
+        @param machname: Machine name or UUID
+        @param func: Function of IMachine object
+        @return: Value returned by the function
+        """
+        machine = self.machineCache.get(machname)
+        if machine is not None:
+            try:
+                return func(machine)
+            except Exception as e:
+                if not self.connection.isStaleHandle(e):
+                    raise
+            self.machineCache.discard(machname)
+        return func(self.findMachine(machname))
+
+    def invalidateMachines(self):
+        """ Drop all cached machine handles """
+        self.machineCache.clear()
+
+    def onMachineRegistered(self, event):
+        """ Handler of machine registration event """
+        self.inventory.invalidate()
+        if not event.registered: # Cached handle of unregistered machine is stale
+            self.invalidateMachines()
     
     def addMachine(self, machname, user=None, password=None):
         """
@@ -193,6 +398,8 @@ class Environment():
             return
         if machname not in self.machines.keys():
             self.machines[machname] = {'user': user, 'password': password}
+            if self.index is not None:
+                self.index.setHostMachine(self.name, machname, self.machines[machname])
     
     def removeMachine(self, machname):
         """
@@ -201,6 +408,8 @@ class Environment():
         """
         if machname in self.machines.keys():
             del self.machines[machname]
+            if self.index is not None:
+                self.index.removeHostMachine(self.name, machname)
                           
     def getName(self):
         return self.name
@@ -208,29 +417,81 @@ class Environment():
     def getMachines(self):
         return self.machines
         
-class Interpreter():
+class Interpreter(object):
     """
     Class which executes all comands
     """
     def __init__(self, style):
         self.envs = {} # Existing environments
         self.groups = {} # Existing groups
+        self.credentials = CredentialIndex() # Credentials of machines of environments and groups
         
         self.isRemote = (style == 'WEBSERVICE')
         self.commands = self.createCommands()
+        self.readOnly = set(["listhostvms", "listrunningvms", "refresh", "host"]) # Commands repeated after reconnection
+        self.machineCommands = set(["removevm", "clone", "start", "restart", "pause", "resume", "poweroff", "powerbutton",
+                                    "sleepbutton", "exportvm", "gcmd", "gshell", "copyto", "copyfrom", "setram", "setcpus"]) # Commands whose first argument is machine
+        self.fanouts = {'gcmd': self.fanoutGcmd, 'distribute': self.fanoutDistribute, # Commands with own handling of groups
+                        'exportvm': self.fanoutExportVM, 'importvm': self.fanoutImportVM}
 
         self.autoMode = False
+        self.logwriter = None # Log of automatic mode
+        self.context = threading.local() # Per-thread environment of group workers
+        self.inputLock = threading.Lock() # Serializes user prompts from worker threads
+        self.maxWorkers = maxWorkers
+        self.lazyConnect = False # Hosts of configuration are connected by the first network command
+        self.configFile = None # Last loaded configuration file, used by reload
+        self.configHosts = set() # Hosts and groups defined by configuration files, reload may remove them
+        self.configGroups = set()
+        self.configWatcher = None
+        self.pendingReload = None # Changed configuration file found by watcher
+        self.tracker = ProgressTracker()
+        self.history = LatencyHistory(os.path.join(os.path.expanduser("~"), ".managerlatency"))
+        self.metrics = Metrics()
+        self.metricsFile = None # Prometheus export written at the end of batch
         self.active = None # There is no active host now
+
+    def getActive(self):
+        """
+        Return the environment commands are executed on. Worker threads
+        carry their own environment, other threads use the global active host.
+        """
+        env = getattr(self.context, 'env', None)
+        return env if env is not None else self.activeEnv
+
+    def setActive(self, env):
+        self.activeEnv = env
+
+    active = property(getActive, setActive)
+
+    def inWorker(self):
+        """ Check if the current thread executes a part of group command """
+        return getattr(self.context, 'env', None) is not None
+
+    def getCommand(self):
+        """ Name of command executed by the current thread """
+        return getattr(self.context, 'command', None)
     
     def setCmdAutoCompletion(self): 
         """
         Create and set auto completer
         """
         cmdDict = dict((key, None) for key in self.commands.keys())
-        completer = commandCompleter(cmdDict)
+        completer = commandCompleter(cmdDict, self.getCompletions)
         readline.set_completer(completer.complete)
         readline.parse_and_bind("tab: complete")
     
+    def getCompletions(self):
+        """
+        Return names usable as command arguments. Machines are taken from
+        inventory snapshot of active host, server is never contacted.
+        """
+        names = self.groups.keys() + self.envs.keys()
+        snapshot = self.active.inventory.peek() if self.active else None
+        if snapshot is not None:
+            names += [record.name for record in snapshot.machines]
+        return sorted(set(names))
+
     def getGroup(self, name):
         return self.groups.get(name)
         
@@ -240,64 +501,143 @@ class Interpreter():
             return
         
         self.envs[env.name] = env
+        self.credentials.addEnvironment(env)
     
     def getCredentials(self, machname):
         """
         Try to find machine credentials in known machines. If not found,
-        prompt user to insert them
-        """
-        # Search the machines of current environment
-        if machname in self.active.getMachines().keys():
-            user = self.active.getMachines()[machname]['user']
-            password = self.active.getMachines()[machname]['password']
-            if len(user) and len(password):
-                return user, password
-        # Search for the machine in groups
-        for group in self.groups.values():
-            for host, machines in group.getMachines().items():
-                if host != self.active.name:
-                    continue                            
-                for mname, credentials in machines.items():
-                    if machname == mname:
-                        user = credentials['user']
-                        password = credentials['password']
-                        if len(user) and len(password):
-                            return user, password
+        prompt user to insert them. Credentials registered to the host take
+        precedence over groups, groups are searched in order of creation.
+        """
+        credentials = self.credentials.lookup(self.active.name, machname)
+        if credentials is not None:
+            return credentials
         # Nothing found, prompt user
         if self.autoMode:
             user = ""
             password = ""
         else:
-            user = raw_input("User: ")
-            password = raw_input("Password: ")
+            with self.inputLock: # Workers must not prompt at the same time
+                if self.inWorker():
+                    print "Credentials for machine %s on host %s"%(machname, self.active.name)
+                user = raw_input("User: ")
+                password = raw_input("Password: ")
         return user, password
     
-    def groupCommand(self, groupname, cmd, args):
+    def groupCommand(self, groupname, cmd, args, workers=None, report=True, perHost=None):
         """
-        Execute a command for group of machines
+        Execute a command for group of machines. Machines are processed
+        concurrently, each worker uses the environment of machine's host
+        and the global active host is left untouched.
         @param groupname: Group whose machines will be used
         @param cmd: Command to be executed
         @param args: Command arguments  
+        @param workers: Maximum number of machines processed at once. If None, maxWorkers is used. Default value: None
+        @param report: Print table with results. Default value: True
+        @param perHost: Maximum number of machines of one host processed at once. If None, only workers are limited. Default value: None
+        @return: List of TaskResult objects, key of each result is (host, machine) tuple
+        """
+        return self.machinesCommand(self.groups.get(groupname).getMachines(), cmd, args, workers, report, perHost, groupname)
+
+    def machinesCommand(self, machines, cmd, args, workers=None, report=True, perHost=None, groupname=None):
         """
-        machines = self.groups.get(groupname).getMachines()
-        origHost = self.active.name
+        Execute a command for machines of several hosts, see groupCommand
+        @param machines: Dictionary host -> dictionary of machine names
+        @param groupname: Group logged with results. Default value: None
+        """
+        command = self.getCommand() or cmd.__name__
+        pool = WorkerPool(workers or self.maxWorkers)
+        tasks = [] # Tasks of every host
         for host in machines.keys():
             if host not in self.envs:
                 print "Unexisting host " + host
                 continue
-            if self.active is not self.envs[host]: # Other host then actual -> switch
-                self.cmdSwitchHost([host])
-            for machname in machines[host].keys():
-                args[0] = machname
-                try:
-                    cmd(args) # Execute a command with arguments
-                except Exception as e:
-                    if self.autoMode:
-                        self.log("ERROR: Error while executing '%s' command with arguments '%s'"%(cmd.__name, args))
-                    print str(e)
-                    
-        self.active = self.envs[origHost] # Switch back to original host
-        return 0 
+            limit = threading.Semaphore(perHost) if perHost else None
+            tasks.append([((host, machname), self.workerTask(self.envs[host], cmd, [machname] + args[1:], limit))
+                          for machname in machines[host].keys()])
+        positions = dict((key, number) for number, key in enumerate(key for hostTasks in tasks for key, task in hostTasks))
+        if perHost: # Hosts take turns, so workers do not all wait for the limit of one host
+            while any(tasks):
+                for hostTasks in tasks:
+                    if len(hostTasks):
+                        pool.submit(*hostTasks.pop(0))
+        else:
+            for hostTasks in tasks:
+                for key, task in hostTasks:
+                    pool.submit(key, task)
+        results = sorted(pool.run(), key=lambda result: positions[result.key]) # Results are ordered by host
+        for result in results: # Time of every machine of the fan-out
+            if result.getLatency() is not None:
+                self.metrics.observe("group", command, result.key[0], result.getLatency())
+        for result in results:
+            if not self.autoMode:
+                break
+            if result.isOk():
+                self.log("Group command finished", command=cmd.__name__, host=result.key[0], machine=result.key[1],
+                         duration=result.getLatency(), outcome=result.status, group=groupname)
+            else:
+                self.log("ERROR: Error while executing '%s' command for machine '%s' on host '%s'. Details: %s"
+                         %(cmd.__name__, result.key[1], result.key[0], result.error),
+                         command=cmd.__name__, host=result.key[0], machine=result.key[1],
+                         duration=result.getLatency(), outcome=result.status, group=groupname)
+        if report:
+            self.printResults(results)
+        return results
+
+    def workerTask(self, env, cmd, args, limit=None):
+        """
+        Create a task which executes a command in context of given environment
+        @param env: Environment the command is executed on
+        @param cmd: Command to be executed
+        @param args: Command arguments
+        @param limit: Semaphore acquired while the command runs. Default value: None
+        """
+        command = self.getCommand()
+        retry = command in self.readOnly
+        def task():
+            self.context.command = command
+            if limit is None:
+                return self.runInContext(env, env.connection.call, cmd, args, retry)
+            with limit:
+                return self.runInContext(env, env.connection.call, cmd, args, retry)
+        return task
+
+    def runInContext(self, env, func, *args):
+        """
+        Call a function in current thread with given environment as the active one
+        @param env: Environment used by commands called from the function
+        @param func: Function to call
+        """
+        previous = getattr(self.context, 'env', None)
+        self.context.env = env
+        if env.mgr is not None and hasattr(env.mgr, 'initPerThread'):
+            env.mgr.initPerThread() # COM needs initialization in every thread
+        try:
+            return func(*args)
+        finally:
+            if env.mgr is not None and hasattr(env.mgr, 'deinitPerThread'):
+                env.mgr.deinitPerThread()
+            self.context.env = previous
+
+    def printResults(self, results):
+        """
+        Print a table with results of group command
+        @param results: List of TaskResult objects with (host, machine) keys
+        """
+        if not len(results):
+            print "Group contains no machines"
+            return
+        print "%-20s %-24s %-8s %10s %-12s %s"%("Host", "Machine", "Status", "Time [s]", "State", "Error")
+        for result in results:
+            host, machname = result.key
+            latency = result.getLatency()
+            latency = "%.2f"%latency if latency is not None else "-"
+            state = "-"
+            states = self.envs[host].states
+            if states.isCurrent(): # Do not contact server only for the table
+                record = states.getRecord(machname)
+                state = states.getStateName(record['state']) if record else "-"
+            print "%-20s %-24s %-8s %10s %-12s %s"%(host, machname, result.status, latency, state, result.error or "")
         
     def runCommandWithArgs(self, args):
         cmd = args[0] # Command name
@@ -308,22 +648,54 @@ class Interpreter():
             print "Unknown command %s. Use 'help' to get commands"%cmd
             
             if self.autoMode:
-                self.log("Using unknown command %s."%cmd)
+                self.log("Using unknown command %s."%cmd, command=cmd, outcome="UNKNOWN")
                 
             return 0
-        if self.active.remote and ci[1] == "network": # Command uses server, make sure it stays connected
-            self.cmdReconnect([])
-        if len(args) and ci[1] == "network" and args[0] in self.groups.keys():
-            # Group command
-            retval = self.groupCommand(args[0], ci[2], args)
-        else:
-            retval = ci[2](args) # Execute command for a single machine
+        isGroup = len(args) > 0 and ci[1] == "network" and args[0] in self.groups.keys()
+        host = self.active.name if self.active else None
+        label = "@" + args[0] if isGroup else host # Fan-out of group is not bound to one host
+        machname = args[0] if cmd in self.machineCommands and len(args) and not isGroup else None # Logged machine
+        previous = self.getCommand()
+        self.context.command = cmd
+        started = time.time()
+        try:
+            if isGroup and cmd in self.fanouts:
+                # Command has its own group mode
+                retval = self.fanouts[cmd](args)
+            elif isGroup:
+                # Group command, every worker checks connection of its host
+                self.groupCommand(args[0], ci[2], args)
+                retval = 0
+            elif ci[1] == "network" and self.active.remote:
+                # Command uses server, reconnect only if the session was lost
+                retval = self.active.connection.call(ci[2], args, cmd in self.readOnly)
+            else:
+                if ci[1] == "network": # Local host is connected by the first network command
+                    self.active.connection.ensure()
+                retval = ci[2](args) # Execute command for a single machine
+        except Exception as e:
+            if self.autoMode and cmd != 'batch':
+                self.log("Command failed", command=cmd, host=host, machine=machname,
+                         duration=time.time() - started, outcome="FAILED", error=str(e))
+            raise
+        finally:
+            self.context.command = previous
+            if cmd != 'batch':
+                self.metrics.observe("dispatch", cmd, label, time.time() - started)
+        if cmd != 'batch': # Batch duration says nothing about next batch
+            duration = time.time() - started
+            self.history.record(cmd, duration, host, isGroup)
+            if self.autoMode:
+                self.log("Command finished", command=cmd, host=host, machine=machname,
+                         duration=duration, outcome="OK", group=isGroup)
         return retval
         
     def runCmd(self, cmd):
         if len(cmd) == 0:
             return 0
-        args = shlex.split(cmd)
+        return self.runArgs(shlex.split(cmd))
+
+    def runArgs(self, args):
         if len(args) == 0:
             return 0
         if self.active is None and args[0] != 'addhost':
@@ -331,17 +703,23 @@ class Interpreter():
             return 0
         return self.runCommandWithArgs(args)
 
-    def run(self, batch_file=None):
+    def run(self, batch_file=None, dryRun=False):
         """
         Main method of interpreter. 
         @param batch_file: Batch file to process. If None, then interactive mode is used. 
+        @param dryRun: Only print plan of batch file, do not execute it. Default value: False
         """
         global historySupport, cmdCompleter, maxHistoryLen
         if batch_file:
             # Run in auto mode
             self.autoMode = True
-            self.logfile = open('manager_log.txt', 'w')
-            self.cmdBatch([batch_file])
+            self.logwriter = LogWriter(logFile, logMaxBytes, logBackups, logFlushInterval)
+            try:
+                self.cmdBatch(['--dry-run', batch_file] if dryRun else [batch_file])
+            finally:
+                if self.metricsFile and not dryRun:
+                    self.exportMetrics(self.metricsFile)
+                self.logwriter.close()
             return
         if self.active is None:
             print "Program is not connected to any host, please add some with 'addhost' command"
@@ -357,8 +735,9 @@ class Interpreter():
         import traceback
         while True: # Interactive mode
             try:
-                prompt = self.active.prompt if self.active else ">" 
+                prompt = self.active.getPrompt() if self.active else ">" 
                 cmd = raw_input(prompt)
+                self.applyPendingReload() # Configuration changes are applied between commands
                 retval = self.runCmd(cmd)
                 if retval != 0:
                     break
@@ -367,181 +746,433 @@ class Interpreter():
             except EOFError:
                 print "Violently killed, exiting"
                 break
+            except EnvironmentException as e: # Host is not reachable, the next command tries again
+                print str(e)
             except Exception as e: # Something went wrong during the command execution
                 traceback.print_exc()
                 #print str(e) # Print the error, but do not break the loop
                 
         if historySupport: # Interpreter ended, store history
             readline.write_history_file(hist_file) 
+        self.history.save()
               
+    @contextmanager
     def lockSession(self, machname):
         """
-        Creates a new session and lock the machine
+        Shared lock of the machine, yields (machine, session) tuple. Session
+        is reused by consecutive commands for the same machine.
         @param machname: Machine to lock 
         """
-        vbox = self.active.vbox
-        const = self.active.const
-        machine = vbox.findMachine(machname)
-        session = self.active.mgr.getSessionObject(vbox) # Create new session object
-        machine.lockMachine(session, const.LockType_Shared) # Lock the machine
-        return machine, session
+        env = self.active
+        started = time.time()
+        with env.sessions.shared(machname) as locked:
+            self.metrics.observe("lock", self.getCommand(), env.name, time.time() - started)
+            yield locked
+
+    @contextmanager
+    def lockWrite(self, machname):
+        """
+        Write lock of the machine, yields (machine, session) tuple. Session
+        is unlocked when the block ends.
+        @param machname: Machine to lock 
+        """
+        env = self.active
+        started = time.time()
+        with env.sessions.write(machname) as locked:
+            self.metrics.observe("lock", self.getCommand(), env.name, time.time() - started)
+            yield locked
         
+    @contextmanager
+    def lockGuest(self, machname, user, password):
+        """
+        Guest session of the machine, yields (machine, session, guestSession)
+        tuple. Guest sessions are pooled, so consecutive guest commands
+        with the same credentials skip the logon.
+        @param machname: Machine to lock
+        @param user: Guest user
+        @param password: Password of guest user
+        """
+        env = self.active
+        started = time.time()
+        with env.sessions.guest(machname, user, password) as locked:
+            self.metrics.observe("lock", self.getCommand(), env.name, time.time() - started)
+            yield locked
+
     def createCommands(self):   
         """
         Create a dictionary with supported commands. Some of them are not supported
-        when using COM model.
+        when using COM model. Every command is described by tuple (help, type,
+        method, (minimal argument count, maximal argument count or None)).
         """
         
-        commands = {"help": ("Prints this help", "local", self.cmdHelp),
-                    "createvm": ("Create a virtual machine", "network", self.cmdCreateVM),
-                    "removevm": ("Remove a virtual machine", "network",self.cmdRemoveVM),
-                    "start": ("Start a virtual machine", "network",self.cmdStartVM),
-                    "restart": ("Restart virtual machine", "network",self.cmdRestartVM),
-                    "pause": ("Pause virtual machine", "network",self.cmdPause),            
-                    "resume": ("Resume virtual machine", "network",self.cmdResume),
-                    "poweroff": ("Power off a virtual machine", "network",self.cmdPowerOff),
-                    "powerbutton": ("Power off a virtual machine", "network",self.cmdPowerButton),
-                    "sleepbutton": ("Sleep a virtual machine", "network",self.cmdSleepButton),                  
-                    "exportvm": ("Export virtual machine to given destination", "network",self.cmdExportVM),
-                    "importvm": ("Import virtual machine from appliance", "network", self.cmdImportVM),
-                    "listhostvms": ("List virtual machines on current host", "network", self.cmdListVms),
-                    "listrunningvms": ("List running virtual machine on current host", "network", self.cmdListRunningVms),
-                    "gcmd": ("Execute a command on guest", "network", self.cmdGcmd),
-                    "gshell": ("Run an interactive shell on guest", "network", self.cmdGshell),
-                    "copyto": ("Copy file from host to virtual machine", "network", self.cmdCopyToMachine),
-                    "copyfrom": ("Copy file from virtual machine to host", "network", self.cmdCopyFromMachine),
-                    "batch": ("Run a batch file", "local", self.cmdBatch),
-                    "setram": ("Set RAM memory for virtual machine", "network", self.cmdSetRam),
-                    "setcpus": ("Set CPU count for virtual machine", "network", self.cmdSetCPU),
-                    "listknownvms": ("List known virtual machines", "local", self.cmdList),
-                    "host": ("List information about current host", "network", self.cmdHost),
-                    "sleep": ("Sleep for a period of time", "local", self.cmdSleep),
-                    "groups": ("Print existing groups", "local", self.cmdGroups),
-                    "creategroup": ("Create a new group", "local", self.cmdCreateGroup),
-                    "removegroup": ("Remove group", "local", self.cmdRemoveGroup),
-                    "addtogroup": ("Add machine to existing local", "network", self.cmdAddToGroup),
-                    "removefromgroup": ("Remove machine existing group", "local", self.cmdRemoveFromGroup),
-                    "load": ("Load configuration from file", "local", self.cmdLoad),
-                    "save": ("Save current configuration to the file", "local", self.cmdSave),
-                    "exit": ("Exit program", "local", self.cmdExit),
-                    "quit": ("Quit program", "local", self.cmdExit),
-                    "test": ("Check if application is ready", "local", self.cmdTest),
+        commands = {"help": ("Prints this help", "local", self.cmdHelp, (0, None)),
+                    "createvm": ("Create a virtual machine", "network", self.cmdCreateVM, (0, 5)),
+                    "removevm": ("Remove a virtual machine", "network",self.cmdRemoveVM, (1, 1)),
+                    "clone": ("Create linked clones of a template machine from its snapshot", "network", self.cmdClone, (1, None)),
+                    "start": ("Start a virtual machine", "network",self.cmdStartVM, (1, 1)),
+                    "restart": ("Restart virtual machine", "network",self.cmdRestartVM, (1, 1)),
+                    "pause": ("Pause virtual machine", "network",self.cmdPause, (1, 1)),            
+                    "resume": ("Resume virtual machine", "network",self.cmdResume, (1, 1)),
+                    "poweroff": ("Power off a virtual machine", "network",self.cmdPowerOff, (1, 1)),
+                    "powerbutton": ("Power off a virtual machine", "network",self.cmdPowerButton, (1, 1)),
+                    "sleepbutton": ("Sleep a virtual machine", "network",self.cmdSleepButton, (1, 1)),                  
+                    "exportvm": ("Export virtual machine, group or list of machines to given destination", "network",self.cmdExportVM, (2, None)),
+                    "importvm": ("Import virtual machines from appliances", "network", self.cmdImportVM, (1, None)),
+                    "listhostvms": ("List virtual machines on current host", "network", self.cmdListVms, (0, 0)),
+                    "listrunningvms": ("List running virtual machine on current host", "network", self.cmdListRunningVms, (0, 0)),
+                    "refresh": ("Read machines of host again", "network", self.cmdRefresh, (0, 1)),
+                    "vmstate": ("Print state of machine, group or all machines on current host", "local", self.cmdVmState, (0, 1)),
+                    "gcmd": ("Execute a command on guest", "network", self.cmdGcmd, (2, None)),
+                    "gshell": ("Run an interactive shell on guest", "network", self.cmdGshell, (1, 1)),
+                    "copyto": ("Copy file from host to virtual machine", "network", self.cmdCopyToMachine, (3, None)),
+                    "copyfrom": ("Copy file from virtual machine to host", "network", self.cmdCopyFromMachine, (3, None)),
+                    "distribute": ("Copy file to all machines of group, machines having the file are skipped", "network", self.cmdDistribute, (3, None)),
+                    "batch": ("Run a batch file, commands ending with '&' run in background until 'wait'", "local", self.cmdBatch, (1, 2)),
+                    "setram": ("Set RAM memory for virtual machine", "network", self.cmdSetRam, (2, 2)),
+                    "setcpus": ("Set CPU count for virtual machine", "network", self.cmdSetCPU, (2, 2)),
+                    "listknownvms": ("List known virtual machines", "local", self.cmdList, (0, None)),
+                    "host": ("List information about current host", "network", self.cmdHost, (0, 0)),
+                    "sleep": ("Sleep for a period of time", "local", self.cmdSleep, (1, 1)),
+                    "groups": ("Print existing groups", "local", self.cmdGroups, (0, 0)),
+                    "creategroup": ("Create a new group", "local", self.cmdCreateGroup, (1, 1)),
+                    "removegroup": ("Remove group", "local", self.cmdRemoveGroup, (1, 1)),
+                    "addtogroup": ("Add machine to existing local", "local", self.cmdAddToGroup, (3, 5)),
+                    "removefromgroup": ("Remove machine existing group", "local", self.cmdRemoveFromGroup, (2, 3)),
+                    "load": ("Load configuration from file", "local", self.cmdLoad, (1, None)),
+                    "reload": ("Apply changes of configuration file, unchanged hosts stay connected", "local", self.cmdReload, (0, 1)),
+                    "save": ("Save current configuration to the file", "local", self.cmdSave, (1, None)),
+                    "exit": ("Exit program", "local", self.cmdExit, (0, None)),
+                    "quit": ("Quit program", "local", self.cmdExit, (0, None)),
+                    "test": ("Check if application is ready", "local", self.cmdTest, (0, None)),
+                    "diag": ("Print diagnostics of host connections", "local", self.cmdDiag, (0, 0)),
+                    "progress": ("List running and recently finished operations", "local", self.cmdProgress, (0, 0)),
+                    "cancel": ("Cancel running operation", "local", self.cmdCancel, (1, 1)),
+                    "stats": ("Print latency statistics of commands", "local", self.cmdStats, (0, 2)),
                    }
         if self.isRemote: # Additional commands
-            commands["addhost"] = ("Add a new host machine", "network", self.cmdAddHost)
-            commands["removehost"] = ("Remove host from known hosts", "network", self.cmdRemoveHost)
-            commands['switchhost'] = ('Switch to another host', "network", self.cmdSwitchHost)
-            commands['connect'] = ('Connect to remote Virtual Box', "network", self.cmdConnect)
-            commands['disconnect'] = ('Disconnect from remote Virtual Box', "network", self.cmdDisconnect)
-            commands['reconnect'] = ('Reconnects to a remote Virtual Box', "network", self.cmdReconnect)
+            commands["addhost"] = ("Add a new host machine", "local", self.cmdAddHost, (1, 5))
+            commands["removehost"] = ("Remove host from known hosts", "local", self.cmdRemoveHost, (1, 1))
+            commands['switchhost'] = ('Switch to another host', "local", self.cmdSwitchHost, (1, 1))
+            commands['connect'] = ('Connect to remote Virtual Box, all hosts if no host is given', "local", self.cmdConnect, (0, 1))
+            commands['disconnect'] = ('Disconnect from remote Virtual Box', "local", self.cmdDisconnect, (0, 1))
+            commands['reconnect'] = ('Reconnects to a remote Virtual Box', "local", self.cmdReconnect, (0, 1))
 
         return commands  
                                        
-    def progressBar(self, progress, update_time=1000):
+    def progressBar(self, progress, label="operation", onTrack=None):
         """
-        Display progress bar for some commands.
+        Register the operation in progress tracker and wait for it to end.
+        Status of all running operations is displayed meanwhile.
         @param progress: IProgress object (from VirtualBox API)
-        @param update_time: Time interval of progress update in miliseconds. Default value: 1000  
+        @param label: Description of the operation. Default value: "operation"
+        @param onTrack: Callable called with Operation object before waiting. Default value: None
         """
+        op = self.tracker.track(progress, label, mgr=self.active.mgr if self.active else None)
+        if onTrack is not None:
+            onTrack(op)
         try:
-            while not progress.completed:
-                percent = progress.percent
-                string = "[" + int(percent)/2 * "=" + ">]"
-                spaceCount = (60 - len(string) - 3) # Calculate spaces for correct indentation
-                print string + spaceCount * " " + str(percent) + "%\r", 
-                sys.stdout.flush()
-                progress.waitForCompletion(update_time)
-            
-            if int(progress.resultCode) != 0:
-                print "Error while performing command"
-                print str(progress.errorInfo.text)
+            with self.metrics.timer("progress", self.getCommand(), self.active.name if self.active else None):
+                self.tracker.wait(op)
         except KeyboardInterrupt:
-            if progress.cancelable:
+            if op.cancel():
                 print "Canceling..."
-                progress.cancel()
+                if not op.wait(progressCancelTimeout): # Cancel did not end, forget the operation
+                    self.tracker.drop(op)
             else:
                 print "Cannot cancel current task"
+            return 0
+        if not op.isOk():
+            if self.inWorker(): # Let the group command report the failure
+                raise CommandException(op.error)
+            print "Error while performing command"
+            print op.error
         return 0
 
+    def parseConfiguration(self, filename):
+        """
+        Parse configuration file without applying it.
+        @param filename: Path to file, where the configuration is stored 
+        @return: List of (line number, type, parameters) tuples, type is 'host' or 'machine'
+        @raise ConfigurationException: Syntax error in configuration file
+        """
+        entries = []
+        lineNum = 0
+        with open(filename, 'r') as conf_file:
+            for line in conf_file:
+                lineNum += 1
+                if len(line) < 3 or line.startswith('#'): # Empty line or comment
+                    continue
+                split = line.split()
+                if not len(split):
+                    continue
+                params = {'host': None,
+                          'name': None,
+                          'group': None,
+                          'user': None,
+                          'port': None,
+                          'password': None
+                          }
+                type = split[0]
+                if type not in ['host', 'machine']:
+                    raise ConfigurationException("Syntax error, line %d must start with keyword 'host' or 'machine', exiting"%lineNum, lineNum)
+                # Parse parameters
+                for element in split[1:]:
+                    try:
+                        paramName, paramVal = element.split('=')
+                    except ValueError:
+                        raise ConfigurationException("Parameter '%s' is not in format name=value, line %d"%(element, lineNum), lineNum)
+                    # Accept only first occurence of parameter
+                    if paramName in params.keys():
+                        if params[paramName] is None:
+                            params[paramName] = paramVal
+                        else:
+                            print "Parameter '%s' already set, ignoring this one. (line %d)"%(paramName, lineNum)
+                    else:
+                        print "Undefined parameter '%s' on line %d"%(paramName, lineNum)
+                        continue
+                if type == 'host':
+                    if params.get('group') is not None:
+                        raise ConfigurationException("Cannot assign host to group, line %d"%lineNum, lineNum)
+                    if params.get('name') is None:
+                        raise ConfigurationException("Missing host name, line %d"%lineNum, lineNum)
+                else:
+                    if params.get('port'):
+                        raise ConfigurationException("Cannot assign port to virtual machine, line %d"%lineNum, lineNum)
+                    if not params.get('host'):
+                        raise ConfigurationException("Missing machine hostname, line %d"%lineNum, lineNum)
+                entries.append((lineNum, type, params))
+        return entries
+
     def loadConfiguration(self, filename):
         """
         Load and parse configuration from config file.
         @param filename: Path to file, where the configuration is stored 
         """
+        self.configFile = filename
+        # Backup current state in case of error
+        backupEnvs = copy.copy(self.envs)
+        backupGroups = copy.copy(self.groups)
         try:
-            # Backup current state in case of error
-            backupEnvs = copy.copy(self.envs)
-            backupGroups = copy.copy(self.groups)
-            lineNum = 0
-            with open(filename, 'r') as conf_file:
-                for line in conf_file:
-                    lineNum += 1
-                    if len(line) < 3 or line.startswith('#'): # Empty line or comment
-                        continue
-                    split = line.split()
-                    if not len(split):
-                        continue
-                    params = {'host': None,
-                              'name': None,
-                              'group': None,
-                              'user': None,
-                              'port': None,
-                              'password': None
-                              }
-                    type = split[0]
-                    if type not in ['host', 'machine']:
-                        print "Syntax error, line %d must start with keyword 'host' or 'machine', exiting"%lineNum
-                        raise ValueError
-                    # Parse parameters
-                    for element in split[1:]:
-                        paramName, paramVal = element.split('=')
-                        # Accept only first occurence of parameter
-                        if paramName in params.keys():
-                            if params[paramName] is None:
-                                params[paramName] = paramVal
-                            else:
-                                print "Parameter '%s' already set, ignoring this one. (line %d)"%(paramName, lineNum)
-                        else:
-                            print "Undefined parameter '%s' on line %d"%(paramName, lineNum)
-                            continue
-                    # Configuring host
-                    if type == 'host':
-                        if params.get('group') is not None:
-                            print "Cannot assign host to group, ignoring this parameter, line %d"%lineNum
-                            raise ValueError
-                        if params.get('name') is None:
-                            print "Missing host name, line %d"%lineNum
-                            raise ValueError
-                        self.cmdAddHost([params.get('name'), params.get('port'), params.get('user'), params.get('password')])
-                    else: # Configuring machine
-                        if params.get('port'):
-                            print "Cannot assign port to virtual machine, line %d"%lineNum
-                            raise ValueError
-                        if not len(params.get('host', "")):
-                            print "Missing machine hostname, line %d"%lineNum
-                            raise ValueError
-                        
-                        if params['group'] is not None:
-                            if self.getGroup(params['group']) is None:
-                                group = Group(params['group'])
-                                self.groups[params['group']] = group
-                            self.groups[params['group']].addMachine(params.get('host'), params.get('name'), params['user'], params['password'])
-                        else:
-                            try:
-                                self.envs[params.get('host')].addMachine(params.get('name'), params.get('user'), params.get('password'))
-                            except KeyError:
-                                print "Host undefined, define it before registering a machine to it, line %d"%lineNum
-                                raise ValueError                
+            hosts = [] # Hosts are connected together when the whole file is parsed
+            for lineNum, type, params in self.parseConfiguration(filename):
+                # Configuring host
+                if type == 'host':
+                    env = self.createEnvironment([params.get('name'), params.get('port'), params.get('user'), params.get('password')])
+                    if env is not None:
+                        self.envs[env.getName()] = env
+                        self.credentials.addEnvironment(env)
+                        self.configHosts.add(env.getName())
+                        hosts.append(env)
+                elif params['group'] is not None: # Configuring machine in group
+                    self.configGroups.add(params['group'])
+                    if self.getGroup(params['group']) is None:
+                        group = Group(params['group'])
+                        self.groups[params['group']] = group
+                        self.credentials.addGroup(group)
+                    self.groups[params['group']].addMachine(params.get('host'), params.get('name'), params['user'], params['password'])
+                else:
+                    try:
+                        self.envs[params.get('host')].addMachine(params.get('name'), params.get('user'), params.get('password'))
+                    except KeyError:
+                        raise ConfigurationException("Host undefined, define it before registering a machine to it, line %d"%lineNum, lineNum)
+            if not self.lazyConnect:
+                self.connectHosts(hosts)
+            elif self.active is None and len(hosts):
+                self.active = hosts[0]
+                self.active.startOpen() # The host is likely needed first
+                print "This is the first known host (%s), setting it as active"%self.active.getName()
         except IOError:
             print "Could not open or read configuration file"
-        except (IndexError, ValueError): # Missing host or machine name
-            print "Error while loading configuration on line %d, restoring the state before loading configuration file"%lineNum
+        except ConfigurationException as e: # Missing host or machine name
+            print str(e)
+            print "Error while loading configuration on line %d, restoring the state before loading configuration file"%e.line
             # Restore the original configuration
             self.clearConfiguration()
             self.envs = backupEnvs
             self.groups = backupGroups
+            self.credentials.rebuild(self.envs.values(), self.groups.values())
         return
 
+    def readConfiguration(self, filename):
+        """
+        Build hosts, machines and groups described by configuration file
+        without touching the current state.
+        @param filename: Path to file, where the configuration is stored
+        @return: Tuple (host name -> addhost arguments, host name -> {machine -> credentials},
+                 group name -> Group object)
+        @raise ConfigurationException: Syntax error or machine of host which is neither defined nor known
+        """
+        hosts = OrderedDict()
+        machines = {}
+        groups = OrderedDict()
+        for lineNum, type, params in self.parseConfiguration(filename):
+            if type == 'host':
+                hosts.setdefault(params.get('name'), [params.get('name'), params.get('port'), params.get('user'), params.get('password')])
+            elif params['group'] is not None:
+                if params['group'] not in groups:
+                    groups[params['group']] = Group(params['group'])
+                groups[params['group']].addMachine(params.get('host'), params.get('name'), params['user'], params['password'])
+            else:
+                if params.get('host') not in hosts and params.get('host') not in self.envs:
+                    raise ConfigurationException("Host undefined, define it before registering a machine to it, line %d"%lineNum, lineNum)
+                user, password = params.get('user'), params.get('password')
+                if (user is None) != (password is None): # None or both credentials must be passed
+                    print "Missing user or password"
+                    continue
+                machines.setdefault(params.get('host'), {}).setdefault(params.get('name'), {'user': user, 'password': password})
+        return hosts, machines, groups
+
+    def reloadConfiguration(self, filename):
+        """
+        Apply changed configuration file. Only hosts, machines and groups which
+        differ from the current state are replaced, unchanged hosts keep their
+        connections, sessions and caches. Hosts and groups created by commands
+        are kept. The new state is built aside and applied at once, nothing
+        is changed if the file contains an error.
+        @param filename: Path to file, where the configuration is stored
+        @return: True if the configuration was applied, False otherwise
+        """
+        try:
+            hosts, machines, groups = self.readConfiguration(filename)
+        except IOError:
+            print "Could not open or read configuration file"
+            return False
+        except ConfigurationException as e:
+            print str(e)
+            print "Error while reloading configuration on line %d, configuration was not changed"%e.line
+            return False
+        envs = dict((name, env) for name, env in self.envs.items() if name not in self.configHosts)
+        added = []
+        changed = []
+        for name, args in hosts.items():
+            env = self.envs.get(name)
+            if env is not None and self.getHostValues(env) == self.getHostValues(args):
+                envs[name] = env # Keep connection
+                continue
+            (added if env is None else changed).append(name)
+            envs[name] = self.createEnvironment(args, False)
+        removed = [name for name in self.configHosts if name in self.envs and name not in hosts]
+        machineChanges = 0
+        desiredMachines = {}
+        for name, env in envs.items():
+            current = env.getMachines() if self.envs.get(name) is env else {}
+            if name in hosts:
+                desired = machines.get(name, {})
+            else: # Machines of host created by command are merged like by load
+                desired = dict(current)
+                for machname, credentials in machines.get(name, {}).items():
+                    desired.setdefault(machname, credentials)
+            desiredMachines[name] = desired
+            machineChanges += sum(1 for machname in set(current.keys() + desired.keys())
+                                  if current.get(machname) != desired.get(machname))
+        newGroups = OrderedDict((name, group) for name, group in self.groups.items() if name not in self.configGroups)
+        groupChanges = len([name for name in self.configGroups if name in self.groups and name not in groups])
+        for name, group in groups.items():
+            old = self.groups.get(name)
+            if old is not None and old.getMachines() == group.getMachines():
+                newGroups[name] = old
+            else:
+                newGroups[name] = group
+                groupChanges += 1
+        # Apply the new state at once
+        for name, env in envs.items():
+            env.machines = desiredMachines[name]
+        replaced = [self.envs[name] for name in removed + changed]
+        self.envs = envs
+        self.groups = newGroups
+        self.configFile = filename
+        self.configHosts = set(hosts.keys())
+        self.configGroups = set(groups.keys())
+        self.credentials.rebuild(envs.values(), newGroups.values())
+        for env in replaced:
+            self.closeEnvironment(env)
+        if self.activeEnv is not None and self.activeEnv not in envs.values():
+            # Active host was removed or replaced by a host with new parameters
+            fallback = [envs[name] for name in hosts.keys()] + envs.values()
+            self.active = envs.get(self.activeEnv.getName()) or (fallback[0] if len(fallback) else None)
+            if self.active is not None and self.lazyConnect:
+                self.active.startOpen()
+            print "Active host: %s"%(self.active.getName() if self.active else "None")
+        print "Configuration reloaded: %d hosts added, %d changed, %d removed, %d machines and %d groups changed"%(
+              len(added), len(changed), len(removed), machineChanges, groupChanges)
+        if self.autoMode:
+            self.log("Configuration %s reloaded"%filename, added=added, changed=changed, removed=removed,
+                     machines=machineChanges, groups=groupChanges)
+        new = [envs[name] for name in added + changed]
+        if not self.lazyConnect:
+            self.connectHosts(new)
+        return True
+
+    def getHostValues(self, host):
+        """
+        Connection parameters used to compare hosts
+        @param host: Environment object or arguments of addhost command
+        @return: Tuple (hostname, port, user, password)
+        """
+        if isinstance(host, Environment):
+            return (host.host, int(host.port), host.user, host.password)
+        port = int(host[1]) if len(host) > 1 and host[1] else 18083
+        user = host[2] if len(host) > 2 and host[2] else ""
+        password = host[3] if len(host) > 3 and host[3] else ""
+        return (host[0], port, user, password)
+
+    def closeEnvironment(self, env):
+        """ Release sessions, stop event watcher and log off from a host which is not used anymore """
+        env.events.stop()
+        if env.isOpen():
+            env.sessions.releaseAll()
+            env.connection.disconnect()
+
+    def watchConfiguration(self, filename, interval=2.0):
+        """
+        Reload configuration file whenever it changes. Changes are applied
+        between commands, never while a command is running.
+        @param filename: Path to watched configuration file
+        @param interval: Number of seconds between two checks. Default value: 2.0
+        """
+        if self.configWatcher is not None:
+            self.configWatcher.stop()
+        self.configWatcher = FileWatcher(filename, self.onConfigurationChanged, interval)
+        self.configWatcher.start()
+
+    def onConfigurationChanged(self, filename):
+        """ Called by watcher thread, the reload itself is done by the interpreter thread """
+        self.pendingReload = filename
+
+    def applyPendingReload(self):
+        filename = self.pendingReload
+        if filename is not None:
+            self.pendingReload = None
+            print "Configuration file %s changed, reloading"%filename
+            self.reloadConfiguration(filename)
+
+    def connectHosts(self, envs):
+        """
+        Connect hosts concurrently, each of them within its connection timeout.
+        Unreachable hosts stay registered, so their machines and groups are
+        kept and later commands try to connect again.
+        @param envs: List of Environment objects which are not connected yet
+        @return: List of names of hosts which failed to connect
+        """
+        if not len(envs):
+            return []
+        pool = WorkerPool(min(len(envs), hostConnectWorkers))
+        for env in envs:
+            pool.submit(env.getName(), env.open)
+        results = pool.run()
+        failed = [result for result in results if not result.isOk()]
+        for result in failed:
+            print "Could not connect to host %s: %s"%(result.key, result.error)
+            if self.autoMode:
+                self.log("ERROR: Could not connect to host %s: %s"%(result.key, result.error),
+                         host=result.key, duration=result.getLatency(), outcome=result.status)
+        print "Connected %d of %d hosts"%(len(results) - len(failed), len(results))
+        if self.active is None:
+            connected = [env for env, result in zip(envs, results) if result.isOk()]
+            self.active = connected[0] if len(connected) else envs[0]
+            print "This is the first known host (%s), setting it as active"%self.active.getName()
+        return [result.key for result in failed]
+
     def saveConfiguration(self, dest):
         """
         Save current configuration to destination file. If the file already exists
@@ -583,6 +1214,7 @@ class Interpreter():
         """
         self.envs = {}
         self.groups = {}
+        self.credentials.clear()
         return    
     
     def setActiveEnv(self, url):
@@ -591,11 +1223,21 @@ class Interpreter():
             return 0
         self.active = self.envs[url]
     
-    def log(self, message, close = False):
-        self.logfile.write(datetime.now().strftime("%H:%M:%S") + " " + message + '\n')
-        self.logfile.flush()
-        if close:
-            self.logfile.close()
+    def log(self, message, **fields):
+        """
+        Add record to the log of automatic mode. The record is written by
+        background thread, the call never waits for the disk.
+        @param message: Text of the record
+        @param fields: Structured fields of the record, e.g. command, host,
+                       machine, duration, outcome
+        """
+        if self.logwriter is None:
+            return
+        if 'level' not in fields:
+            fields['level'] = message.split(':')[0] if message.startswith(("ERROR:", "INTERRUPT:")) else "INFO"
+        if fields.get('duration') is not None:
+            fields['duration'] = round(fields['duration'], 3)
+        self.logwriter.write(message, **fields)
                    
     """
     ############################################
@@ -608,8 +1250,8 @@ class Interpreter():
             print "Wrong arguments for restart. Usage: restart <machine_name|machine uuid>"
             return 0
         machname = args[0]
-        machine, session = self.lockSession(machname)
-        session.console.reset()
+        with self.lockSession(machname) as (machine, session):
+            session.console.reset()
         return 0
     
     def cmdPause(self, args):
@@ -617,8 +1259,8 @@ class Interpreter():
             print "Wrong arguments for pause. Usage: pause <machine_name|machine uuid>"
             return 0
         machname = args[0]
-        machine, session = self.lockSession(machname)
-        session.console.pause()
+        with self.lockSession(machname) as (machine, session):
+            session.console.pause()
         return 0
                 
     def cmdResume(self, args):
@@ -626,8 +1268,8 @@ class Interpreter():
             print "Wrong arguments for resume. Usage: resume <machine_name|machine uuid>"
             return 0
         machname = args[0]
-        machine, session = self.lockSession(machname)
-        session.console.resume() 
+        with self.lockSession(machname) as (machine, session):
+            session.console.resume()
         return 0
                 
     def cmdPowerOff(self, args):
@@ -635,9 +1277,10 @@ class Interpreter():
             print "Wrong arguments for poweroff. Usage: poweroff <machine_name|machine uuid>"
             return 0
         machname = args[0]
-        machine, session = self.lockSession(machname)
-        progress = session.console.powerDown() 
-        self.progressBar(progress)               
+        with self.lockSession(machname) as (machine, session):
+            progress = session.console.powerDown() 
+        self.progressBar(progress, "poweroff " + machname)               
+        self.active.sessions.release(machname) # Session is closed by stopped machine
         return 0
     
     def cmdPowerButton(self, args):
@@ -645,8 +1288,8 @@ class Interpreter():
             print "Wrong arguments for powerbutton. Usage: powerbutton <machine_name|machine uuid>"
             return 0
         machname = args[0]
-        machine, session = self.lockSession(machname)
-        session.console.powerButton()
+        with self.lockSession(machname) as (machine, session):
+            session.console.powerButton()
         return 0
             
     def cmdSleepButton(self, args):
@@ -654,8 +1297,8 @@ class Interpreter():
             print "Wrong arguments for sleepbutton. Usage: sleepbutton <machine_name|machine uuid>"
             return 0
         machname = args[0]
-        machine, session = self.lockSession(machname)
-        session.console.sleepButton()
+        with self.lockSession(machname) as (machine, session):
+            session.console.sleepButton()
         return 0
     
     def cmdGroups(self, args):
@@ -687,6 +1330,7 @@ class Interpreter():
         group = Group(groupname)
         if groupname not in self.groups.keys():
             self.groups[groupname] = group
+            self.credentials.addGroup(group)
         else:
             print "Group already exists"
         return 0
@@ -696,9 +1340,11 @@ class Interpreter():
             print "Wrong arguments for creategroup command. Usage: removegroup <groupname>"
             return 0
         groupname = args[0] 
-        group = Group(groupname)
-        if group:
-            del self.groups[groupname]
+        group = self.groups.pop(groupname, None)
+        if group is not None:
+            self.credentials.removeGroup(group)
+        else:
+            print "Group '%s' not found"%groupname
         return 0
         
     def cmdAddToGroup(self, args):
@@ -731,7 +1377,7 @@ class Interpreter():
     def cmdRemoveFromGroup(self, args):
         """Remove machine from group"""
         if len(args) < 2 or len(args) > 3:
-            print "Wrong arguments for removefromgroup. Usage: removefromgroup <host> <group> [machine]"
+            print "Wrong arguments for removefromgroup. Usage: removefromgroup <group> <host> [machine]"
             return 0
         
         groupname = args[0]
@@ -743,15 +1389,7 @@ class Interpreter():
             print "Group '%s' not found"%groupname
             return 0
         
-        for hostname, machines in group.getMachines().items():
-            if hostname == hostarg:
-                if macharg is None:
-                    del group.getMachines()[hostname]
-                    break
-                for machname in machines:
-                    if machname == macharg:
-                        del group[group][machname]
-                        return 0
+        group.removeMachine(hostarg, macharg)
         return 0
     
     def cmdSleep(self, args):
@@ -763,10 +1401,16 @@ class Interpreter():
     
     def cmdConnect(self, args):
         """ Connect to HTTP server """
-        if len(args) != 1:
-            print "Wrong arguments for connect. Usage: connect <hostname>"
+        if len(args) > 1:
+            print "Wrong arguments for connect. Usage: connect [hostname]"
+            return 0
+        if not len(args): # Connect all hosts which are not connected yet
+            envs = [env for env in self.envs.values() if not env.isOpen()]
+            if len(envs):
+                self.connectHosts(envs)
+            else:
+                print "All hosts are connected"
             return 0
-        
         host = args[0]
 
         env = self.envs.get(host)
@@ -774,9 +1418,7 @@ class Interpreter():
             print "Unknown host"
             return 0
         
-        url, user, password = env.url, env.username, env.password
-        vbox = env.mgr.platform.connect(url, user, password)
-        env.vbox = vbox  
+        env.connection.connect()
         return 0
     
     def cmdReconnect(self, args):
@@ -786,17 +1428,10 @@ class Interpreter():
             return 0
 
         env = self.envs.get(args[0]) if len(args) > 0 else self.active
-        try:
-            url, user, password = env.url, env.user, env.password 
-        except AttributeError, KeyError:
+        if env is None or not env.remote:
             print "Trying to reconnect to the unknown host machine"
             return 0
-        try:
-            env.mgr.platform.disconnect()
-        except: # Do nothing if already disconnected
-            pass 
-        vbox = env.mgr.platform.connect(url, user, password)
-        env.vbox = vbox
+        env.connection.reconnect()
         return 0
     
     def cmdDisconnect(self, args):
@@ -805,10 +1440,8 @@ class Interpreter():
             print "Wrong arguments for disconnect. Usage: disconnect [hostname]"
             return 0
         env = self.envs.get(args[0]) if len(args) > 0 else self.active
-        try:
-            env.mgr.platform.disconnect()
-        except:
-            pass
+        if env is not None:
+            env.connection.disconnect()
         return 0
     
     def cmdHelp(self, args):
@@ -835,7 +1468,7 @@ class Interpreter():
 
         if values.get('name')[0]:
             try:
-                self.active.vbox.findMachine(values.get('name')[0])
+                self.active.findMachine(values.get('name')[0])
             except Exception as e:
                 pass # Machine does not exist -> OK
             else:
@@ -887,18 +1520,19 @@ class Interpreter():
         print "Creating hardrive"
         medium = vbox.createMedium('vmdk', r"C:\Users\mount_000\%s.vmdk"%values.get('name')[0], const.AccessMode_ReadWrite, const.DeviceType_HardDisk)
         print "Creating base storage"
-        self.progressBar(medium.createBaseStorage(values.get('disksize')[0]*1024*1024, [const.MediumVariant_VmdkRawDisk]))
+        self.progressBar(medium.createBaseStorage(values.get('disksize')[0]*1024*1024, [const.MediumVariant_VmdkRawDisk]),
+                         "storage " + values.get('name')[0])
         print "Creating storage controller"
         #vbox.openMachine(values.get('name'))
         controller = mach.addStorageController('sata1', const.StorageBus_SATA)
         print "Registering machine"
         mach.saveSettings()
         vbox.registerMachine(mach)
+        self.active.invalidateMachines()
+        self.active.inventory.invalidate()
         
         # Session is needed for modification of existing machine
-        session = mgr.getSessionObject(vbox)
-        try:
-            mach.lockMachine(session, const.LockType_Write)
+        with self.lockWrite(values.get('name')[0]) as (machine, session):
             mutable = session.machine # Get mutable instance of machine
             print "Setting RAM memory"
             mutable.setMemorySize(values.get('ram')[0])
@@ -908,10 +1542,114 @@ class Interpreter():
             mutable.attachDevice('sata1', 0, 0, const.DeviceType_HardDisk, medium)
             print "Finishing"
             mutable.saveSettings()            
-        finally:
-            session.unlockMachine()
         return 0
 
+    def cmdClone(self, args):
+        """
+        Create linked clones of a template machine. Clones share disks of template
+        snapshot and write only their changes to differencing disks, so they are
+        created in seconds and take almost no disk space.
+        """
+        usage = ("Wrong arguments for clone. Usage: clone <template> [--snapshot=<name>] [--count=<count>] [--start=<number>] "
+                 "[--full] [--jobs=<count>] [name_pattern]")
+        options = {'snapshot': None, 'count': 1, 'start': 1, 'full': False, 'jobs': cloneWorkers}
+        rest = []
+        for arg in args[1:]:
+            if not arg.startswith('--'):
+                rest.append(arg)
+                continue
+            option, value = (arg[2:].split('=', 1) + [None])[:2]
+            try:
+                if option == 'full' and value is None:
+                    options['full'] = True
+                elif option == 'snapshot' and value:
+                    options['snapshot'] = value
+                elif option in ['count', 'jobs'] and value is not None and int(value) > 0:
+                    options[option] = int(value)
+                elif option == 'start' and value is not None and int(value) >= 0:
+                    options[option] = int(value)
+                else:
+                    raise ValueError(option)
+            except ValueError:
+                print usage
+                return 0
+        if len(rest) > 1:
+            print usage
+            return 0
+        # Pattern contains {n} which is replaced by number of clone, e.g. web-{n:02d}
+        pattern = rest[0] if len(rest) else args[0] + "-clone-{n}"
+        if '{n' not in pattern and options['count'] > 1:
+            pattern += "-{n}"
+        try:
+            names = [pattern.format(n=number) for number in range(options['start'], options['start'] + options['count'])]
+        except (ValueError, KeyError, IndexError) as e:
+            print "Wrong name pattern %s: %s"%(pattern, str(e))
+            return 0
+        if len(set(names)) != len(names):
+            print "Name pattern %s does not give unique names, use {n} for number of clone"%pattern
+            return 0
+        template = self.active.findMachine(args[0])
+        try:
+            snapshot = self.getTemplateSnapshot(template, options['snapshot'])
+        except Exception as e:
+            print str(e)
+            return 0
+        print "Cloning %s from snapshot '%s'"%(args[0], snapshot.name)
+        templateName, snapshotId = template.name, snapshot.id
+        cloneOptions = [] if options['full'] else [self.active.const.CloneOptions_Link]
+        def clone(args):
+            return self.cloneMachine(templateName, snapshotId, args[0], cloneOptions)
+        started = time.time()
+        results = self.machinesCommand({self.active.name: OrderedDict((name, {}) for name in names)}, clone, [None], options['jobs'])
+        self.active.invalidateMachines()
+        self.active.inventory.invalidate()
+        print "%d of %d clones created in %.2f s"%(len([result for result in results if result.isOk()]), len(results),
+                                                   time.time() - started)
+        return 0
+
+    def getTemplateSnapshot(self, template, name=None):
+        """
+        Snapshot clones are created from. If template has no snapshot, it is taken.
+        @param template: IMachine object of template
+        @param name: Name of snapshot, if None, the current snapshot is used. Default value: None
+        @return: ISnapshot object
+        """
+        if name is not None:
+            return template.findSnapshot(name)
+        if template.snapshotCount:
+            return template.currentSnapshot
+        print "Template %s has no snapshot, taking snapshot '%s'"%(template.name, cloneSnapshotName)
+        with self.lockWrite(template.name) as (machine, session):
+            self.progressBar(session.console.takeSnapshot(cloneSnapshotName, "Base of linked clones"),
+                             "snapshot " + template.name)
+        snapshot = self.active.withMachine(template.name, lambda machine: machine.currentSnapshot)
+        if snapshot is None:
+            raise CommandException("Could not take snapshot of template " + template.name)
+        return snapshot
+
+    def cloneMachine(self, templateName, snapshotId, name, cloneOptions):
+        """
+        Clone machine of template snapshot and register the clone
+        @param templateName: Name of template machine
+        @param snapshotId: UUID of template snapshot
+        @param name: Name of the new machine
+        @param cloneOptions: List of CloneOptions values
+        """
+        vbox = self.active.vbox
+        const = self.active.const
+        try:
+            self.active.findMachine(name)
+        except Exception:
+            pass # Machine does not exist -> OK
+        else:
+            raise CommandException("Machine with name %s already exists"%name)
+        # Every worker reads the snapshot again, objects are not shared by threads
+        source = self.active.withMachine(templateName, lambda machine: machine.findSnapshot(snapshotId)).machine
+        clone = vbox.createMachine("", name, [], source.OSTypeId, "")
+        self.progressBar(source.cloneTo(clone, const.CloneMode_MachineState, cloneOptions), "clone " + name)
+        vbox.registerMachine(clone)
+        return name
+
     def cmdRemoveVM(self, args):
         if len(args) != 1:
             print "Wrong arguments for removevm. Usage: removevm <name>"
@@ -921,63 +1659,209 @@ class Interpreter():
         vbox = self.active.vbox
         const = self.active.const
         
-        machine = vbox.findMachine(name)
-        session = mgr.getSessionObject(vbox)
         try:
-            machine.lockMachine(session, const.LockType_Write)
-            mutable = session.machine
-            attachments = mgr.getArray(mutable, 'mediumAttachments')
-            for attachment in attachments:
-                mutable.detachDevice(attachment.controller, attachment.port, attachment.device)
-            attachments = mgr.getArray(mutable, 'mediumAttachments')
-            mutable.saveSettings()
+            with self.lockWrite(name) as (machine, session):
+                mutable = session.machine
+                attachments = mgr.getArray(mutable, 'mediumAttachments')
+                for attachment in attachments:
+                    mutable.detachDevice(attachment.controller, attachment.port, attachment.device)
+                mutable.saveSettings()
         except:
             pass
-        finally:
-            session.unlockMachine()
-
-        harddrives = machine.unregister(const.CleanupMode_Full)
+        machine, harddrives = self.active.withMachine(name, lambda machine: (machine, machine.unregister(const.CleanupMode_Full)))
+        self.active.invalidateMachines() # Handle may be cached under name and UUID
+        self.active.inventory.invalidate()
         harddrives = list(harddrives)
         if machine:
             progress = machine.deleteConfig(harddrives)
-            self.progressBar(progress)
+            self.progressBar(progress, "removevm " + name)
         return 0            
     
     def cmdExit(self, args):
         return 1
 
+    def parseGcmdArgs(self, args):
+        """
+        Split arguments of gcmd into options and guest command line
+        @param args: Arguments of gcmd, the first one is machine or group
+        @return: Tuple (options, executable, guestargs) or None if arguments are wrong.
+                 Options is dictionary option name -> value.
+        """
+        usage = ("Wrong arguments for gcmd. Usage: <machine_name|uuid|group> [--stdout=<file>] [--stderr=<file>] "
+                 "[--jobs=<count>] [--output-dir=<dir>] <path_to_executable> <args>")
+        options = {}
+        index = 1
+        while index < len(args) and args[index].startswith('--') and '=' in args[index]:
+            option, value = args[index][2:].split('=', 1)
+            if option not in ['stdout', 'stderr', 'jobs', 'output-dir'] or not len(value):
+                print usage
+                return None
+            options[option] = value
+            index += 1
+        if index >= len(args):
+            print usage
+            return None
+        if 'jobs' in options:
+            try:
+                options['jobs'] = int(options['jobs'])
+            except ValueError:
+                print usage
+                return None
+        return options, args[index], args[index:]
+
     def cmdGcmd(self, args):
-        """ Execute a command on machine and wait for it to end """
-        if len(args) < 2:
-            print "Wrong arguments for gcmd. Usage: <machine_name|uuid> <path_to_executable> <args>"
+        """
+        Execute a command on machine and wait for it to end. Output is streamed
+        until the process terminates, either to console or to local files.
+        Placeholder {machine} in file names is replaced by machine name.
+        """
+        parsed = self.parseGcmdArgs(args)
+        if parsed is None:
             return 0
+        options, executable, guestargs = parsed
         machname = args[0]
-        executable = args[1]
-        guestargs = args[1:]
-        
-        vbox = self.active.vbox
-        mach = vbox.findMachine(machname)
-        session = self.active.mgr.getSessionObject(vbox)
-        mach.lockMachine(session, self.active.const.LockType_Shared)
+        files = {}
+        for handle, option in [(STDOUT, 'stdout'), (STDERR, 'stderr')]:
+            if option in options:
+                files[handle] = options[option].replace('{machine}', machname)
         
         user, password = self.getCredentials(machname)
+        outputs = {}
         try:
-            guestSession = session.console.guest.createSession(user, password, '', '')
-            guestSession.waitFor(1, 10000) # Wait for session to start
-            proc = guestSession.processCreate(executable, guestargs, None, [5,6], 0)
+            sinks = {STDOUT: sys.stdout.write, STDERR: sys.stdout.write}
+            for handle, filename in files.items():
+                outputs[handle] = open(filename, 'wb')
+                sinks[handle] = outputs[handle].write
+            with self.lockGuest(machname, user, password) as (mach, session, guestSession):
+                pump, exitCode = self.runGuestProcess(guestSession, executable, guestargs, sinks)
+            for handle, filename in files.items():
+                print "Written %d bytes of %s to %s"%(pump.received[handle], 'stdout' if handle == STDOUT else 'stderr', filename)
+            print "Exit code: " + str(exitCode)
+        except IOError as e:
+            print "Could not write output: " + str(e)
         except Exception as e:
             print str(e)
-        else:
-            proc.waitFor(1, 10000) # Wait for process to start
-            data = proc.read(1, 4096, 10000)
-            print str(data)
-            data = proc.read(2, 4096, 10000)
-            print str(data)        
-            print proc.waitFor(2, 10000) # Wait for terminate
-            print proc.exitCode
+            self.active.connection.recover(e) # Next command gets a working connection
         finally:
-            session.unlockMachine()
+            for fp in outputs.values():
+                fp.close()
         return 0
+
+    def runGuestProcess(self, guestSession, executable, guestargs, sinks):
+        """
+        Run process in guest and stream its output until it terminates
+        @param sinks: Dictionary handle -> callable called with every piece of output
+        @return: Tuple (OutputPump, exit code)
+        """
+        const = self.active.const
+        proc = guestSession.processCreate(executable, guestargs, None, [5,6], 0)
+        try:
+            proc.waitFor(1, 10000) # Wait for process to start
+            pump = OutputPump(proc, const, sinks, guestReadMin, guestReadMax, guestPollInterval)
+            pump.run()
+        except IOError: # Output could not be stored, do not leave the process running
+            proc.terminate()
+            raise
+        return pump, proc.exitCode
+
+    def fanoutGcmd(self, args):
+        """
+        Execute a guest command on all machines of group concurrently. Output of every
+        machine is saved to output directory, results with identical output and exit
+        code are summarized together.
+        """
+        parsed = self.parseGcmdArgs(args)
+        if parsed is None:
+            return 0
+        options, executable, guestargs = parsed
+        outputDir = options.get('output-dir') or "gcmd_" + time.strftime("%Y%m%d_%H%M%S")
+        try:
+            if not path.isdir(outputDir):
+                os.makedirs(outputDir)
+        except OSError as e:
+            print "Could not create output directory: " + str(e)
+            return 0
+        # Every machine gets the same output directory, the rest of options is kept
+        machargs = [args[0], '--output-dir=' + outputDir] + [arg for arg in args[1:] if not arg.startswith('--output-dir=')]
+        results = self.groupCommand(args[0], self.captureGcmd, machargs, options.get('jobs'), False)
+        self.printFanoutSummary(results, outputDir)
+        return 0
+
+    def captureGcmd(self, args):
+        """
+        Execute a guest command on a single machine of fan-out
+        @return: Dictionary with exit code and CapturedOutput of stdout and stderr
+        """
+        options, executable, guestargs = self.parseGcmdArgs(args)
+        machname = args[0]
+        prefix = path.join(options['output-dir'], "%s_%s"%(self.active.name, machname))
+        outputs = {}
+        try:
+            for handle, option in [(STDOUT, 'stdout'), (STDERR, 'stderr')]:
+                filename = options[option].replace('{machine}', machname) if option in options else prefix + "." + option
+                outputs[handle] = CapturedOutput(filename)
+            user, password = self.getCredentials(machname)
+            with self.lockGuest(machname, user, password) as (mach, session, guestSession):
+                pump, exitCode = self.runGuestProcess(guestSession, executable, guestargs,
+                                                      dict((handle, output.write) for handle, output in outputs.items()))
+        finally:
+            for output in outputs.values():
+                output.close()
+        return {'exitCode': exitCode, 'stdout': outputs[STDOUT], 'stderr': outputs[STDERR]}
+
+    def printFanoutSummary(self, results, outputDir, preview=5):
+        """
+        Print machines grouped by identical exit code and output, full results
+        are written to results.json in output directory
+        @param results: List of TaskResult objects returned by captureGcmd
+        @param outputDir: Directory with saved output
+        @param preview: Number of lines of output printed for every group. Default value: 5
+        """
+        if not len(results):
+            print "Group contains no machines"
+            return
+        summary = OrderedDict() # (status, exit code, stdout digest, stderr digest) -> results
+        records = []
+        for result in results:
+            value = result.value
+            if result.isOk():
+                key = (result.status, value['exitCode'], value['stdout'].getDigest(), value['stderr'].getDigest())
+            else:
+                key = (result.status, None, result.error, None)
+            summary.setdefault(key, []).append(result)
+            record = {'host': result.key[0], 'machine': result.key[1], 'status': result.status,
+                      'duration': result.getLatency()}
+            if result.isOk():
+                record.update({'exitCode': value['exitCode'],
+                               'stdout': value['stdout'].filename, 'stdoutBytes': value['stdout'].size,
+                               'stderr': value['stderr'].filename, 'stderrBytes': value['stderr'].size})
+            else:
+                record['error'] = result.error
+            records.append(record)
+        for key, members in sorted(summary.items(), key=lambda item: -len(item[1])):
+            latencies = [result.getLatency() for result in members if result.getLatency() is not None]
+            names = ", ".join("%s/%s"%result.key for result in members[:10]) + (", ..." if len(members) > 10 else "")
+            times = " %.2f-%.2f s"%(min(latencies), max(latencies)) if len(latencies) else ""
+            if key[0] != "OK":
+                print "%d machines %s%s: %s"%(len(members), key[0], times, key[2])
+                print 4*" " + names
+                continue
+            print "%d machines exit code %s%s"%(len(members), key[1], times)
+            print 4*" " + names
+            for label, output in [('stdout', members[0].value['stdout']), ('stderr', members[0].value['stderr'])]:
+                if not output.size:
+                    continue
+                lines = output.head.splitlines()
+                for line in lines[:preview]:
+                    print 4*" " + "%s| %s"%(label, line)
+                if len(lines) > preview or output.size > len(output.head):
+                    print 4*" " + "%s| ... %d bytes"%(label, output.size)
+        try:
+            with open(path.join(outputDir, "results.json"), 'w') as fp:
+                json.dump(records, fp, indent=1, sort_keys=True)
+        except IOError as e:
+            print "Could not write results: " + str(e)
+        print "Output of %d machines saved to %s"%(len(results), outputDir)
    
     def cmdGshell(self, args):
         """ Start interactive shell or command line on the machine """
@@ -991,128 +1875,492 @@ class Interpreter():
         machname = args[0]
         guestargs = args[1:]
 
+        const = self.active.const
+        user, password = self.getCredentials(machname)
         try:
-            vbox = self.active.vbox
-            const = self.active.const
-            mach, session = self.lockSession(machname)
-            #mach = vbox.findMachine(machname)
-            #session = self.active.mgr.getSessionObject(vbox)
-            
-            #mach.lockMachine(session, self.active.const.LockType_Shared)
-            user, password = self.getCredentials(machname)
-            guestSession = session.console.guest.createSession(user, password, '', '')
-            guestSession.waitFor(1, 10000) # Wait for session to start
+            with self.lockGuest(machname, user, password) as (mach, session, guestSession):
+                self.runGuestShell(guestSession, guestargs)
         except Exception as e:
             print str(e)
-        else:  
-            pathstyle = guestSession.pathStyle # Distinguish guest OS (Linux or Windows)
-            executable = r'C:\Windows\System32\cmd.exe' if pathstyle == const.PathStyle_DOS else r'/bin/sh'
-            proc = guestSession.processCreate(executable, guestargs, None, [5, 6], 0)
-            proc.waitFor(1, 10000) # Wait for process to start
-            while True:
-                data = proc.read(1, 10000, 10000) # Get data from stdout
-                print str(data)
-                if proc.status not in [const.ProcessStatus_Starting, const.ProcessStatus_Started]:
-                    print "Exit code: " + str(proc.exitCode)
-                    break
-                inp = raw_input("cmd>")
-                written = proc.write(0, 0, inp + '\n', 10000)  # Pass user input to guest process          
-                data = proc.read(2, 10000, 10000) # Get data from stderr
-                print str(data)
-            
-            proc.waitFor(2, 10000) # Wait for terminate
-            guestSession.close()
-        finally:
-            session.unlockMachine()
+            self.active.connection.recover(e) # Next command gets a working connection
         return 0
+
+    def runGuestShell(self, guestSession, guestargs):
+        """
+        Pass user input to shell process in guest until it ends. Output is
+        printed by background pump as soon as it arrives, input is passed
+        line by line as it is typed.
+        """
+        const = self.active.const
+        pathstyle = guestSession.pathStyle # Distinguish guest OS (Linux or Windows)
+        executable = r'C:\Windows\System32\cmd.exe' if pathstyle == const.PathStyle_DOS else r'/bin/sh'
+        proc = guestSession.processCreate(executable, guestargs, None, [5, 6], 0)
+        proc.waitFor(1, 10000) # Wait for process to start
+        consoleLock = threading.Lock()
+        def toConsole(data):
+            with consoleLock:
+                sys.stdout.write(data)
+                sys.stdout.flush()
+        pump = OutputPump(proc, const, {STDOUT: toConsole, STDERR: toConsole}, guestReadMin, guestReadMax, 0.1)
+        reader = pump.start()
+        print "Shell started, end it by 'exit' or Ctrl-D"
+        try:
+            while reader.is_alive():
+                if os.name != 'nt' and sys.stdin.isatty(): # Wait for input only shortly, so terminated shell is noticed
+                    ready = select.select([sys.stdin], [], [], 0.1)[0]
+                    if not ready:
+                        continue
+                line = sys.stdin.readline()
+                if not reader.is_alive(): # Shell ended while the line was typed
+                    break
+                flags = const.ProcessInputFlag_None if line else const.ProcessInputFlag_EndOfFile # EOF ends input
+                try:
+                    proc.write(STDIN, flags, line, 10000) # Pass user input to guest process
+                except Exception:
+                    if pump.isRunning():
+                        raise
+                    break # Shell ended before the pump noticed it
+                if not line:
+                    break
+        except KeyboardInterrupt:
+            print "Terminating shell"
+            pump.stop()
+            proc.terminate()
+        reader.join() # Print the rest of output
+        print "Exit code: " + str(proc.exitCode)
     
     def cmdCopyToMachine(self, args):
-        print "This command is bugged in VirtualBox SDK 5.0.16, Bug #14336"
+        self.transferFiles(args, True)
         return 0
-        if len(args) < 3:
-            print "Wrong arguments for copyto. Usage: copyto <machine> <src> <dst>"
-            return 0
+    
+    def cmdCopyFromMachine(self, args):
+        self.transferFiles(args, False)
+        return 0
+
+    def transferFiles(self, args, upload):
+        """
+        Copy file or directory between host and machine in chunks. Interrupted
+        transfer is resumed by running the same command again.
+        @param args: Command arguments
+        @param upload: True if files are copied to machine
+        """
+        name = "copyto" if upload else "copyfrom"
+        usage = ("Wrong arguments for %s. Usage: %s <machine> [--chunk-size=<bytes>] [--inflight=<count>] [--no-verify] <src> <dst>"
+                 %(name, name))
+        options = {'chunk-size': transferChunkSize, 'inflight': transferInflight, 'verify': True}
+        index = 1
+        while index < len(args) and args[index].startswith('--'):
+            option, value = (args[index][2:].split('=', 1) + [None])[:2]
+            try:
+                if option == 'no-verify' and value is None:
+                    options['verify'] = False
+                elif option in ['chunk-size', 'inflight'] and value is not None and int(value) > 0:
+                    options[option] = int(value)
+                else:
+                    raise ValueError(option)
+            except ValueError:
+                print usage
+                return
+            index += 1
+        if len(args) - index != 2:
+            print usage
+            return
         machname = args[0]
-        src = args[1]
-        dst = args[2]
+        src, dst = args[index], args[index + 1]
+        local = path.abspath(src if upload else dst)
+        journal = self.getTransferJournal(name, machname, local if upload else src, dst if upload else local)
+        user, password = self.getCredentials(machname)
+        started = time.time()
         try:
-            machine, session = self.lockSession(machname)
-            user, password = self.getCredentials(machname)
-            guestSession = session.console.guest.createSession(user, password, '', '')
-            guestSession.waitFor(1, 10000) # Wait for session to start
-            if path.isfile(src):
-                progress = guestSession.fileCopyToGuest(src, dst, [0])
-            elif path.isdir(src):
-                progress = guestSession.directoryCopyToGuest(src, dst, [0])
-            else:
-                print "Source does not exist on host machine"            
-            self.progressBar(progress)
+            with self.lockGuest(machname, user, password) as (machine, session, guestSession):
+                transfer = FileTransfer(guestSession, self.active.const, journal, options['chunk-size'],
+                                        options['inflight'], options['verify'])
+                if upload:
+                    transfer.copyTo(local, dst)
+                else:
+                    transfer.copyFrom(src, local)
+        except TransferException as e:
+            print str(e)
+            self.active.connection.recover(e) # Resumed transfer gets a working connection
+            if path.exists(journal.filename):
+                print "Confirmed data are kept, run the same command again to resume the transfer"
+            return
+        except Exception as e:
+            print str(e)
+            self.active.connection.recover(e)
+            return
+        duration = time.time() - started
+        print "Copied %d files, %.1f MB in %.2f s (%.1f MB/s)%s"%(transfer.files, transfer.transferred / 1048576.0, duration,
+              transfer.transferred / 1048576.0 / duration if duration > 0 else 0,
+              ", %.1f MB resumed"%(transfer.skipped / 1048576.0) if transfer.skipped else "")
+
+    def getTransferJournal(self, name, machname, src, dst):
+        """
+        Journal of transfer, the same transfer to the same machine always uses the same journal
+        @param name: Name of transfer command
+        """
+        key = "|".join([name, self.active.name, machname, src, dst])
+        return Journal(os.path.join(os.path.expanduser("~"), ".managertransfers", hashlib.sha1(key).hexdigest() + ".json"))
+
+    def parseDistributeArgs(self, args):
+        """
+        Parse arguments of distribute command
+        @return: Tuple (dictionary of options, source, destination) or None if arguments are wrong
+        """
+        usage = ("Wrong arguments for distribute. Usage: distribute <group|machine> [--jobs=<count>] [--per-host=<count>] "
+                 "[--chunk-size=<bytes>] [--inflight=<count>] [--force] <src> <dst>")
+        options = {'jobs': None, 'per-host': distributeHostConcurrency, 'chunk-size': transferChunkSize,
+                   'inflight': transferInflight, 'force': False}
+        index = 1
+        while index < len(args) and args[index].startswith('--'):
+            option, value = (args[index][2:].split('=', 1) + [None])[:2]
+            try:
+                if option == 'force' and value is None:
+                    options['force'] = True
+                elif option in ['jobs', 'per-host', 'chunk-size', 'inflight'] and value is not None and int(value) > 0:
+                    options[option] = int(value)
+                else:
+                    raise ValueError(option)
+            except ValueError:
+                print usage
+                return None
+            index += 1
+        if len(args) - index != 2:
+            print usage
+            return None
+        if not path.isfile(args[index]):
+            print "Source %s is not a file"%args[index]
+            return None
+        return options, args[index], args[index + 1]
+
+    def openSharedSource(self, src, options):
+        """ Hash file distributed to machines, @return: SharedSource object """
+        started = time.time()
+        shared = SharedSource(path.abspath(src), options['chunk-size'])
+        shared.hash()
+        print "Source %s: %.1f MB, SHA-1 %s, hashed in %.2f s"%(src, shared.size / 1048576.0, shared.digest, time.time() - started)
+        return shared
+
+    def cmdDistribute(self, args):
+        """
+        Copy file to a single machine, the file is not sent when the machine already has it
+        """
+        parsed = self.parseDistributeArgs(args)
+        if parsed is None:
+            return 0
+        options, src, dst = parsed
+        shared = self.openSharedSource(src, options)
+        result = TaskResult((self.active.name, args[0]))
+        result.started = time.time()
+        try:
+            result.value = self.distributeTo([args[0]], shared, options, dst)
+            result.status = "OK"
         except Exception as e:
-            print str(e)            
+            result.error = str(e)
+            result.status = "FAILED"
         finally:
-            session.unlockMachine()
+            shared.close()
+        result.finished = time.time()
+        self.printDistributeReport([result], shared, result.getLatency())
         return 0
-    
-    def cmdCopyFromMachine(self, args):
-        print "This command is bugged in VirtualBox SDK 5.0.16, Bug #14336"
-        return 0
-        if len(args) < 3:
-            print "Wrong arguments for copyfrom. Usage: copyfrom <machine> <src> <dst>"
+
+    def fanoutDistribute(self, args):
+        """
+        Copy file to all machines of group. The source is read and hashed once,
+        machines are served concurrently and those already having the file are skipped.
+        """
+        parsed = self.parseDistributeArgs(args)
+        if parsed is None:
             return 0
-        machname = args[0]
-        src = args[1]
-        dst = args[2]
+        options, src, dst = parsed
+        shared = self.openSharedSource(src, options)
+        def distribute(args):
+            return self.distributeTo(args, shared, options, dst)
+        started = time.time()
         try:
-            machine, session = self.lockSession(machname)
-            user, password = self.getCredentials(machname)
-            guestSession = session.console.guest.createSession(user, password, '', '')
-            guestSession.waitFor(1, 10000) # Wait for session to start
-            if guestSession.fileExists(src, False):
-                progress = guestSession.fileCopyFromGuest(src, dst, [0])
-            elif guestSession.directoryExists(src, False):
-                progress = guestSession.directoryCopyFromGuest(src, dst, [0])
-            else:
-                print "Source does not exist on host machine"            
-            self.progressBar(progress)
-        except Exception as e:
-            print str(e)            
+            results = self.groupCommand(args[0], distribute, args, options['jobs'], False, options['per-host'])
         finally:
-            session.unlockMachine()
+            shared.close()
+        self.printDistributeReport(results, shared, time.time() - started)
         return 0
 
+    def distributeTo(self, args, shared, options, dst):
+        """
+        Copy shared file to a single machine unless the machine already has it
+        @param shared: SharedSource object
+        @param options: Dictionary of options of distribute command
+        @param dst: Destination path in guest
+        @return: Dictionary with outcome, number of sent bytes and duration of transfer
+        """
+        machname = args[0]
+        user, password = self.getCredentials(machname)
+        journal = self.getTransferJournal("copyto", machname, shared.filename, dst) # Shared with copyto
+        with self.lockGuest(machname, user, password) as (machine, session, guestSession):
+            started = time.time()
+            # Checksum of the whole file replaces read back of every chunk
+            transfer = FileTransfer(guestSession, self.active.const, journal, options['chunk-size'], options['inflight'], False)
+            target = transfer.getUploadPath(shared.filename, dst)
+            if not options['force']:
+                info = transfer.getGuestInfo(target)
+                if (info is not None and not transfer.isGuestDirectory(info) and int(info.objectSize) == shared.size
+                    and transfer.getGuestDigest(target, shared.size) == shared.digest):
+                    return {'outcome': "SKIPPED", 'sent': 0, 'duration': time.time() - started}
+            transfer.copyShared(shared, target)
+            if transfer.getGuestDigest(target, shared.size) != shared.digest:
+                raise TransferException("Checksum of %s does not match the source"%target)
+        return {'outcome': "SENT", 'sent': transfer.transferred, 'duration': time.time() - started}
+
+    def printDistributeReport(self, results, shared, duration):
+        """
+        Print outcome, sent data and throughput of every machine and totals
+        @param results: List of TaskResult objects returned by distributeTo
+        @param shared: Distributed SharedSource object
+        @param duration: Duration of the whole distribution in seconds
+        """
+        if not len(results):
+            print "Group contains no machines"
+            return
+        counts = {"SENT": 0, "SKIPPED": 0, "FAILED": 0}
+        sent = 0
+        print "%-20s %-24s %-8s %10s %10s %8s %s"%("Host", "Machine", "Outcome", "Sent [MB]", "Time [s]", "MB/s", "Error")
+        for result in results:
+            host, machname = result.key
+            if result.isOk():
+                value = result.value
+                counts[value['outcome']] += 1
+                sent += value['sent']
+                rate = value['sent'] / 1048576.0 / value['duration'] if value['duration'] > 0 else 0
+                print "%-20s %-24s %-8s %10.1f %10.2f %8.1f"%(host, machname, value['outcome'], value['sent'] / 1048576.0,
+                                                             value['duration'], rate)
+            else:
+                counts["FAILED"] += 1
+                print "%-20s %-24s %-8s %10s %10s %8s %s"%(host, machname, "FAILED", "-", "-", "-", result.error)
+        print "Sent to %d, skipped %d, failed %d machines"%(counts["SENT"], counts["SKIPPED"], counts["FAILED"])
+        print "Sent %.1f MB in %.2f s (%.1f MB/s), %d chunks of source read from disk"%(sent / 1048576.0, duration,
+              sent / 1048576.0 / duration if duration > 0 else 0, shared.reads)
+
     def cmdBatch(self, args):
         """
         Execute a batch file
         """
-        if len(args) != 1:
-            print "Wrong arguments for batch. Usage: batch <file>"
+        dryRun = len(args) == 2 and args[0] == '--dry-run'
+        if len(args) != 1 and not dryRun:
+            print "Wrong arguments for batch. Usage: batch [--dry-run] <file>"
             return 0
+        filename = args[-1]
         try:
-            fp = open(args[0], 'r')
-            
-            for line in fp:
-                if not len(line) or line.startswith('#'): # Skip empty lines and comments
-                    continue
-                split = line.split(';') # There might be more commands on one line
-                for command in split:
-                    try:
-                        retval = self.runCmd(command)
-                        if retval:
-                            break
-                    except (KeyboardInterrupt, EOFError):
-                        if self.autoMode:
-                            self.log("INTERRUPT: Interrupted batch file while exucuting '%s' command"%command)                        
-                    except Exception as e:
-                        print ":'("
-                        if self.autoMode:
-                            self.log("ERROR: Error while executing '%s' command. Details: "%command + str(e))                        
-                        print str(e)
+            scheduler, errors = self.parseBatch(filename)
+            errors += self.compileBatch(scheduler)
+            if len(errors):
+                for lineNum, message in errors:
+                    print "Line %d: %s"%(lineNum, message)
+                    if self.autoMode:
+                        self.log("ERROR: Line %d of batch file: %s"%(lineNum, message), line=lineNum)
+                print "Batch file contains errors, nothing was executed"
+            elif dryRun:
+                self.printPlan(scheduler)
+            else:
+                scheduler.run()
+                self.batchSummary(scheduler)
         except IOError:
             print "Could not open batch file"
+        except (KeyboardInterrupt, EOFError):
+            if self.autoMode:
+                self.log("INTERRUPT: Interrupted batch file %s"%filename)
         finally:
-            self.log("Batch %s finished"%args[0], True)
+            self.history.save()
+            if self.autoMode:
+                reconnects = sum(env.connection.reconnects for env in self.envs.values())
+                self.log("Webservice reconnects during batch: %d"%reconnects)
+                self.log("Batch %s finished"%filename)
+                if self.logwriter is not None:
+                    self.logwriter.flush()
         print "Finishing batch"
         return 0
+
+    def parseBatch(self, filename):
+        """
+        Read batch file and create plan of its steps. Every command can be
+        prefixed with '@name', it can wait for named steps with 'after=name1,name2'
+        placed before the command name
+        and it runs in background when it ends with '&'. Command 'wait' waits
+        for all background steps.
+        @param filename: Path to batch file
+        @return: Tuple (BatchScheduler object with all steps, list of (line number, error message) tuples)
+        """
+        scheduler = BatchScheduler(self.executeStep, self.getActiveName, self.maxWorkers, batchHostConcurrency)
+        errors = []
+        with open(filename, 'r') as fp:
+            lineNum = 0
+            for line in fp:
+                lineNum += 1
+                if not len(line.strip()) or line.startswith('#'): # Skip empty lines and comments
+                    continue
+                for command in line.split(';'): # There might be more commands on one line
+                    command = command.strip()
+                    background = command.endswith('&')
+                    if background:
+                        command = command[:-1]
+                    try:
+                        tokens = shlex.split(command)
+                    except ValueError as e:
+                        errors.append((lineNum, "Syntax error: " + str(e)))
+                        continue
+                    name = None
+                    if len(tokens) and tokens[0].startswith('@'):
+                        name = tokens.pop(0)[1:]
+                    after = []
+                    if len(tokens) and tokens[0].startswith('after='): # Only before command, arguments may look the same
+                        after.append(tokens.pop(0))
+                    if not len(tokens):
+                        continue
+                    if tokens == ['wait']:
+                        tokens = [] # Barrier
+                    step = Step(len(scheduler.steps), tokens, lineNum, name, background and len(tokens) > 0)
+                    scheduler.add(step)
+                    for token in after:
+                        for depname in token[len('after='):].split(','):
+                            if len(depname) and not scheduler.addDependency(step, depname):
+                                errors.append((lineNum, "Unknown step '%s' in after="%depname))
+        return scheduler, errors
+
+    def compileBatch(self, scheduler):
+        """
+        Validate all steps of batch before it is executed. Command names, argument
+        counts, hosts and groups are checked. Commands changing configuration
+        (load, addhost, creategroup, ...) are simulated, so later steps can use
+        hosts and groups they define. Expected duration of every step is set
+        from latency history.
+        @param scheduler: BatchScheduler object returned by parseBatch
+        @return: List of (line number, error message) tuples
+        """
+        errors = []
+        hosts = set(self.envs.keys())
+        groups = set(self.groups.keys())
+        active = self.getActiveName()
+        for step in scheduler.steps:
+            if step.isBarrier():
+                continue
+            cmd, args = step.args[0], step.args[1:]
+            ci = self.commands.get(cmd)
+            if ci is None:
+                errors.append((step.line, "Unknown command '%s'"%cmd))
+                continue
+            low, high = ci[3]
+            if len(args) < low or (high is not None and len(args) > high):
+                expected = str(low) if low == high else "%d to %s"%(low, "any" if high is None else high)
+                errors.append((step.line, "Command '%s' expects %s arguments, %d given"%(cmd, expected, len(args))))
+                continue
+            isGroup = len(args) > 0 and ci[1] == "network" and args[0] in groups
+            step.estimate = self.history.estimate(cmd, active, isGroup)
+            # Simulate changes of configuration
+            if cmd == 'load':
+                try:
+                    for lineNum, type, params in self.parseConfiguration(args[0]):
+                        if type == 'host':
+                            hosts.add(params['name'])
+                            active = active or params['name']
+                        elif params['group'] is not None:
+                            groups.add(params['group'])
+                except IOError:
+                    errors.append((step.line, "Could not open configuration file '%s'"%args[0]))
+                except ConfigurationException as e:
+                    errors.append((step.line, "Configuration file '%s': %s"%(args[0], str(e))))
+            elif cmd == 'addhost':
+                hosts.add(args[4] if len(args) > 4 and len(args[4]) else args[0])
+                active = active or args[0]
+            elif cmd in ['removehost', 'switchhost', 'connect', 'disconnect', 'reconnect', 'refresh'] and len(args):
+                if args[0] not in hosts:
+                    errors.append((step.line, "Unknown host '%s'"%args[0]))
+                elif cmd == 'removehost':
+                    hosts.discard(args[0])
+                elif cmd == 'switchhost':
+                    active = args[0]
+            elif cmd == 'creategroup':
+                groups.add(args[0])
+            elif cmd == 'addtogroup':
+                if args[1] not in hosts:
+                    errors.append((step.line, "Unknown host '%s'"%args[1]))
+                groups.add(args[0])
+            elif cmd in ['removegroup', 'removefromgroup']:
+                if args[0] not in groups:
+                    errors.append((step.line, "Unknown group '%s'"%args[0]))
+                elif cmd == 'removegroup':
+                    groups.discard(args[0])
+            elif cmd == 'sleep':
+                try:
+                    step.estimate = float(args[0])
+                except ValueError:
+                    errors.append((step.line, "Sleep time must be a number"))
+            elif cmd == 'batch' and not path.isfile(args[-1]):
+                errors.append((step.line, "Batch file '%s' does not exist"%args[-1]))
+        return errors
+
+    def printPlan(self, scheduler):
+        """
+        Print plan of batch with estimated duration of every step
+        @param scheduler: Compiled BatchScheduler object
+        """
+        print "%4s %5s %-10s %-40s %-16s %10s"%("Step", "Line", "Mode", "Command", "After", "Estimate")
+        for step in scheduler.steps:
+            mode = "wait" if step.isBarrier() else ("background" if step.background else "serial")
+            after = ",".join(dep.name for dep in step.after)
+            if step.isBarrier():
+                estimate = "-"
+            else:
+                estimate = "%.2f s"%step.estimate if step.estimate is not None else "unknown"
+            print "%4d %5d %-10s %-40s %-16s %10s"%(step.index + 1, step.line, mode, step.getLabel()[:40], after, estimate)
+        estimate = lambda step: step.estimate or 0.0
+        path, pathTime = scheduler.getCriticalPath(estimate)
+        unknown = len([step for step in scheduler.steps if step.estimate is None and not step.isBarrier()])
+        print "Estimated serial time: %.2f s, estimated wall-clock time: %.2f s"%(sum(estimate(step) for step in scheduler.steps), pathTime)
+        if unknown:
+            print "%d steps have no latency history, they are not included in estimates"%unknown
+
+    def getActiveName(self):
+        """ Name of the global active host """
+        return self.activeEnv.name if self.activeEnv else None
+
+    def executeStep(self, step):
+        """
+        Execute a single batch step. Background steps carry environment of the
+        host which was active when they were started.
+        """
+        env = self.envs.get(step.host)
+        try:
+            if step.background and env is not None:
+                return self.runInContext(env, self.runArgs, step.args)
+            return self.runArgs(step.args)
+        except Exception as e:
+            print ":'("
+            if self.autoMode:
+                self.log("ERROR: Error while executing '%s' command (line %d). Details: "%(" ".join(step.args), step.line) + str(e),
+                         command=step.args[0], host=step.host, line=step.line, outcome="FAILED")
+            print str(e)
+            raise
+
+    def batchSummary(self, scheduler):
+        """
+        Print and log summary of executed batch: failed steps, critical path
+        and time saved by parallel execution
+        """
+        steps = [step for step in scheduler.steps if not step.isBarrier()]
+        failed = [step for step in steps if step.status == "FAILED"]
+        skipped = [step for step in steps if step.status == "SKIPPED"]
+        notRun = [step for step in steps if step.status == "NOT RUN"] # Batch was stopped by exit
+        path, pathTime = scheduler.getCriticalPath()
+        serial = scheduler.getSerialTime()
+        lines = ["Batch summary: %d steps, %d succeeded, %d failed, %d skipped, %d not run"%(
+                    len(steps), len(steps) - len(failed) - len(skipped) - len(notRun), len(failed), len(skipped), len(notRun)),
+                 "Wall-clock time: %.2f s, serial time: %.2f s, saved: %.2f s"%(scheduler.wallTime, serial, max(0.0, serial - scheduler.wallTime)),
+                 "Critical path (%.2f s): %s"%(pathTime, " -> ".join("%s [%.2f s]"%(step.getLabel(), step.getDuration()) for step in path)),
+                 ]
+        for step in skipped:
+            lines.append("Skipped line %d '%s': %s"%(step.line, step.getLabel(), step.error))
+        for line in lines:
+            print line
+            if self.autoMode:
+                self.log(line)
     
     def cmdSetRam(self, args):
         if len(args) != 2:
@@ -1130,21 +2378,12 @@ class Interpreter():
             print "Memory size must be a number"
             return 0
         
-        mgr = self.active.mgr
-        vbox = self.active.vbox
-        const = self.active.const
-        
-        mach = vbox.findMachine(machname)
         # Session is needed for modification of existing machine
-        session = mgr.getSessionObject(vbox)
-        try:
-            print "Setting Memory size to " + str(newsize)
-            mach.lockMachine(session, const.LockType_Write)
+        print "Setting Memory size to " + str(newsize)
+        with self.lockWrite(machname) as (mach, session):
             mutable = session.machine # Get mutable instance of machine
             mutable.setMemorySize(newsize)
             mutable.saveSettings()            
-        finally:
-            session.unlockMachine()
         return 0
     
     def cmdSetCPU(self, args):
@@ -1163,21 +2402,12 @@ class Interpreter():
             print "CPU count must be a number"
             return 0
         
-        mgr = self.active.mgr
-        vbox = self.active.vbox
-        const = self.active.const
-        
-        mach = vbox.findMachine(machname)
         # Session is needed for modification of existing machine
-        session = mgr.getSessionObject(vbox)
-        try:
-            print "Setting CPU count to " + str(newsize)
-            mach.lockMachine(session, const.LockType_Write)
+        print "Setting CPU count to " + str(newsize)
+        with self.lockWrite(machname) as (mach, session):
             mutable = session.machine # Get mutable instance of machine
             mutable.setCPUCount(newsize)
             mutable.saveSettings()
-        finally:
-            session.unlockMachine()
         return 0
     
     def cmdLoad(self, args):
@@ -1187,6 +2417,17 @@ class Interpreter():
         self.loadConfiguration(args[0])
         return 0
 
+    def cmdReload(self, args):
+        if len(args) > 1:
+            print "Wrong arguments for reload. Usage: reload [config_file]"
+            return 0
+        filename = args[0] if len(args) else self.configFile
+        if filename is None:
+            print "No configuration file was loaded, use reload <config_file>"
+            return 0
+        self.reloadConfiguration(filename)
+        return 0
+
     def cmdSave(self, args):
         if len(args) < 1:
             print "Wrong arguments for save. Usage: save <config_file>"
@@ -1198,7 +2439,29 @@ class Interpreter():
         if len(args) < 1 or len(args) > 5:
             print "Wrong arguments for addhost. Usage: addhost <hostname/ip> [port] [user] [password] [displayname]"
             return 0
+        env = self.createEnvironment(args)
+        if env is None:
+            return 0
+        try:
+            env.open() # Create a new manager via webservice
+        except:
+            print "Could not connect to host " + env.host
+        else:
+            self.envs[env.getName()] = env
+            self.credentials.addEnvironment(env)
+            if self.active is None:
+                print "This is the first known host (%s), setting it as active"%env.getName()
+                self.active = env
+        print "Environments: %s"%str(self.envs.keys())
+        return 0
 
+    def createEnvironment(self, args, unique=True):
+        """
+        Create environment of a new host without connecting to it
+        @param args: Arguments of addhost command
+        @param unique: Refuse host which already exists. Default value: True
+        @return: Environment object or None if the host already exists
+        """
         host = args[0]
         port = int(args[1]) if (len(args) > 1 and args[1] and len(args[1]) > 0) else 18083
         user = args[2] if len(args) > 2 else ""
@@ -1209,9 +2472,9 @@ class Interpreter():
                   'user': user,
                   'password': password}
         
-        if host in self.envs.keys():
+        if unique and host in self.envs.keys():
             print "Host already exists"
-            return 0
+            return None
                 
         values = {'host': host,
                   'port': port,
@@ -1220,16 +2483,7 @@ class Interpreter():
                   'name': displayname,
                   'style': 'WEBSERVICE'
                   }
-        try:
-            self.envs[displayname] = Environment(values) # Create a new manager via webservice
-        except:
-            print "Could not connect to host " + host
-        else:
-            if self.active is None:
-                print "This is the first known host (%s), setting it as active"%self.envs[host].getName()
-                self.active = self.envs[host]
-        print "Environments: %s"%str(self.envs.keys())
-        return 0
+        return Environment(values, False)
     
     def cmdRemoveHost(self, args):
         if len(args) != 1:
@@ -1237,7 +2491,9 @@ class Interpreter():
             return 0
         host = args[0]
         try:
-            del self.envs[host]
+            env = self.envs.pop(host)
+            self.credentials.removeEnvironment(env)
+            self.closeEnvironment(env)
             print "Host successfully removed"
         except KeyError:
             print "Uknown host, could not be deleted"
@@ -1252,12 +2508,10 @@ class Interpreter():
         print self.envs.keys()
         try:
             self.active = self.envs[host]
-            self.cmdReconnect([host])
         except KeyError:
             print "Host does not exist"
-        except:
-            print "Could not switch to host, unable to connect"
         else:
+            self.active.startOpen() # Connect in background, the first command waits for it
             print "Host successfully switched to " + host
         return 0
     
@@ -1266,20 +2520,72 @@ class Interpreter():
             print "Wrong arguments for start. Usage: start <machine_name>"
             return 0
         name = args[0]
-        mgr = self.active.mgr
-        vbox = self.active.vbox
-        
-        machine = vbox.findMachine(name)
-        session = mgr.getSessionObject(self.active.vbox)
-        progress = machine.launchVMProcess(session, "gui", "")
-        self.progressBar(progress, 1000)
+        states = self.active.states
+        if states.isCurrent():
+            record = states.getRecord(name)
+            if record and states.isOnline(record['state']):
+                print "Machine %s is already running"%name
+                return 0
+        with self.active.sessions.launching(name) as session:
+            progress = self.active.withMachine(name, lambda machine: machine.launchVMProcess(session, "gui", ""))
+            self.progressBar(progress, "start " + name)
         
         return 0
     
+    def parseApplianceArgs(self, args, name, usage, first=1):
+        """
+        Parse options of exportvm and importvm commands
+        @param first: Index of the first option. Default value: 1
+        @return: Tuple (dictionary of options, remaining arguments) or None if options are wrong
+        """
+        options = {'jobs': None, 'per-host': applianceHostConcurrency, 'bandwidth': applianceBandwidth}
+        index = first
+        while index < len(args) and args[index].startswith('--'):
+            option, value = (args[index][2:].split('=', 1) + [None])[:2]
+            try:
+                if option in ['jobs', 'per-host'] and value is not None and int(value) > 0:
+                    options[option] = int(value)
+                elif option == 'bandwidth' and value is not None and float(value) >= 0:
+                    options[option] = float(value)
+                else:
+                    raise ValueError(option)
+            except ValueError:
+                print "Wrong arguments for %s. Usage: %s"%(name, usage)
+                return None
+            index += 1
+        return options, args[:first] + args[index:]
+
+    def getDiskSize(self, machine):
+        """ @return: Size of hard disks of machine in bytes, expected size of its appliance """
+        size = 0
+        for attachment in self.active.mgr.getArray(machine, 'mediumAttachments'):
+            if attachment.medium is not None and attachment.type == self.active.const.DeviceType_HardDisk:
+                size += int(attachment.medium.size)
+        return size
+
+    def getApplianceSize(self, filename):
+        """ @return: Size of appliance file and disk images referenced by OVF descriptor in bytes """
+        size = path.getsize(filename)
+        if filename.lower().endswith(".ovf"):
+            with open(filename, 'r') as fp:
+                for href in set(re.findall(r'href="([^"]+)"', fp.read())):
+                    disk = path.join(path.dirname(filename), href)
+                    if path.isfile(disk):
+                        size += path.getsize(disk)
+        return size
+
     def cmdExportVM(self,args):
+        usage = "exportvm <machine_name|group|machine1,machine2,...> [--jobs=<count>] [--per-host=<count>] [--bandwidth=<MB/s>] <output_dir> [format]"
+        parsed = self.parseApplianceArgs(args, "exportvm", usage)
+        if parsed is None:
+            return 0
+        options, args = parsed
         if len(args) < 2 or len(args) > 3:
-            print "Wrong arguments for exportvm. Usage: exportvm <machine_name> <output_dir> [format]"
+            print "Wrong arguments for exportvm. Usage: " + usage
             return 0
+        if ',' in args[0]: # List of machines of current host
+            machines = {self.active.name: dict((machname, {}) for machname in args[0].split(',') if machname)}
+            return self.exportMachines(machines, args, options)
         machname = args[0]
         expDir = args[1] 
         if len(args) == 3:
@@ -1292,25 +2598,168 @@ class Interpreter():
             os.mkdir(expDir)
         vbox = self.active.vbox
         appliance = vbox.createAppliance()
-        machine = vbox.findMachine(machname)
-        desc = machine.exportTo(appliance, '')
+        desc = self.active.withMachine(machname, lambda machine: machine.exportTo(appliance, ''))
         progress = appliance.write(format, None, expPath)
-        self.progressBar(progress)
+        self.progressBar(progress, "export " + machname)
         return 0
-    
+
+    def fanoutExportVM(self, args):
+        """
+        Export all machines of group, appliances are written concurrently
+        """
+        usage = "exportvm <group> [--jobs=<count>] [--per-host=<count>] [--bandwidth=<MB/s>] <output_dir> [format]"
+        parsed = self.parseApplianceArgs(args, "exportvm", usage)
+        if parsed is None:
+            return 0
+        options, args = parsed
+        if len(args) < 2 or len(args) > 3:
+            print "Wrong arguments for exportvm. Usage: " + usage
+            return 0
+        return self.exportMachines(self.groups[args[0]].getMachines(), args, options, args[0])
+
+    def exportMachines(self, machines, args, options, groupname=None):
+        """
+        Export several machines concurrently, number of appliances written at once
+        is limited globally, on every host and by disk bandwidth
+        @param machines: Dictionary host -> dictionary of machine names
+        @param args: Command arguments without options
+        @param options: Dictionary of options parsed by parseApplianceArgs
+        """
+        expDir = args[1]
+        format = args[2] if len(args) == 3 else "ovf-1.0"
+        if not path.isdir(expDir):
+            os.makedirs(expDir)
+        limiter = BandwidthLimiter(options['bandwidth'] * 1048576)
+        def export(args):
+            return self.exportAppliance(args[0], expDir, format, limiter)
+        started = time.time()
+        results = self.machinesCommand(machines, export, args, options['jobs'], False, options['per-host'], groupname)
+        self.printApplianceReport(results, limiter, time.time() - started)
+        return 0
+
+    def exportAppliance(self, machname, expDir, format, limiter):
+        """
+        Export a single machine once bandwidth limiter admits it
+        @return: Dictionary with path and size of appliance
+        """
+        machine, size = self.active.withMachine(machname, lambda machine: (machine, self.getDiskSize(machine)))
+        expPath = path.join(expDir, "%s_%s.%s"%(self.active.name, machname, "ova" if "ova" in format else "ovf"))
+        with limiter.admit(size) as slot:
+            appliance = self.active.vbox.createAppliance()
+            machine.exportTo(appliance, '')
+            progress = appliance.write(format, None, expPath)
+            self.progressBar(progress, "export " + machname, slot.watch)
+        return {'file': expPath, 'size': self.getApplianceSize(expPath)}
+
     def cmdImportVM(self, args):
-        if len(args) != 1:
-            print "Wrong arguments for importvm. Usage: importvm <path_to_image>"
+        usage = "importvm [--jobs=<count>] [--per-host=<count>] [--bandwidth=<MB/s>] <path_to_image|directory> [...]"
+        parsed = self.parseApplianceArgs(args, "importvm", usage, 0)
+        if parsed is None:
+            return 0
+        options, args = parsed
+        files = []
+        for arg in args:
+            for name in arg.split(','):
+                if path.isdir(name): # All appliances of directory
+                    files += sorted(path.join(name, entry) for entry in os.listdir(name)
+                                    if entry.lower().endswith((".ova", ".ovf")))
+                elif name:
+                    files.append(name)
+        if not len(files):
+            print "Wrong arguments for importvm. Usage: " + usage
             return 0
+        if len(files) > 1 or len(args) > 1 or path.isdir(args[0]):
+            return self.importAppliances({self.active.name: files}, options)
         vbox = self.active.vbox
-        import_file = args[0]
+        import_file = files[0]
         appliance = vbox.createAppliance()
         progress = appliance.read(import_file)
-        self.progressBar(progress, 1000)
+        self.progressBar(progress, "read " + path.basename(import_file))
         appliance.interpret()
         progress = appliance.importMachines(None)
-        self.progressBar(progress, 1000) 
+        self.progressBar(progress, "import " + path.basename(import_file))
         return 0
+
+    def fanoutImportVM(self, args):
+        """
+        Import appliances of all machines of group from directory, every machine
+        is imported to its host from appliance written by exportvm
+        """
+        usage = "importvm <group> [--jobs=<count>] [--per-host=<count>] [--bandwidth=<MB/s>] <input_dir>"
+        parsed = self.parseApplianceArgs(args, "importvm", usage)
+        if parsed is None:
+            return 0
+        options, args = parsed
+        if len(args) != 2 or not path.isdir(args[1]):
+            print "Wrong arguments for importvm. Usage: " + usage
+            return 0
+        files = {}
+        for host, machines in self.groups[args[0]].getMachines().items():
+            for machname in machines.keys():
+                candidates = [path.join(args[1], "%s_%s.%s"%(host, machname, ext)) for ext in ["ova", "ovf"]]
+                candidates = [filename for filename in candidates if path.isfile(filename)]
+                if not len(candidates):
+                    print "No appliance of machine %s on host %s in %s"%(machname, host, args[1])
+                    continue
+                files.setdefault(host, []).append(candidates[0])
+        return self.importAppliances(files, options, args[0])
+
+    def importAppliances(self, files, options, groupname=None):
+        """
+        Import several appliances concurrently, see exportMachines
+        @param files: Dictionary host -> list of appliance files imported to the host
+        """
+        limiter = BandwidthLimiter(options['bandwidth'] * 1048576)
+        def importvm(args):
+            return self.importAppliance(args[0], limiter)
+        files = dict((host, OrderedDict((filename, {}) for filename in filenames)) for host, filenames in files.items())
+        started = time.time()
+        results = self.machinesCommand(files, importvm, [None], options['jobs'], False, options['per-host'], groupname)
+        self.printApplianceReport(results, limiter, time.time() - started)
+        return 0
+
+    def importAppliance(self, filename, limiter):
+        """
+        Import a single appliance once bandwidth limiter admits it
+        @return: Dictionary with path and size of appliance
+        """
+        size = self.getApplianceSize(filename)
+        with limiter.admit(size) as slot:
+            appliance = self.active.vbox.createAppliance()
+            progress = appliance.read(filename)
+            self.progressBar(progress, "read " + path.basename(filename))
+            appliance.interpret()
+            progress = appliance.importMachines(None)
+            self.progressBar(progress, "import " + path.basename(filename), slot.watch)
+        self.active.inventory.invalidate() # Imported machines are new on host
+        return {'file': filename, 'size': size}
+
+    def printApplianceReport(self, results, limiter, duration):
+        """
+        Print size, time and throughput of every exported or imported appliance
+        @param results: List of TaskResult objects returned by exportAppliance or importAppliance
+        @param limiter: BandwidthLimiter used by the operations
+        @param duration: Duration of all operations in seconds
+        """
+        if not len(results):
+            print "No appliances were processed"
+            return
+        total = 0
+        print "%-20s %-32s %-8s %10s %10s %8s %s"%("Host", "Appliance", "Status", "Size [MB]", "Time [s]", "MB/s", "Error")
+        for result in results:
+            host, name = result.key
+            latency = result.getLatency()
+            if result.isOk():
+                total += result.value['size']
+                size = result.value['size'] / 1048576.0
+                print "%-20s %-32s %-8s %10.1f %10.2f %8.1f"%(host, path.basename(result.value['file']), result.status, size,
+                                                             latency, size / latency if latency > 0 else 0)
+            else:
+                print "%-20s %-32s %-8s %10s %10s %8s %s"%(host, path.basename(name), result.status, "-",
+                                                          "%.2f"%latency if latency is not None else "-", "-", result.error)
+        print "%d of %d appliances done, %.1f MB in %.2f s (%.1f MB/s), operations waited for bandwidth %.2f s in total"%(
+              len([result for result in results if result.isOk()]), len(results), total / 1048576.0, duration,
+              total / 1048576.0 / duration if duration > 0 else 0, limiter.waited)
     
     def cmdList(self, args):
         isAny = False
@@ -1326,46 +2775,171 @@ class Interpreter():
         if len(args) > 0:
             print "Wrong arguments for host. Usage: host"
             return 0
-        vbox = self.active.vbox
-        host = vbox.host
+        snapshot = self.active.inventory.get()
+        host = snapshot.host
         print "VBoxWebSrv host:    " + str(self.active.host)
         print "VBoxWebSrv port:    " + str(self.active.port)
         print "VBoxWebSrv user:    " + (str(self.active.user) if len(self.active.user) else "No user")
-        print "nameservers:        " + ("; ".join(str(ns) for ns in host.nameServers)) 
-        print "CPU family:         " + str(host.getProcessorDescription(0))
-        print "CPU physical cores: " + str(host.processorCoreCount)
-        print "CPU logical cores:  " + str(host.processorCount)
-        print "Operating system:   " + str(host.operatingSystem)
-        print "OS version:         " + str(host.OSVersion)
-        print "Memory size:        " + str(host.memorySize) + " MB"
+        if not len(host):
+            print "Could not read host information"
+            return 0
+        print "nameservers:        " + ("; ".join(host['nameServers'])) 
+        print "CPU family:         " + host['processor']
+        print "CPU physical cores: " + str(host['processorCoreCount'])
+        print "CPU logical cores:  " + str(host['processorCount'])
+        print "Operating system:   " + host['operatingSystem']
+        print "OS version:         " + host['OSVersion']
+        print "Memory size:        " + str(host['memorySize']) + " MB"
+        print "Machines:           " + str(len(snapshot.machines))
+        print "Snapshot age:       %.1f s"%snapshot.getAge()
         return 0
         
     def cmdListVms(self, args):
         if len(args) != 0:
             print "Wrong arguments for listvms. Usage: host"
             return 0
-        vbox = self.active.vbox
-        machines = self.active.mgr.getArray(vbox, 'machines')
-        for mach in machines:
-            print str(mach.name) + ", " + str(mach.OSTypeId)
+        snapshot = self.active.inventory.get()
+        for record in snapshot.machines:
+            print record.name + ", " + record.osType
+        print "Snapshot age: %.1f s"%snapshot.getAge()
         return 0
     
     def cmdListRunningVms(self, args):
         if len(args) != 0:
             print "Wrong arguments for listrunningvms"
             return 0
-        isAny = False
-        vbox = self.active.vbox
-        machines = self.active.mgr.getArray(vbox, 'machines')
-        for mach in machines:
-            state = mach.state
-            if state in ['FirstOnline', 'LastOnline']:
-                isAny = True
-                print str(mach.name) + " " + str(mach.OSTypeId)
-        if not isAny:
+        # State table is synced on first use, then kept up to date by events
+        running = [(record['name'], record['osType']) for record in self.active.states.getRunning()]
+        for name, osType in running:
+            print name + " " + osType
+        if not len(running):
             print "No running machines"        
         return 0
+
+    def cmdRefresh(self, args):
+        """Take a new inventory snapshot of host"""
+        if len(args) > 1:
+            print "Wrong arguments for refresh. Usage: refresh [hostname]"
+            return 0
+        env = self.envs.get(args[0]) if len(args) else self.active
+        if env is None:
+            print "Unknown host"
+            return 0
+        snapshot = env.inventory.refresh()
+        print "%d machines read from %s in %.2f s"%(len(snapshot.machines), env.name, snapshot.duration)
+        return 0
+
+    def cmdVmState(self, args):
+        """Print states of machines known from events"""
+        if len(args) > 1:
+            print "Wrong arguments for vmstate. Usage: vmstate [machine|group]"
+            return 0
+        if len(args) and args[0] in self.groups.keys():
+            machines = self.groups[args[0]].getMachines()
+        elif len(args):
+            machines = {self.active.name: [args[0]]}
+        else:
+            machines = {self.active.name: None} # All machines of active host
+        for host, machnames in machines.items():
+            env = self.envs.get(host)
+            if env is None:
+                print "Unexisting host " + host
+                continue
+            try:
+                env.connection.ensure() # Host might be unreachable so far
+            except Exception as e:
+                print "%-20s Host is not connected: %s"%(host, str(e))
+                continue
+            if machnames is None:
+                machnames = [record['name'] for record in env.states.getRecords()]
+            for machname in machnames:
+                record = env.states.getRecord(machname)
+                state = env.states.getStateName(record['state']) if record else "Unknown machine"
+                print "%-20s %-24s %s"%(host, machname, state)
+        return 0
     
+    def cmdProgress(self, args):
+        if len(args) > 0:
+            print "Wrong arguments for progress. Usage: progress"
+            return 0
+        operations = self.tracker.getOperations()
+        if not len(operations):
+            print "No operations"
+        for op in operations:
+            print "%3d %-30s %3d%% %-10s %.1f s %s"%(op.id, op.label, op.percent, op.getStatus(), op.getElapsed(), op.error or "")
+        return 0
+
+    def cmdCancel(self, args):
+        if len(args) != 1:
+            print "Wrong arguments for cancel. Usage: cancel <operation_id>"
+            return 0
+        try:
+            opid = int(args[0])
+        except ValueError:
+            print "Operation id must be a number"
+            return 0
+        if self.tracker.getOperation(opid) is None:
+            print "Unknown operation %d"%opid
+        elif self.tracker.cancel(opid):
+            print "Canceling..."
+        else:
+            print "Operation cannot be canceled"
+        return 0
+
+    def cmdDiag(self, args):
+        if len(args) > 0:
+            print "Wrong arguments for diag. Usage: diag"
+            return 0
+        for name, env in self.envs.items():
+            conn = env.connection
+            print name
+            print 4*" " + "Connection:     " + ("webservice" if env.remote else "COM") + ", " + env.getState()
+            print 4*" " + "Idle time:      %.1f s"%conn.getIdleTime()
+            print 4*" " + "Reconnects:     %d"%conn.reconnects
+            print 4*" " + "Probes:         %d (%d failed)"%(conn.probes, conn.failedProbes)
+            cache = env.machineCache
+            print 4*" " + "Machine cache:  %d/%d entries, %d hits, %d misses (%.0f%%), %d evictions"%(cache.size(), cache.capacity,
+                                                     cache.hits, cache.misses, 100 * cache.getHitRatio(), cache.evictions)
+            print 4*" " + "Events:         %s, %d received, %d errors"%("subscribed" if env.events.subscribed else "not subscribed",
+                                                                         env.events.received, env.events.errors)
+            print 4*" " + "State table:    %d machines, %d full syncs"%(len(env.states.machines), env.states.syncs)
+            snapshot = env.inventory.peek()
+            sessions = env.sessions
+            print 4*" " + "Sessions:       %d open, %d locks, %d reused"%(sessions.getOpenCount(), sessions.locks, sessions.reuses)
+            print 4*" " + "Guest sessions: %d idle, %d logons, %d reused"%(sessions.getIdleGuestCount(), sessions.guestLogons, sessions.guestReuses)
+            print 4*" " + "Inventory:      %d snapshots, %s"%(env.inventory.refreshes,
+                                                             "age %.1f s"%snapshot.getAge() if snapshot else "no snapshot")
+        return 0
+
+    def cmdStats(self, args):
+        if len(args) == 1 and args[0] == 'clear':
+            self.metrics.clear()
+            return 0
+        if len(args) == 2 and args[0] == 'export':
+            try:
+                self.exportMetrics(args[1])
+            except (IOError, OSError) as e:
+                print "Could not write metrics: " + str(e)
+            return 0
+        if len(args) > 1 or (len(args) == 1 and args[0] not in ["dispatch", "group", "lock", "progress"]):
+            print "Wrong arguments for stats. Usage: stats [dispatch | group | lock | progress | clear | export <file>]"
+            return 0
+        histograms = self.metrics.getHistograms(args[0] if len(args) else None)
+        if not len(histograms):
+            print "No statistics"
+            return 0
+        print "%-9s %-16s %-20s %7s %9s %9s %9s %9s"%("Stage", "Command", "Host", "Count", "p50 [s]", "p95 [s]", "p99 [s]", "Max [s]")
+        for (stage, command, host), histogram in histograms:
+            print "%-9s %-16s %-20s %7d %9.3f %9.3f %9.3f %9.3f"%(stage, command, host, histogram.count,
+                        histogram.getPercentile(50), histogram.getPercentile(95), histogram.getPercentile(99), histogram.max)
+        return 0
+
+    def exportMetrics(self, filename):
+        """ Write latency histograms to file in Prometheus text format """
+        self.metrics.exportPrometheus(filename)
+        if self.autoMode:
+            self.log("Metrics exported to %s"%filename)
+
     def cmdTest(self, args):
         print "Current Environment: " + (self.active.name if self.active else "None")        
         print "Using " + ("Webservice" if self.isRemote else "COM model")
@@ -1378,7 +2952,25 @@ if __name__ == "__main__":
     parser.add_argument("-c", "--config-file", dest="config_file", help = "Configuration file")
     parser.add_argument("-w", "--webservice", dest="style", action="store_const", const="WEBSERVICE", help = "Use webservice. If not passed, COM model is used")
     parser.add_argument("-o", "--opts", dest="opts", help="Additional command line parameters. Parameters must be split by a single comma. Parameters are passed in format paramname=paramvalue. Supported parameters are: host, port, user, password")
+    parser.add_argument("-n", "--dry-run", dest="dry_run", action="store_true", help = "Validate batch file and print its plan with estimated durations, do not execute it")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=maxWorkers, help = "Maximum number of machines processed concurrently by group commands. Default value: %d"%maxWorkers)
+    parser.add_argument("--backend", dest="backend", choices=["vbox", "sim"], default="vbox", help = "VirtualBox backend. 'sim' uses in-process simulated servers. Default value: vbox")
+    parser.add_argument("--sim-latency", dest="sim_latency", type=float, default=0.0, help = "Latency of every call to simulated server in miliseconds. Default value: 0")
+    parser.add_argument("--sim-failure-rate", dest="sim_failure_rate", type=float, default=0.0, help = "Probability that a call to simulated server fails, 0.0 - 1.0. Default value: 0.0")
+    parser.add_argument("--sim-machines", dest="sim_machines", type=int, default=10, help = "Number of machines of every simulated host. Default value: 10")
+    parser.add_argument("--sim-operation-time", dest="sim_operation_time", type=float, default=0.5, help = "Duration of long operations (start, export, ...) on simulated server in seconds. Default value: 0.5")
+    parser.add_argument("--sim-seed", dest="sim_seed", type=int, help = "Seed of simulated servers, makes fleets and failures reproducible")
+    parser.add_argument("-t", "--connect-timeout", dest="connect_timeout", type=float, default=hostConnectTimeout, help = "Maximum time in seconds to wait for connection to a host. Default value: %g"%hostConnectTimeout)
+    parser.add_argument("--sim-unreachable", dest="sim_unreachable", help = "Simulated hosts which do not answer, split by a single comma")
+    parser.add_argument("--watch-config", dest="watch_config", action="store_true", help = "Reload configuration file automatically when it changes. Used in interactive mode only")
+    parser.add_argument("-m", "--metrics-file", dest="metrics_file", help = "Write latency histograms in Prometheus text format to this file when batch ends")
     args = parser.parse_args(sys.argv[1:])
+    Environment.connectTimeout = args.connect_timeout
+    if args.backend == "sim":
+        SimulatedManager.configure(args.sim_latency / 1000.0, args.sim_failure_rate, args.sim_machines,
+                                   args.sim_operation_time, args.sim_seed,
+                                   args.sim_unreachable.split(',') if args.sim_unreachable else None)
+        Environment.managerClass = SimulatedManager
     
     params = {'style' : args.style}
     if args.opts is not None:
@@ -1400,18 +2992,23 @@ if __name__ == "__main__":
             params['password'] = params.get('password', "")
         else: 
             params['host'] = 'localhost'
-        env = Environment(params)
-    except EnvironmentError as e:
+        env = Environment(params, False) # Connected by the first network command
+    except (EnvironmentException, EnvironmentError) as e:
         print str(e) # print error
         sys.exit(1)
     
     interpreter = Interpreter(args.style)
+    interpreter.maxWorkers = args.jobs
+    interpreter.metricsFile = args.metrics_file
+    interpreter.lazyConnect = not args.batch_file # Batch reports unreachable hosts before it starts
     if (args.config_file):
         interpreter.loadConfiguration(args.config_file)
+    if args.config_file and args.watch_config and not args.batch_file:
+        interpreter.watchConfiguration(args.config_file)
     if not interpreter.active and 'env' in locals():
         interpreter.addEnv(env)
         interpreter.setActiveEnv(env.getName())
-    interpreter.run(args.batch_file)
+    interpreter.run(args.batch_file, args.dry_run)
     
     # Interpret finished
     for env in interpreter.envs.values():
@@ -0,0 +1,86 @@
+"""
+File: simulated.py
+Author: agent
+Date: 2026-10-17
+Brief: Interpreter connected to simulated VirtualBox servers, shared by tests
+"""
+
+import atexit
+import os
+import sys
+import tempfile
+import time
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.manager import * # Interpreter and simulated backend
+
+watchers = [] # Event watcher threads of closed interpreters
+
+def writeTemp(content, suffix=".txt"):
+    """
+    Write content to a new temporary file
+    @return: Path of the file, caller removes it
+    """
+    fd, filename = tempfile.mkstemp(suffix)
+    with os.fdopen(fd, 'w') as fp:
+        fp.write(content)
+    return filename
+
+def createInterpreter(config="host name=h1\n", machines=6, operationTime=0.05, latency=0.0, unreachable=None, lazyConnect=False):
+    """
+    Create interpreter with configuration loaded on simulated servers
+    @param config: Content of configuration file. Default value: single host h1
+    @param machines: Number of machines of every simulated host. Default value: 6
+    @param operationTime: Duration of long operations in seconds. Default value: 0.05
+    @param latency: Duration of every call in seconds. Default value: 0.0
+    @param unreachable: List of host names which do not answer. Default value: None
+    @param lazyConnect: Hosts are connected by the first command which needs them. Default value: False
+    @return: Interpreter object, the first host is active and connected unless lazyConnect is set
+    """
+    SimulatedManager.configure(latency, 0.0, machines, operationTime, seed=1, unreachable=unreachable)
+    Environment.managerClass = SimulatedManager
+    interpreter = Interpreter('WEBSERVICE')
+    interpreter.history = LatencyHistory(os.path.join(tempfile.gettempdir(), "managerlatency-test")) # Never touch user history
+    interpreter.lazyConnect = lazyConnect
+    filename = writeTemp(config)
+    try:
+        interpreter.loadConfiguration(filename)
+    finally:
+        os.remove(filename)
+    if interpreter.active is not None and not lazyConnect:
+        interpreter.active.connection.ensure()
+    return interpreter
+
+def captureOutput(func, *args):
+    """
+    Call function and collect what it prints
+    @return: Printed text
+    """
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        func(*args)
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+def waitUntil(condition, timeout=5.0):
+    """ Events are delivered by another thread, wait for their effect """
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+def closeInterpreter(interpreter):
+    """ Stop event watchers and log off from all hosts """
+    for env in interpreter.envs.values():
+        interpreter.closeEnvironment(env)
+        if env.events.thread is not None:
+            watchers.append(env.events.thread)
+
+@atexit.register
+def joinWatchers():
+    """ Stopped watchers end with their current wait, they must not outlive the interpreter """
+    for thread in watchers:
+        thread.join()
@@ -0,0 +1,91 @@
+"""
+File: test_appliance.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of concurrent export and import of machines and bandwidth limit
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from modules.throttle import BandwidthLimiter
+from tests.simulated import *
+
+class Measured():
+    """ Operation with fixed progress """
+    def __init__(self, percent):
+        self.percent = percent
+
+class BandwidthLimiterTest(unittest.TestCase):
+    def measuredSlot(self, limiter, size):
+        slot = limiter.admit(size)
+        slot.watch(Measured(100))
+        slot.started -= 1.0 # Whole size moved in one second
+        return slot
+
+    def testUnlimited(self):
+        limiter = BandwidthLimiter(0)
+        slots = [limiter.admit(100) for index in range(5)]
+        self.assertEqual(len(limiter.slots), 5)
+        for slot in slots:
+            slot.release()
+        self.assertEqual(limiter.slots, [])
+
+    def testUnmeasuredOperationHoldsOthers(self):
+        limiter = BandwidthLimiter(1000, warmup=0.0, interval=0.01)
+        first = limiter.admit(100)
+        admitted = []
+        thread = threading.Thread(target=lambda: admitted.append(limiter.admit(100)))
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual(admitted, [])
+        first.release()
+        thread.join(2)
+        self.assertEqual(len(admitted), 1)
+        self.assertTrue(limiter.waited >= 0.05)
+
+    def testThroughputOfRunningOperations(self):
+        limiter = BandwidthLimiter(250, warmup=0.0)
+        self.measuredSlot(limiter, 100)
+        with limiter.lock:
+            self.assertTrue(limiter.canAdmit()) # 100 B/s running, the next one is expected as fast
+        self.measuredSlot(limiter, 100)
+        with limiter.lock:
+            self.assertFalse(limiter.canAdmit()) # 300 B/s would exceed the limit
+
+class ApplianceTest(unittest.TestCase):
+    def setUp(self):
+        config = "host name=h1\n" + "".join("machine name=%s host=h1 group=g\n"%name for name in ['vm0001', 'vm0002', 'vm0004'])
+        self.interpreter = createInterpreter(config)
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.vbox = self.interpreter.active.vbox
+
+    def testExportAndImportOfGroup(self):
+        output = captureOutput(self.interpreter.runArgs, ['exportvm', 'g', '--jobs=2', self.directory])
+        self.assertTrue("3 of 3 appliances done" in output)
+        self.assertEqual(sorted(os.listdir(self.directory)), ["h1_vm0001.ovf", "h1_vm0002.ovf", "h1_vm0004.ovf"])
+        with open(os.path.join(self.directory, "h1_vm0002.ovf"), 'r') as fp:
+            self.assertEqual(fp.read(), "vm0002 Windows7_64 1024 1\n")
+        output = captureOutput(self.interpreter.runArgs, ['importvm', 'g', self.directory])
+        self.assertTrue("3 of 3 appliances done" in output)
+        self.assertEqual(self.vbox.getByName('vm0004_1')._OSTypeId, 'RedHat_64') # Name of imported copy is unique
+        self.assertEqual(len(self.vbox.registered), 9)
+
+    def testExportOfListOfMachines(self):
+        output = captureOutput(self.interpreter.runArgs, ['exportvm', 'vm0001,vm0005', '--bandwidth=100', self.directory])
+        self.assertTrue("2 of 2 appliances done" in output)
+        self.assertEqual(sorted(os.listdir(self.directory)), ["h1_vm0001.ovf", "h1_vm0005.ovf"])
+
+    def testMissingApplianceIsReported(self):
+        output = captureOutput(self.interpreter.runArgs, ['importvm', 'g', self.directory])
+        self.assertTrue("No appliance of machine vm0001 on host h1" in output)
+        self.assertTrue("No appliances were processed" in output)
+
+if __name__ == '__main__':
+    unittest.main()
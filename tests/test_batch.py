@@ -0,0 +1,68 @@
+"""
+File: test_batch.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of validation and dry run of batch files
+"""
+
+import os
+import unittest
+
+from tests.simulated import *
+
+class BatchValidationTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter("host name=h1\nmachine name=vm0000 host=h1 group=g\n")
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.filenames = []
+
+    def tearDown(self):
+        for filename in self.filenames:
+            os.remove(filename)
+
+    def parse(self, content):
+        self.filenames.append(writeTemp(content))
+        return self.interpreter.parseBatch(self.filenames[-1])
+
+    def testParseErrors(self):
+        scheduler, errors = self.parse("after=b sleep 0\nsleep 'unclosed\n")
+        self.assertEqual(len(scheduler.steps), 1)
+        self.assertEqual(errors[0], (1, "Unknown step 'b' in after="))
+        self.assertEqual(errors[1][0], 2)
+        self.assertTrue(errors[1][1].startswith("Syntax error"))
+
+    def testCompileErrors(self):
+        scheduler, errors = self.parse("nosuchcommand\nstart\nswitchhost h2\nvmstate g\nsleep 1 2\n")
+        self.assertEqual(errors, [])
+        errors = self.interpreter.compileBatch(scheduler)
+        self.assertEqual([line for line, message in errors], [1, 2, 3, 5])
+        self.assertEqual(errors[0][1], "Unknown command 'nosuchcommand'")
+        self.assertEqual(errors[2][1], "Unknown host 'h2'")
+
+    def testConfigurationChangesAreSimulated(self):
+        config = writeTemp("host name=h2\nmachine name=vm0000 host=h2 group=g2\n")
+        self.filenames.append(config)
+        scheduler, errors = self.parse("load %s\nswitchhost h2\nvmstate g2\nremovehost h2\nswitchhost h2\n"%config)
+        errors = self.interpreter.compileBatch(scheduler)
+        self.assertEqual(errors, [(5, "Unknown host 'h2'")])
+
+    def testDryRunExecutesNothing(self):
+        self.filenames.append(writeTemp("setram vm0001 2048\n@s sleep 0 &\nafter=s setcpus vm0001 2\n"))
+        output = captureOutput(self.interpreter.runArgs, ['batch', '--dry-run', self.filenames[-1]])
+        lines = output.splitlines()
+        self.assertEqual(lines[0].split(), ["Step", "Line", "Mode", "Command", "After", "Estimate"])
+        self.assertEqual(lines[2].split()[:4], ["2", "2", "background", "@s"])
+        self.assertTrue("setcpus vm0001 2" in lines[3] and " s " in lines[3])
+        self.assertTrue("Estimated serial time" in output)
+        machine = self.interpreter.active.vbox.getByName('vm0001')
+        self.assertEqual((machine._memorySize, machine._CPUCount), (1024, 1))
+
+    def testErrorsStopWholeBatch(self):
+        self.filenames.append(writeTemp("setram vm0001 2048\nstart\n"))
+        output = captureOutput(self.interpreter.runArgs, ['batch', self.filenames[-1]])
+        self.assertTrue("Line 2: " in output)
+        self.assertTrue("Batch file contains errors, nothing was executed" in output)
+        self.assertEqual(self.interpreter.active.vbox.getByName('vm0001')._memorySize, 1024)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+File: test_cache.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of LRU cache and cached machine handles
+"""
+
+import unittest
+
+from modules.simulator import SimulatedError
+from tests.simulated import *
+
+class LRUCacheTest(unittest.TestCase):
+    def testLeastRecentlyUsedIsEvicted(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1) # 'b' is the least recently used now
+        cache.put('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.size(), 2)
+
+    def testUpdateDoesNotEvict(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.put('a', 3)
+        self.assertEqual(cache.evictions, 0)
+        self.assertEqual(cache.get('a'), 3)
+
+    def testStatistics(self):
+        cache = LRUCache(4)
+        self.assertEqual(cache.getHitRatio(), 0.0)
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('x')
+        cache.discard('a')
+        cache.get('a')
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertAlmostEqual(cache.getHitRatio(), 1 / 3.0)
+        cache.put('b', 2)
+        cache.clear()
+        self.assertEqual(cache.size(), 0)
+
+class MachineCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter()
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.env = self.interpreter.active
+
+    def testMachineHandlesAreCached(self):
+        machine = self.env.findMachine('vm0001')
+        self.assertTrue(self.env.findMachine('vm0001') is machine)
+        self.assertEqual(self.env.machineCache.hits, 1)
+
+    def testUnregisteredMachineIsDropped(self):
+        self.env.findMachine('vm0001')
+        with self.env.mgr.backend.lock:
+            self.env.vbox.unregister(self.env.vbox.getByName('vm0001'))
+        self.assertTrue(waitUntil(lambda: self.env.machineCache.size() == 0))
+
+    def testStaleHandleIsLookedUpAgain(self):
+        stale = self.env.findMachine('vm0001')
+        machine = stale.release()
+        self.interpreter.runArgs(['setram', 'vm0001', '2048']) # Command with side effects is not repeated as a whole
+        self.assertEqual(machine._memorySize, 2048)
+        self.assertTrue(self.env.findMachine('vm0001') is machine)
+
+    def testStaleHandleOfStart(self):
+        self.env.findMachine('vm0001').release()
+        self.interpreter.runArgs(['start', 'vm0001'])
+        self.assertTrue(self.env.vbox.getByName('vm0001').isOnline())
+
+    def testOtherErrorsAreNotRetried(self):
+        self.env.findMachine('vm0000') # Running machine cannot be locked for writing
+        misses = self.env.machineCache.misses
+        self.assertRaises(SimulatedError, self.env.withMachine, 'vm0000',
+                          lambda machine: machine.lockMachine(self.env.mgr.getSessionObject(self.env.vbox), self.env.const.LockType_Write))
+        self.assertEqual(self.env.machineCache.misses, misses) # No other lookup
+        self.assertEqual(self.env.machineCache.size(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+File: test_clone.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of linked clones of template machine
+"""
+
+import unittest
+
+from tests.simulated import *
+
+class CloneTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter()
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.vbox = self.interpreter.active.vbox
+        self.template = self.vbox.getByName('vm0001')
+        self.template._memorySize = 2048
+        self.template.files['/etc/motd'] = "template\n"
+
+    def clone(self, *args):
+        return captureOutput(self.interpreter.runArgs, ['clone', 'vm0001'] + list(args))
+
+    def testClonesOfTemplateSnapshot(self):
+        output = self.clone('--count=3', 'web-{n:02d}')
+        self.assertTrue("Template vm0001 has no snapshot, taking snapshot 'Linked clone base'" in output)
+        self.assertTrue("3 of 3 clones created" in output)
+        for name in ['web-01', 'web-02', 'web-03']:
+            clone = self.vbox.getByName(name)
+            self.assertEqual((clone._OSTypeId, clone._memorySize), ('RedHat_64', 2048))
+            self.assertEqual(clone.files['/etc/motd'], "template\n")
+        names = [record.name for record in self.interpreter.active.inventory.get().machines]
+        self.assertTrue('web-03' in names) # Inventory was invalidated
+
+    def testSnapshotIsReused(self):
+        self.clone('web-{n}')
+        self.template.files['/etc/motd'] = "changed\n" # Change after the snapshot is not cloned
+        output = self.clone('--start=2', 'web-{n}')
+        self.assertFalse("taking snapshot" in output)
+        self.assertEqual(len(list(self.template.snapshots.walk())), 1)
+        self.assertEqual(self.vbox.getByName('web-2').files['/etc/motd'], "template\n")
+
+    def testExistingNameFails(self):
+        self.clone('web-{n}')
+        output = self.clone('--count=2', 'web-{n}')
+        self.assertTrue("1 of 2 clones created" in output)
+        self.assertTrue(self.vbox.getByName('web-2') is not None)
+
+    def testWrongPatterns(self):
+        output = self.clone('--count=2', 'web-{n!s:.0}') # Number is cut off
+        self.assertTrue("does not give unique names" in output)
+        output = self.clone('--count=x')
+        self.assertTrue(output.startswith("Wrong arguments for clone"))
+        output = self.clone('web-{m}')
+        self.assertTrue(output.startswith("Wrong name pattern"))
+        self.assertEqual(len(self.vbox.registered), 6)
+
+if __name__ == '__main__':
+    unittest.main()
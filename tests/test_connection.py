@@ -0,0 +1,76 @@
+"""
+File: test_connection.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of persistent webservice connection and its repair
+"""
+
+import errno
+import socket
+import unittest
+
+from tests.simulated import *
+from modules.simulator import GuestSession, SimulatedError
+
+class ConnectionTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter()
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.env = self.interpreter.active
+        self.machine = self.env.mgr.vbox.getByName('vm0001') # Powered off
+
+    def testConnectionIsReused(self):
+        calls = self.env.mgr.backend.calls
+        self.interpreter.runArgs(['setram', 'vm0001', '2048'])
+        self.interpreter.runArgs(['setcpus', 'vm0001', '2'])
+        self.assertEqual((self.machine._memorySize, self.machine._CPUCount), (2048, 2))
+        self.assertEqual(self.env.connection.reconnects, 0)
+        self.assertTrue(self.env.mgr.backend.calls - calls < 20)
+
+    def testCommandAfterDisconnectLogsInFirst(self):
+        self.interpreter.runArgs(['disconnect'])
+        self.assertEqual(self.env.getState(), "not connected")
+        self.interpreter.runArgs(['setram', 'vm0001', '2048'])
+        self.assertEqual(self.machine._memorySize, 2048)
+        self.assertEqual(self.env.connection.reconnects, 1)
+        self.assertEqual(self.env.getState(), "connected")
+
+    def testReadOnlyCommandIsRepeated(self):
+        self.env.mgr.backend.loggedOn = False # Server dropped the session
+        self.interpreter.runArgs(['listhostvms'])
+        self.assertEqual(self.env.connection.reconnects, 1)
+
+    def testCommandWithSideEffectsIsNotRepeated(self):
+        self.env.mgr.backend.loggedOn = False
+        self.assertRaises(SimulatedError, self.interpreter.runArgs, ['setram', 'vm0001', '2048'])
+        self.assertEqual(self.machine._memorySize, 1024)
+        self.assertEqual(self.env.connection.reconnects, 1) # Connection is repaired for the next command
+        self.interpreter.runArgs(['setram', 'vm0001', '2048'])
+        self.assertEqual(self.machine._memorySize, 2048)
+
+    def testSessionFaults(self):
+        connection = self.env.connection
+        self.assertTrue(connection.isSessionFault(Exception("Invalid managed object reference")))
+        self.assertTrue(connection.isSessionFault(socket.error(errno.ECONNRESET, "Connection reset by peer")))
+        self.assertFalse(connection.isSessionFault(socket.error(errno.ECONNREFUSED, "Connection refused")))
+        self.assertFalse(connection.isSessionFault(Exception("Connection refused")))
+        self.assertFalse(connection.recover(Exception("Machine is locked")))
+
+    def testGuestCommandIsNotRepeated(self):
+        started = []
+        processCreate = GuestSession.processCreate
+        def countingCreate(session, *args):
+            started.append(args[0])
+            return processCreate(session, *args)
+        GuestSession.processCreate = countingCreate
+        self.addCleanup(setattr, GuestSession, 'processCreate', processCreate)
+        self.env.mgr.vbox.getByName('vm0000').setState(self.env.const.MachineState_Running)
+        self.env.addMachine('vm0000', 'user', 'password')
+        self.env.mgr.backend.loggedOn = False
+        self.interpreter.runArgs(['gcmd', 'vm0000', '/bin/echo', 'once'])
+        self.assertEqual((started, self.env.connection.reconnects), ([], 1))
+        self.interpreter.runArgs(['gcmd', 'vm0000', '/bin/echo', 'once'])
+        self.assertEqual(started, ['/bin/echo'])
+
+if __name__ == '__main__':
+    unittest.main()
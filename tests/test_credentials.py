@@ -0,0 +1,78 @@
+"""
+File: test_credentials.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of precedence of machine credentials
+"""
+
+import unittest
+
+from tests.simulated import *
+
+CONFIG = """host name=h1
+machine name=vm0000 host=h1 user=host password=secret
+machine name=vm0001 host=h1 user=host
+machine name=vm0000 host=h1 group=first user=first password=secret
+machine name=vm0001 host=h1 group=first user=first password=secret
+machine name=vm0002 host=h1 group=first
+machine name=vm0002 host=h1 group=second user=second password=secret
+machine name=vm0003 host=h1 group=second user=second password=secret
+machine name=vm0003 host=h1 group=first user=first password=secret
+"""
+
+class CredentialIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter(CONFIG)
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.index = self.interpreter.credentials
+
+    def testHostTakesPrecedenceOverGroups(self):
+        self.assertEqual(self.index.lookup('h1', 'vm0000'), ('host', 'secret'))
+
+    def testIncompleteCredentialsAreSkipped(self):
+        self.assertEqual(self.index.lookup('h1', 'vm0001'), ('first', 'secret')) # Host has no password
+        self.assertEqual(self.index.lookup('h1', 'vm0002'), ('second', 'secret')) # First group has no credentials
+
+    def testEarlierGroupTakesPrecedence(self):
+        self.assertEqual(self.index.lookup('h1', 'vm0003'), ('first', 'secret'))
+
+    def testUnknownMachine(self):
+        self.assertEqual(self.index.lookup('h1', 'vm0005'), None)
+        self.assertEqual(self.index.lookup('h2', 'vm0000'), None)
+
+    def testChangesOfGroupsAreFollowed(self):
+        self.interpreter.groups['first'].removeMachine('h1', 'vm0003')
+        self.assertEqual(self.index.lookup('h1', 'vm0003'), ('second', 'secret'))
+        self.interpreter.groups['first'].addMachine('h1', 'vm0003', 'again', 'secret')
+        self.assertEqual(self.index.lookup('h1', 'vm0003'), ('again', 'secret'))
+        self.index.removeGroup(self.interpreter.groups['second'])
+        self.assertEqual(self.index.lookup('h1', 'vm0002'), None)
+
+    def testChangesOfHostAreFollowed(self):
+        env = self.interpreter.envs['h1']
+        env.removeMachine('vm0000')
+        self.assertEqual(self.index.lookup('h1', 'vm0000'), ('first', 'secret'))
+        env.addMachine('vm0000', 'other', 'secret')
+        self.assertEqual(self.index.lookup('h1', 'vm0000'), ('other', 'secret'))
+
+    def testRebuildKeepsGroupOrder(self):
+        groups = self.interpreter.groups
+        self.index.rebuild(self.interpreter.envs.values(), [groups['second'], groups['first']])
+        self.assertEqual(self.index.lookup('h1', 'vm0003'), ('first', 'secret'))
+        self.assertEqual(self.index.lookup('h1', 'vm0000'), ('host', 'secret'))
+
+    def testGroupsAreOrderedByRegistration(self):
+        index = CredentialIndex()
+        late, early = Group('late'), Group('early')
+        early.addMachine('h1', 'vm0000', 'early', 'secret')
+        late.addMachine('h1', 'vm0000', 'late', 'secret')
+        index.addGroup(late)
+        index.addGroup(early)
+        self.assertEqual(index.lookup('h1', 'vm0000'), ('late', 'secret'))
+        index.removeGroup(late)
+        self.assertEqual(index.lookup('h1', 'vm0000'), ('early', 'secret'))
+        late.addMachine('h1', 'vm0000', 'ignored', 'secret') # Removed group is not followed
+        self.assertEqual(index.lookup('h1', 'vm0000'), ('early', 'secret'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+File: test_distribute.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of distribution of file to all machines of group
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from tests.simulated import *
+
+class DistributeTest(unittest.TestCase):
+    def setUp(self):
+        config = "host name=h1\n" + "".join("machine name=%s host=h1 group=g user=u password=p\n"%name
+                                            for name in ['vm0000', 'vm0001', 'vm0003'])
+        self.interpreter = createInterpreter(config)
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(os.environ.__setitem__, 'HOME', os.environ['HOME'])
+        os.environ['HOME'] = self.directory # Transfer journals
+        generator = random.Random(1)
+        self.data = "".join(chr(generator.randint(0, 255)) for index in range(100000))
+        self.source = os.path.join(self.directory, "artifact.bin")
+        with open(self.source, 'wb') as fp:
+            fp.write(self.data)
+        self.vbox = self.interpreter.active.vbox
+
+    def distribute(self, *options):
+        return captureOutput(self.interpreter.runArgs, ['distribute', 'g'] + list(options) + ['--chunk-size=16384', self.source, '/opt/'])
+
+    def testFileIsSentToRunningMachines(self):
+        output = self.distribute()
+        self.assertTrue("Sent to 2, skipped 0, failed 1 machines" in output)
+        for name in ['vm0000', 'vm0003']:
+            self.assertEqual(self.vbox.getByName(name).files['/opt/artifact.bin'], self.data)
+        self.assertTrue("7 chunks of source read from disk" in output) # Read once for all machines
+
+    def testMachinesHavingFileAreSkipped(self):
+        self.vbox.getByName('vm0000').files['/opt/artifact.bin'] = self.data
+        self.vbox.getByName('vm0003').files['/opt/artifact.bin'] = self.data[:-1] + "x" # Same size, other content
+        output = self.distribute()
+        self.assertTrue("Sent to 1, skipped 1, failed 1 machines" in output)
+        self.assertEqual(self.vbox.getByName('vm0003').files['/opt/artifact.bin'], self.data)
+        output = self.distribute('--force')
+        self.assertTrue("Sent to 2, skipped 0, failed 1 machines" in output)
+
+    def testSingleMachine(self):
+        output = captureOutput(self.interpreter.runArgs, ['distribute', 'vm0000', self.source, '/opt/copy.bin'])
+        self.assertEqual(self.vbox.getByName('vm0000').files['/opt/copy.bin'], self.data)
+        self.assertTrue("Sent to 1, skipped 0, failed 0 machines" in output)
+
+if __name__ == '__main__':
+    unittest.main()
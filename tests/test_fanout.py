@@ -0,0 +1,50 @@
+"""
+File: test_fanout.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of guest command executed on all machines of group
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests.simulated import *
+
+class GcmdFanoutTest(unittest.TestCase):
+    def setUp(self):
+        config = "host name=h1\n" + "".join("machine name=%s host=h1 group=g user=u password=p\n"%name
+                                            for name in ['vm0000', 'vm0001', 'vm0003'])
+        self.interpreter = createInterpreter(config)
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def testIdenticalResultsAreSummarized(self):
+        output = captureOutput(self.interpreter.runArgs, ['gcmd', 'g', '--output-dir=' + self.directory, '/bin/echo', 'hello'])
+        lines = output.splitlines()
+        self.assertTrue(lines[0].startswith("2 machines exit code 0"))
+        self.assertEqual(lines[1].strip(), "h1/vm0000, h1/vm0003")
+        self.assertEqual(lines[2].strip(), "stdout| hello")
+        self.assertTrue(lines[3].startswith("1 machines FAILED"))
+        self.assertTrue("is not locked by a session" in lines[3]) # Powered off machine has no guest
+        with open(os.path.join(self.directory, "h1_vm0003.stdout"), 'rb') as fp:
+            self.assertEqual(fp.read(), "hello\n")
+
+    def testResultsAreSaved(self):
+        captureOutput(self.interpreter.runArgs, ['gcmd', 'g', '--output-dir=' + self.directory, '--jobs=1', '/bin/echo', 'hello'])
+        with open(os.path.join(self.directory, "results.json"), 'r') as fp:
+            records = dict((record['machine'], record) for record in json.load(fp))
+        self.assertEqual(sorted(records.keys()), ['vm0000', 'vm0001', 'vm0003'])
+        self.assertEqual((records['vm0000']['status'], records['vm0000']['exitCode'], records['vm0000']['stdoutBytes']), ("OK", 0, 6))
+        self.assertEqual(records['vm0001']['status'], "FAILED")
+        self.assertFalse('exitCode' in records['vm0001'])
+
+    def testWrongOptionIsRejected(self):
+        output = captureOutput(self.interpreter.runArgs, ['gcmd', 'g', '--jobs=x', '/bin/echo'])
+        self.assertTrue(output.startswith("Wrong arguments for gcmd"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+"""
+File: test_gshell.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of interactive guest shell
+"""
+
+import sys
+import unittest
+from StringIO import StringIO
+
+from tests.simulated import *
+
+class GuestShellTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter("host name=h1\nmachine name=vm0000 host=h1 user=u password=p\n")
+        self.addCleanup(closeInterpreter, self.interpreter)
+
+    def runShell(self, typed):
+        """ @return: Printed output of shell fed with typed text """
+        stdin = sys.stdin
+        sys.stdin = StringIO(typed)
+        try:
+            return captureOutput(self.interpreter.runArgs, ['gshell', 'vm0000'])
+        finally:
+            sys.stdin = stdin
+
+    def testInputIsPassedUntilExit(self):
+        output = self.runShell("echo one\necho two\nexit\necho never\n")
+        self.assertTrue("echo one\necho two\n" in output)
+        self.assertFalse("never" in output)
+        self.assertTrue(output.endswith("Exit code: 0\n"))
+
+    def testEndOfInputEndsShell(self):
+        output = self.runShell("echo one\n")
+        self.assertTrue("echo one\n" in output)
+        self.assertTrue(output.endswith("Exit code: 0\n"))
+
+    def testNotSupportedInAutoMode(self):
+        self.interpreter.autoMode = True
+        output = self.runShell("exit\n")
+        self.assertEqual(output, "This command is not supported in auto mode\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+File: test_guestio.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of streaming of guest process output
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from modules.guestio import CapturedOutput, OutputPump, STDOUT, STDERR
+from tests.simulated import *
+
+class OutputPumpTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter("host name=h1\nmachine name=vm0000 host=h1 user=u password=p\n")
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.env = self.interpreter.active
+        self.machine = self.env.vbox.getByName('vm0000')
+        self.data = "".join("line %d\n"%index for index in range(20000))
+        self.machine.files['/data'] = self.data
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def runProcess(self, args, minRead=1024, maxRead=8192):
+        """ @return: Tuple (pump, stdout, stderr) """
+        outputs = {STDOUT: [], STDERR: []}
+        with self.env.sessions.guest('vm0000', 'u', 'p') as (machine, session, guestSession):
+            proc = guestSession.processCreate(args[0], args, None, [], 0)
+            pump = OutputPump(proc, self.env.const, dict((handle, output.append) for handle, output in outputs.items()),
+                              minRead, maxRead, 0.1)
+            self.assertTrue(pump.run(5))
+        return pump, "".join(outputs[STDOUT]), "".join(outputs[STDERR])
+
+    def testWholeOutputIsRead(self):
+        pump, stdout, stderr = self.runProcess(['/bin/cat', '/data'])
+        self.assertEqual(stdout, self.data)
+        self.assertEqual((stderr, pump.received[STDOUT]), ("", len(self.data)))
+
+    def testOutputsAreSeparated(self):
+        pump, stdout, stderr = self.runProcess(['/bin/cat', '/data', '/missing'])
+        self.assertEqual(stdout, self.data)
+        self.assertEqual(stderr, "cat: /missing: No such file or directory\n")
+
+    def testReadSizeFollowsOutput(self):
+        reads = []
+        with self.env.sessions.guest('vm0000', 'u', 'p') as (machine, session, guestSession):
+            proc = guestSession.processCreate('/bin/cat', ['/bin/cat', '/data'], None, [], 0)
+            read = proc.read
+            proc.read = lambda handle, size, timeout: reads.append(size) or read(handle, size, timeout)
+            pump = OutputPump(proc, self.env.const, {STDOUT: lambda data: None}, 1024, 8192, 0.1)
+            pump.run(5)
+        self.assertEqual(reads[:4], [1024, 2048, 4096, 8192]) # Full buffers double the read size
+        self.assertEqual(max(reads), 8192)
+
+    def testOldGuestAdditionsArePolled(self):
+        with self.env.sessions.guest('vm0000', 'u', 'p') as (machine, session, guestSession):
+            proc = guestSession.processCreate('/bin/cat', ['/bin/cat', '/data'], None, [], 0)
+            proc.waitForArray = lambda flags, timeout: self.env.const.ProcessWaitResult_WaitFlagNotSupported
+            received = []
+            pump = OutputPump(proc, self.env.const, {STDOUT: received.append}, 1024, 8192, 0.1)
+            self.assertTrue(pump.run(5))
+        self.assertFalse(pump.waitSupported)
+        self.assertEqual("".join(received), self.data)
+
+    def testCapturedOutput(self):
+        output = CapturedOutput(os.path.join(self.directory, "out"), 10)
+        output.write("0123456789abc")
+        output.write("def")
+        output.close()
+        self.assertEqual((output.head, output.size), ("0123456789", 16))
+        with open(output.filename, 'rb') as fp:
+            self.assertEqual(fp.read(), "0123456789abcdef")
+
+    def testGcmdWritesOutputToFile(self):
+        filename = os.path.join(self.directory, "{machine}.out")
+        output = captureOutput(self.interpreter.runArgs, ['gcmd', 'vm0000', '--stdout=' + filename, '/bin/cat', '/data'])
+        with open(os.path.join(self.directory, "vm0000.out"), 'rb') as fp:
+            self.assertEqual(fp.read(), self.data)
+        self.assertTrue("Written %d bytes of stdout"%len(self.data) in output)
+        self.assertTrue("Exit code: 0" in output)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+File: test_guestpool.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of pool of guest sessions
+"""
+
+import unittest
+
+from tests.simulated import *
+
+class GuestPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter("host name=h1\nmachine name=vm0000 host=h1 user=u password=p\n")
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.env = self.interpreter.active
+        self.sessions = self.env.sessions
+        self.machine = self.env.vbox.getByName('vm0000')
+
+    def useGuest(self, user='u', password='p'):
+        with self.sessions.guest('vm0000', user, password) as (machine, session, guestSession):
+            return guestSession
+
+    def testGuestSessionIsReused(self):
+        captureOutput(self.interpreter.runArgs, ['gcmd', 'vm0000', '/bin/echo', 'a'])
+        output = captureOutput(self.interpreter.runArgs, ['gcmd', 'vm0000', '/bin/echo', 'b'])
+        self.assertTrue(output.startswith("b\n"))
+        self.assertEqual((self.sessions.guestLogons, self.sessions.guestReuses), (1, 1))
+        self.assertEqual(self.sessions.getIdleGuestCount(), 1)
+
+    def testCredentialsHaveOwnSessions(self):
+        first = self.useGuest()
+        self.assertFalse(self.useGuest('root', 'x') is first)
+        self.assertTrue(self.useGuest() is first)
+        self.assertEqual(self.sessions.getIdleGuestCount(), 2)
+
+    def testSessionOfRebootedGuestIsReplaced(self):
+        first = self.useGuest()
+        self.machine.boots += 1 # Guest rebooted, the machine kept running
+        second = self.useGuest()
+        self.assertFalse(second is first)
+        self.assertTrue(first.closed)
+        self.assertEqual(self.sessions.guestLogons, 2)
+
+    def testFailedSessionIsNotPooled(self):
+        def fail():
+            with self.sessions.guest('vm0000', 'u', 'p') as (machine, session, guestSession):
+                raise ValueError("broken")
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(self.sessions.getIdleGuestCount(), 0)
+
+    def testReleaseClosesPooledSessions(self):
+        guestSession = self.useGuest()
+        self.sessions.release('vm0000')
+        self.assertTrue(guestSession.closed)
+        self.assertEqual(self.sessions.getIdleGuestCount(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
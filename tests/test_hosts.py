@@ -0,0 +1,75 @@
+"""
+File: test_hosts.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of connection of configured hosts
+"""
+
+import time
+import unittest
+
+from tests.simulated import *
+
+HOSTS = "host name=h1\nhost name=h2\nhost name=h3\nmachine name=vm0001 host=h2 group=g\n"
+
+class ParallelConnectTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, Environment, 'connectTimeout', Environment.connectTimeout)
+        self.addCleanup(setattr, SimulatedManager, 'unreachableDelay', SimulatedManager.unreachableDelay)
+
+    def load(self, **kwargs):
+        """ @return: Tuple (interpreter, printed output, duration of loading) """
+        started = time.time()
+        created = []
+        output = captureOutput(lambda: created.append(createInterpreter(HOSTS, **kwargs)))
+        self.addCleanup(closeInterpreter, created[0])
+        return created[0], output, time.time() - started
+
+    def testHostsAreConnectedTogether(self):
+        interpreter, output, duration = self.load(latency=0.2)
+        self.assertTrue(all(env.isOpen() for env in interpreter.envs.values()))
+        self.assertTrue(duration < 0.5) # Three logons of 0.2 s
+        self.assertTrue("Connected 3 of 3 hosts" in output)
+
+    def testUnreachableHostTimesOut(self):
+        Environment.connectTimeout = 0.2
+        SimulatedManager.unreachableDelay = 1.0
+        interpreter, output, duration = self.load(unreachable=['h2'])
+        self.assertTrue(duration < 0.8)
+        self.assertTrue("Could not connect to host h2: Connection to host h2 timed out after 0.2 s" in output)
+        self.assertTrue("Connected 2 of 3 hosts" in output)
+        self.assertFalse(interpreter.envs['h2'].isOpen()) # Host and its machines are kept
+        self.assertEqual(interpreter.groups['g'].getMachines().keys(), ['h2'])
+        self.assertEqual(interpreter.active.getName(), 'h1')
+
+class LazyConnectTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter(HOSTS, lazyConnect=True)
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.envs = self.interpreter.envs
+
+    def testOnlyActiveHostIsConnected(self):
+        self.assertEqual(self.interpreter.active.getName(), 'h1')
+        self.assertTrue(waitUntil(lambda: self.envs['h1'].isOpen())) # Connected in background
+        self.assertFalse(self.envs['h2'].isOpen() or self.envs['h3'].isOpen())
+
+    def testFirstNetworkCommandConnects(self):
+        captureOutput(self.interpreter.runArgs, ['switchhost', 'h3'])
+        output = captureOutput(self.interpreter.runArgs, ['listhostvms'])
+        self.assertTrue(self.envs['h3'].isOpen())
+        self.assertTrue("vm0005" in output)
+        self.assertFalse(self.envs['h2'].isOpen())
+
+    def testLocalCommandsDoNotConnect(self):
+        captureOutput(self.interpreter.runArgs, ['creategroup', 'web'])
+        captureOutput(self.interpreter.runArgs, ['addtogroup', 'web', 'h2', 'vm0002'])
+        captureOutput(self.interpreter.runArgs, ['groups'])
+        self.assertFalse(self.envs['h2'].isOpen())
+
+    def testGroupCommandConnectsHostsOfGroup(self):
+        captureOutput(self.interpreter.runArgs, ['setram', 'g', '2048'])
+        self.assertEqual(self.envs['h2'].vbox.getByName('vm0001')._memorySize, 2048)
+        self.assertFalse(self.envs['h3'].isOpen())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+"""
+File: test_inventory.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of inventory snapshots and their invalidation
+"""
+
+import time
+import unittest
+
+from tests.simulated import *
+
+class InventoryTest(unittest.TestCase):
+    def setUp(self):
+        interpreter = createInterpreter()
+        self.addCleanup(closeInterpreter, interpreter)
+        self.env = interpreter.envs['h1']
+
+    def testSnapshotIsReusedUntilItExpires(self):
+        snapshot = self.env.inventory.get()
+        self.assertEqual([record.name for record in snapshot.machines], ["vm%04d"%index for index in range(6)])
+        self.assertEqual(snapshot.machines[1].osType, 'RedHat_64')
+        self.assertTrue(self.env.inventory.get() is snapshot)
+        self.assertEqual(self.env.inventory.refreshes, 1)
+        self.env.inventory.ttl = 0
+        time.sleep(0.01)
+        self.assertFalse(self.env.inventory.get() is snapshot)
+        self.assertEqual(self.env.inventory.refreshes, 2)
+
+    def testOnlyShownAttributesAreRead(self):
+        machine = self.env.vbox.getByName('vm0002')
+        calls = self.env.mgr.backend.calls
+        record = self.env.inventory.reader(machine)()
+        self.assertEqual(record, ('vm0002', 'Windows7_64'))
+        self.assertEqual(self.env.mgr.backend.calls - calls, 2)
+
+    def testUnregisteredMachineInvalidatesSnapshot(self):
+        self.env.inventory.get()
+        with self.env.mgr.backend.lock:
+            self.env.vbox.unregister(self.env.vbox.getByName('vm0001'))
+        self.assertTrue(waitUntil(lambda: self.env.inventory.peek() is None))
+        names = [record.name for record in self.env.inventory.get().machines]
+        self.assertEqual(len(names), 5)
+        self.assertFalse('vm0001' in names)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+File: test_logger.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of log writer of automatic mode
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from modules.logger import LogWriter
+from tests.simulated import *
+
+def readRecords(filename):
+    with open(filename, 'r') as fp:
+        return [json.loads(line) for line in fp]
+
+class LogWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.filename = os.path.join(self.directory, "log.txt")
+
+    def testRecordsAreWrittenInBackground(self):
+        writer = LogWriter(self.filename, flushInterval=0.05)
+        writer.write("Command finished", command="start", machine=None, duration=0.5)
+        writer.flush()
+        writer.close()
+        records = readRecords(self.filename)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['command'], "start")
+        self.assertFalse('machine' in records[0]) # Empty fields are left out
+
+    def testRotation(self):
+        writer = LogWriter(self.filename, maxBytes=200, backups=2, flushInterval=0.01, batchSize=1)
+        for index in range(20):
+            writer.write("Record %d"%index)
+            writer.flush()
+        writer.close()
+        self.assertEqual(sorted(os.listdir(self.directory)), ["log.txt", "log.txt.1", "log.txt.2"])
+        for name in os.listdir(self.directory):
+            self.assertTrue(os.path.getsize(os.path.join(self.directory, name)) < 300)
+        last = readRecords(self.filename) or readRecords(self.filename + ".1")
+        self.assertEqual(last[-1]['message'], "Record 19")
+
+class CommandLogTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter()
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.filename = writeTemp("")
+        self.addCleanup(os.remove, self.filename)
+        self.interpreter.autoMode = True
+        self.interpreter.logwriter = LogWriter(self.filename, flushInterval=0.05)
+        self.addCleanup(self.interpreter.logwriter.close)
+
+    def getRecords(self):
+        self.interpreter.logwriter.flush()
+        return dict((record['command'], record) for record in readRecords(self.filename))
+
+    def testMachineIsLoggedOnlyForMachineCommands(self):
+        self.interpreter.runArgs(['setram', 'vm0001', '2048'])
+        self.interpreter.runArgs(['sleep', '0'])
+        self.interpreter.runArgs(['creategroup', 'web'])
+        records = self.getRecords()
+        self.assertEqual(records['setram']['machine'], 'vm0001')
+        self.assertEqual(records['setram']['host'], 'h1')
+        self.assertEqual(records['setram']['outcome'], 'OK')
+        self.assertFalse('machine' in records['sleep'])
+        self.assertFalse('machine' in records['creategroup'])
+
+    def testGroupNameIsNotLoggedAsMachine(self):
+        self.interpreter.runArgs(['creategroup', 'web'])
+        self.interpreter.runArgs(['addtogroup', 'web', 'h1', 'vm0001'])
+        self.interpreter.runArgs(['setram', 'web', '2048'])
+        records = self.getRecords()
+        self.assertTrue(records['setram']['group'])
+        self.assertFalse('machine' in records['setram'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+File: test_metrics.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of latency histograms and their export
+"""
+
+import os
+import tempfile
+import unittest
+
+from tests.simulated import *
+
+class HistogramTest(unittest.TestCase):
+    def testBuckets(self):
+        histogram = Histogram([0.1, 1.0])
+        for duration in [0.05, 0.1, 0.5, 2.0]:
+            histogram.observe(duration)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+        self.assertEqual(histogram.max, 2.0)
+        self.assertAlmostEqual(histogram.getMean(), 2.65 / 4)
+
+    def testPercentiles(self):
+        histogram = Histogram([1.0, 2.0])
+        self.assertEqual(histogram.getPercentile(50), None)
+        for duration in [0.5] * 5 + [1.5] * 5:
+            histogram.observe(duration)
+        self.assertAlmostEqual(histogram.getPercentile(50), 1.0)
+        self.assertAlmostEqual(histogram.getPercentile(75), 1.5)
+        self.assertEqual(histogram.getPercentile(100), 1.5) # Never above maximum
+
+    def testMerge(self):
+        first, second = Histogram([1.0]), Histogram([1.0])
+        first.observe(0.5)
+        second.observe(3.0)
+        first.merge(second)
+        self.assertEqual((first.counts, first.count, first.max), ([1, 1], 2, 3.0))
+
+class MetricsTest(unittest.TestCase):
+    def testHistogramsByStage(self):
+        metrics = Metrics()
+        metrics.observe("dispatch", "start", "h1", 0.2)
+        metrics.observe("dispatch", "start", "h1", 0.4)
+        metrics.observe("lock", None, None, 0.01)
+        with metrics.timer("progress", "start", "h1"):
+            pass
+        keys = [key for key, histogram in metrics.getHistograms()]
+        self.assertEqual(keys, [("dispatch", "start", "h1"), ("lock", "-", "-"), ("progress", "start", "h1")])
+        (key, histogram), = metrics.getHistograms("dispatch")
+        self.assertEqual(histogram.count, 2)
+        metrics.clear()
+        self.assertEqual(metrics.getHistograms(), [])
+
+    def testPrometheusFormat(self):
+        metrics = Metrics()
+        metrics.observe("dispatch", 'cmd"x', "h1", 0.007)
+        lines = metrics.formatPrometheus().splitlines()
+        self.assertEqual(lines[1], "# TYPE vbox_manager_latency_seconds histogram")
+        labels = 'stage="dispatch",command="cmd\\"x",host="h1"'
+        self.assertTrue('vbox_manager_latency_seconds_bucket{%s,le="0.005"} 0'%labels in lines)
+        self.assertTrue('vbox_manager_latency_seconds_bucket{%s,le="0.01"} 1'%labels in lines)
+        self.assertTrue('vbox_manager_latency_seconds_bucket{%s,le="+Inf"} 1'%labels in lines) # Buckets are cumulative
+        self.assertTrue('vbox_manager_latency_seconds_count{%s} 1'%labels in lines)
+
+    def testExportOfInterpreterCommands(self):
+        interpreter = createInterpreter()
+        self.addCleanup(closeInterpreter, interpreter)
+        interpreter.runArgs(['listhostvms'])
+        interpreter.runArgs(['vmstate', 'vm0000'])
+        filename = os.path.join(tempfile.mkdtemp(), "metrics.prom")
+        try:
+            interpreter.cmdStats(['export', filename])
+            with open(filename, 'r') as fp:
+                content = fp.read()
+        finally:
+            os.remove(filename)
+            os.rmdir(os.path.dirname(filename))
+        self.assertTrue('vbox_manager_latency_seconds_count{stage="dispatch",command="listhostvms",host="h1"} 1' in content)
+        self.assertTrue('vbox_manager_latency_seconds_count{stage="dispatch",command="vmstate",host="h1"} 1' in content)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+File: test_progress.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of progress tracker on simulated operations
+"""
+
+import threading
+import time
+import unittest
+
+from modules.progress import ProgressTracker
+from modules.simulator import Backend, Progress
+
+class ProgressTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = Backend()
+        self.tracker = ProgressTracker()
+
+    def tearDown(self):
+        thread = self.tracker.thread
+        if thread is not None:
+            thread.join(5)
+
+    def testCallbackWithoutWaiter(self):
+        ended = threading.Event()
+        op = self.tracker.track(Progress(self.backend, 0.1), "start", lambda op: ended.set())
+        self.assertTrue(ended.wait(2))
+        self.assertEqual(op.getStatus(), "done")
+        self.assertTrue(op.wait(0))
+        self.assertTrue(op.isOk())
+        self.assertEqual(self.tracker.getOperations(), [op])
+
+    def testOperationsRunTogether(self):
+        started = time.time()
+        operations = [self.tracker.track(Progress(self.backend, 0.2), "op %d"%index) for index in range(5)]
+        for op in operations:
+            self.assertTrue(self.tracker.wait(op, 5))
+        self.assertTrue(time.time() - started < 0.6) # Completion is noticed without full render interval
+        self.assertTrue(all(op.isOk() for op in operations))
+
+    def testTrackerThreadEndsWhenIdle(self):
+        op = self.tracker.track(Progress(self.backend, 0.05), "start")
+        self.tracker.wait(op)
+        deadline = time.time() + 2
+        while self.tracker.thread is not None and time.time() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(self.tracker.thread, None)
+
+    def testFailureAndCancel(self):
+        progress = Progress(self.backend, 0.05)
+        progress._resultCode, progress._errorText = -1, "Broken"
+        failed = self.tracker.track(progress, "failing")
+        cancelled = self.tracker.track(Progress(self.backend, 60), "long")
+        self.assertTrue(self.tracker.cancel(cancelled.id))
+        self.assertTrue(self.tracker.wait(cancelled, 2))
+        self.assertTrue(self.tracker.wait(failed, 2))
+        self.assertEqual((failed.getStatus(), failed.error), ("failed", "Broken"))
+        self.assertEqual(cancelled.getStatus(), "cancelled")
+        self.assertFalse(self.tracker.cancel(cancelled.id)) # Already ended
+
+    def testWaitTimeoutAndDrop(self):
+        progress = Progress(self.backend, 60)
+        progress.cancelable = False
+        op = self.tracker.track(progress, "stuck")
+        self.assertFalse(self.tracker.wait(op, 0.1))
+        self.assertEqual(op.getStatus(), "running")
+        self.tracker.drop(op)
+        self.assertTrue(op.wait(0))
+        self.assertEqual(op.error, "Operation is not watched anymore")
+        self.assertFalse(op in self.tracker.operations)
+
+    def testLateCallbackIsCalled(self):
+        op = self.tracker.track(Progress(self.backend, 0), "quick")
+        self.tracker.wait(op)
+        called = []
+        op.addCallback(called.append)
+        self.assertEqual(called, [op])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+File: test_reload.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of incremental reload of configuration and watcher of configuration file
+"""
+
+import os
+import unittest
+
+from modules.watcher import FileWatcher
+from tests.simulated import *
+
+CONFIG = ("host name=h1\nhost name=h2\n"
+          "machine name=vm0001 host=h1 group=g user=u password=p\nmachine name=vm0002 host=h2 group=g\n")
+
+class ReloadTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter(CONFIG)
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.filename = writeTemp(CONFIG)
+        self.addCleanup(os.remove, self.filename)
+
+    def reload(self, config):
+        with open(self.filename, 'w') as fp:
+            fp.write(config)
+        return captureOutput(self.interpreter.runArgs, ['reload', self.filename])
+
+    def testUnchangedHostKeepsConnection(self):
+        h1, h2 = self.interpreter.envs['h1'], self.interpreter.envs['h2']
+        with h1.sessions.shared('vm0000'):
+            pass
+        output = self.reload(CONFIG.replace("host name=h2\n", "host name=h2 port=18084\n") + "host name=h3\n")
+        self.assertTrue("1 hosts added, 1 changed, 0 removed" in output)
+        self.assertTrue(self.interpreter.envs['h1'] is h1)
+        self.assertEqual(h1.sessions.getOpenCount(), 1) # Sessions and caches stay
+        self.assertFalse(self.interpreter.envs['h2'] is h2)
+        self.assertTrue(h2.connection.disconnected) # Replaced host logged off
+        self.assertTrue(self.interpreter.envs['h3'].isOpen())
+
+    def testMachinesAndGroupsAreUpdated(self):
+        output = self.reload("host name=h1\nmachine name=vm0001 host=h1 group=g user=v password=q\n")
+        self.assertTrue("0 hosts added, 0 changed, 1 removed" in output)
+        self.assertEqual(sorted(self.interpreter.envs.keys()), ['h1'])
+        self.assertEqual(self.interpreter.groups['g'].getMachines().keys(), ['h1'])
+        self.assertEqual(self.interpreter.credentials.lookup('h1', 'vm0001'), ('v', 'q'))
+
+    def testHostsOfCommandsAreKept(self):
+        captureOutput(self.interpreter.runArgs, ['addhost', 'h4'])
+        captureOutput(self.interpreter.runArgs, ['creategroup', 'web'])
+        self.reload("host name=h1\n")
+        self.assertEqual(sorted(self.interpreter.envs.keys()), ['h1', 'h4'])
+        self.assertTrue('web' in self.interpreter.groups)
+
+    def testErrorKeepsConfiguration(self):
+        envs = dict(self.interpreter.envs)
+        output = self.reload("host name=h1\nmachine name=vm0001 host=h9\n")
+        self.assertTrue("configuration was not changed" in output)
+        self.assertEqual(self.interpreter.envs, envs)
+        self.assertEqual(sorted(self.interpreter.groups['g'].getMachines().keys()), ['h1', 'h2'])
+
+    def testActiveHostIsReplaced(self):
+        captureOutput(self.interpreter.runArgs, ['switchhost', 'h2'])
+        output = self.reload("host name=h1\n")
+        self.assertTrue("Active host: h1" in output)
+        self.assertEqual(self.interpreter.active.getName(), 'h1')
+
+class FileWatcherTest(unittest.TestCase):
+    def testChangeIsReported(self):
+        filename = writeTemp("host name=h1\n")
+        self.addCleanup(os.remove, filename)
+        changed = []
+        watcher = FileWatcher(filename, changed.append, 0.02)
+        watcher.start()
+        self.addCleanup(watcher.stop)
+        with open(filename, 'a') as fp:
+            fp.write("host name=h2\n")
+        self.assertTrue(waitUntil(lambda: len(changed) == 1))
+        self.assertEqual(changed, [filename])
+
+    def testPendingReloadIsAppliedBetweenCommands(self):
+        interpreter = createInterpreter()
+        self.addCleanup(closeInterpreter, interpreter)
+        filename = writeTemp("host name=h1\nhost name=h2\n")
+        self.addCleanup(os.remove, filename)
+        interpreter.onConfigurationChanged(filename) # Called by watcher thread
+        self.assertFalse('h2' in interpreter.envs)
+        captureOutput(interpreter.applyPendingReload)
+        self.assertTrue('h2' in interpreter.envs)
+        self.assertEqual(interpreter.pendingReload, None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+File: test_scheduler.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of batch scheduling and dependencies of steps
+"""
+
+import os
+import time
+import unittest
+
+from tests.simulated import *
+
+def execute(step):
+    """ Steps of tests are 'sleep <seconds>', 'fail' or 'exit' """
+    if step.args[0] == 'fail':
+        raise Exception("Step failed")
+    if step.args[0] == 'exit':
+        return 1
+    time.sleep(float(step.args[1]))
+    return 0
+
+class BatchSchedulerTest(unittest.TestCase):
+    def createScheduler(self, *lines):
+        """
+        @param lines: Tuples (name, args, background, names of dependencies)
+        """
+        scheduler = BatchScheduler(execute, lambda: 'h1')
+        for name, args, background, after in lines:
+            step = Step(len(scheduler.steps), args, len(scheduler.steps) + 1, name, background)
+            scheduler.add(step)
+            for depname in after:
+                self.assertTrue(scheduler.addDependency(step, depname))
+        return scheduler
+
+    def testForegroundStepsRunInOrder(self):
+        scheduler = self.createScheduler(('a', ['sleep', '0.05'], False, []),
+                                         ('b', ['sleep', '0'], False, []),
+                                         ('c', ['sleep', '0'], False, []))
+        self.assertTrue(scheduler.run())
+        a, b, c = scheduler.steps
+        self.assertTrue(a.finished <= b.started and b.finished <= c.started)
+
+    def testForegroundDoesNotWaitForBackground(self):
+        scheduler = self.createScheduler(('a', ['sleep', '0.3'], True, []),
+                                         ('b', ['sleep', '0'], False, []),
+                                         ('c', ['sleep', '0'], False, []))
+        scheduler.run()
+        a, b, c = scheduler.steps
+        self.assertTrue(c.finished < a.finished)
+        self.assertTrue(b.finished <= c.started)
+
+    def testWaitIsBarrier(self):
+        scheduler = self.createScheduler(('a', ['sleep', '0.2'], True, []),
+                                         ('b', ['sleep', '0.1'], True, []),
+                                         (None, [], False, []),
+                                         ('c', ['sleep', '0'], False, []))
+        scheduler.run()
+        a, b, wait, c = scheduler.steps
+        self.assertTrue(c.started >= max(a.finished, b.finished))
+        self.assertTrue(b.started < a.finished) # Background steps run together
+        self.assertEqual([step.status for step in scheduler.steps], ["OK"] * 4)
+
+    def testDependencies(self):
+        scheduler = self.createScheduler(('a', ['sleep', '0.1'], True, []),
+                                         ('b', ['sleep', '0'], True, ['a']),
+                                         ('x', ['fail'], True, []),
+                                         ('y', ['sleep', '0'], True, ['x']),
+                                         (None, [], False, []))
+        scheduler.run()
+        a, b, x, y, wait = scheduler.steps
+        self.assertTrue(b.started >= a.finished)
+        self.assertEqual((x.status, x.error), ("FAILED", "Step failed"))
+        self.assertEqual((y.status, y.error), ("SKIPPED", "Dependency failed"))
+        self.assertFalse(scheduler.addDependency(a, 'unknown'))
+        self.assertFalse(scheduler.addDependency(a, 'a'))
+
+    def testCriticalPath(self):
+        scheduler = self.createScheduler(('a', ['sleep', '0.2'], True, []),
+                                         ('b', ['sleep', '0.1'], True, ['a']),
+                                         ('c', ['sleep', '0.1'], True, []),
+                                         (None, [], False, []))
+        estimates = {'a': 2.0, 'b': 1.0, 'c': 1.5}
+        path, total = scheduler.getCriticalPath(lambda step: estimates.get(step.name, 0.0))
+        self.assertEqual([step.name for step in path], ['a', 'b'])
+        self.assertEqual(total, 3.0)
+
+    def testExitStopsBatch(self):
+        scheduler = self.createScheduler(('a', ['sleep', '0.1'], True, []),
+                                         ('b', ['exit'], False, []),
+                                         ('c', ['sleep', '0'], False, []),
+                                         (None, [], False, []))
+        self.assertFalse(scheduler.run())
+        a, b, c, wait = scheduler.steps
+        self.assertEqual([step.status for step in scheduler.steps], ["OK", "OK", "NOT RUN", "NOT RUN"])
+        self.assertTrue(a.finished is not None) # Running steps end
+
+class ParseBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter("host name=h1\nmachine name=vm0000 host=h1 group=g\n")
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.filenames = []
+
+    def tearDown(self):
+        for filename in self.filenames:
+            os.remove(filename)
+
+    def parse(self, content):
+        self.filenames.append(writeTemp(content))
+        return self.interpreter.parseBatch(self.filenames[-1])
+
+    def testSteps(self):
+        scheduler, errors = self.parse("# Comment\n\n@a start vm0000 &\nafter=a vmstate vm0000; wait\n"
+                                       "gcmd vm0000 /bin/echo after=x\n")
+        self.assertEqual(errors, [])
+        a, state, wait, gcmd = scheduler.steps
+        self.assertEqual((a.name, a.args, a.background, a.line), ('a', ['start', 'vm0000'], True, 3))
+        self.assertEqual((state.args, state.after, state.background), (['vmstate', 'vm0000'], [a], False))
+        self.assertTrue(wait.isBarrier())
+        self.assertEqual(gcmd.args, ['gcmd', 'vm0000', '/bin/echo', 'after=x']) # Argument is not a dependency
+        self.assertEqual(wait.line, gcmd.line - 1)
+
+class BatchSummaryTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter()
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.filename = writeTemp("sleep 0\nsetram vm0000 2048\nexit\nsetram vm0001 2048\nsleep 0 &\n")
+        self.addCleanup(os.remove, self.filename)
+
+    def testStepsAfterExitAreNotRun(self):
+        output = captureOutput(self.interpreter.runArgs, ['batch', self.filename])
+        self.assertTrue("Batch summary: 5 steps, 2 succeeded, 1 failed, 0 skipped, 2 not run" in output)
+        self.assertEqual(self.interpreter.active.vbox.getByName('vm0001')._memorySize, 1024)
+
+if __name__ == '__main__':
+    unittest.main()
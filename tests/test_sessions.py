@@ -0,0 +1,66 @@
+"""
+File: test_sessions.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of session locks handed out by session manager
+"""
+
+import unittest
+
+from tests.simulated import *
+
+class SessionManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter()
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.env = self.interpreter.active
+        self.sessions = self.env.sessions
+
+    def getMachine(self, name):
+        return self.env.vbox.getByName(name)
+
+    def testSharedSessionIsReused(self):
+        machid = self.getMachine('vm0000')._id
+        with self.sessions.shared('vm0000') as (machine, session):
+            pass
+        with self.sessions.shared(machid) as (other, otherSession): # Named by UUID
+            self.assertTrue(otherSession is session)
+        self.assertEqual((self.sessions.locks, self.sessions.reuses), (1, 1))
+        self.assertEqual(self.sessions.getOpenCount(), 1)
+
+    def testWriteLockIsReleasedAfterFailure(self):
+        def fail():
+            with self.sessions.write('vm0001') as (machine, session):
+                raise ValueError("broken")
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(self.getMachine('vm0001').writeSession, None)
+        with self.sessions.write('vm0001') as (machine, session): # Machine can be locked again
+            session.machine.setMemorySize(2048)
+        self.assertEqual(self.getMachine('vm0001')._memorySize, 2048)
+
+    def testSessionInUseIsDetached(self):
+        machine = self.getMachine('vm0000')
+        with self.sessions.shared('vm0000') as (locked, session):
+            self.sessions.release('vm0000')
+            self.assertEqual(self.sessions.getOpenCount(), 0)
+            self.assertTrue(session in machine.sessions) # Still usable by this thread
+        self.assertFalse(session in machine.sessions) # The last user unlocked it
+
+    def testStoppedMachineReleasesSession(self):
+        machine = self.getMachine('vm0000')
+        with self.sessions.shared('vm0000'):
+            pass
+        machine.setState(self.env.const.MachineState_PoweredOff)
+        self.assertTrue(waitUntil(lambda: self.sessions.getOpenCount() == 0))
+        self.assertEqual(machine.sessions, [])
+
+    def testIdleSessionsAreReleased(self):
+        with self.sessions.shared('vm0000'):
+            pass
+        self.sessions.idleTimeout = 0
+        self.sessions.releaseIdle()
+        self.assertEqual(self.sessions.getOpenCount(), 0)
+        self.assertEqual(self.getMachine('vm0000').sessions, [])
+
+if __name__ == '__main__':
+    unittest.main()
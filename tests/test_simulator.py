@@ -0,0 +1,62 @@
+"""
+File: test_simulator.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of simulated VirtualBox backend
+"""
+
+import time
+import unittest
+
+from modules.simulator import SimulatedManager, SimulatedError
+
+class SimulatedManagerTest(unittest.TestCase):
+    def setUp(self):
+        SimulatedManager.configure(0.0, 0.0, 6, 0.05, seed=1)
+        self.mgr = SimulatedManager('WEBSERVICE', {'url': 'http://h1:18083'})
+
+    def testFleet(self):
+        machines = self.mgr.getArray(self.mgr.vbox, 'machines')
+        self.assertEqual([machine.name for machine in machines], ["vm%04d"%index for index in range(6)])
+        self.assertTrue(self.mgr.vbox.findMachine('vm0001') is machines[1])
+        self.assertTrue(self.mgr.vbox.findMachine(machines[2].id) is machines[2])
+
+    def testCallsFailAfterLogOff(self):
+        self.mgr.platform.disconnect()
+        try:
+            self.mgr.vbox.version
+            self.fail("Call succeeded after log off")
+        except SimulatedError as e:
+            self.assertTrue("invalid managed object reference" in str(e).lower())
+        vbox = self.mgr.platform.connect('http://h1:18083', '', '')
+        self.assertEqual(vbox.version, "5.0.16_SIM")
+
+    def testFailureRateIsReproducible(self):
+        outcomes = []
+        for attempt in range(2):
+            SimulatedManager.configure(0.0, 0.5, 1, 0.05, seed=7)
+            mgr = SimulatedManager()
+            results = []
+            for index in range(20):
+                try:
+                    mgr.vbox.version
+                    results.append(True)
+                except SimulatedError:
+                    results.append(False)
+            outcomes.append(results)
+        self.assertEqual(outcomes[0], outcomes[1])
+        self.assertTrue(False in outcomes[0] and True in outcomes[0])
+
+    def testLongOperation(self):
+        machine = self.mgr.vbox.findMachine('vm0001')
+        machine.setState(self.mgr.constants.MachineState_PoweredOff)
+        session = self.mgr.getSessionObject(self.mgr.vbox)
+        started = time.time()
+        progress = machine.launchVMProcess(session, "headless", "")
+        progress.waitForCompletion(-1)
+        self.assertTrue(time.time() - started >= 0.05)
+        self.assertEqual(progress.resultCode, 0)
+        self.assertEqual(machine.state, self.mgr.constants.MachineState_Running)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+File: test_states.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of machine states kept up to date by events
+"""
+
+import unittest
+
+from tests.simulated import *
+
+class StateTableTest(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = createInterpreter()
+        self.addCleanup(closeInterpreter, self.interpreter)
+        self.env = self.interpreter.active
+        self.const = self.env.const
+        self.assertTrue(waitUntil(lambda: self.env.events.subscribed))
+
+    def getRunning(self):
+        return sorted(record['name'] for record in self.env.states.getRunning())
+
+    def testStatesFollowEvents(self):
+        running = self.getRunning()
+        self.assertEqual(running, ['vm0000', 'vm0003'])
+        self.env.mgr.vbox.getByName('vm0001').setState(self.const.MachineState_Running)
+        self.env.mgr.vbox.getByName('vm0000').setState(self.const.MachineState_PoweredOff)
+        self.assertTrue(waitUntil(lambda: self.getRunning() == ['vm0001', 'vm0003']))
+        self.assertEqual(self.env.states.syncs, 1) # No reads of the whole table
+        self.assertEqual(self.env.states.getRecord('vm0001')['state'], self.const.MachineState_Running)
+
+    def testRegistrationEvents(self):
+        self.env.states.getRecords()
+        with self.env.mgr.backend.lock:
+            self.env.mgr.vbox.unregister(self.env.mgr.vbox.getByName('vm0003'))
+        self.assertTrue(waitUntil(lambda: self.env.states.getRecord('vm0003') is None))
+        self.assertEqual(self.getRunning(), ['vm0000'])
+
+    def testFirstListingIsNotStale(self):
+        self.env.inventory.get() # Snapshot taken before the change
+        self.env.mgr.vbox.getByName('vm0001').setState(self.const.MachineState_Running)
+        output = captureOutput(self.interpreter.runArgs, ['listrunningvms'])
+        self.assertEqual(sorted(output.splitlines()), ['vm0000 Ubuntu_64', 'vm0001 RedHat_64', 'vm0003 Ubuntu_64'])
+
+    def testResubscriptionReadsStatesAgain(self):
+        self.env.states.getRecords()
+        self.env.states.invalidate()
+        self.env.states.getRecords()
+        self.assertEqual(self.env.states.syncs, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+File: test_transfer.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of chunked transfer and its resume on simulated guest
+"""
+
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from tests.simulated import *
+from modules.simulator import Guest
+
+CHUNK = 1024
+
+class FileTransferTest(unittest.TestCase):
+    def setUp(self):
+        SimulatedManager.configure(0.0, 0.0, 3, 0.0, seed=1)
+        self.mgr = SimulatedManager()
+        self.const = self.mgr.constants
+        self.machine = self.mgr.vbox.getByName('vm0000') # Linux guest
+        self.machine.setState(self.const.MachineState_Running)
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "data.bin")
+        generator = random.Random(1)
+        self.data = "".join(chr(generator.randint(0, 255)) for index in range(10 * CHUNK + 100))
+        with open(self.source, 'wb') as fp:
+            fp.write(self.data)
+        self.journalFile = os.path.join(self.directory, "journal.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def createTransfer(self):
+        guestSession = Guest(self.machine).createSession('user', 'password', '', '')
+        return FileTransfer(guestSession, self.const, Journal(self.journalFile), CHUNK, 4)
+
+    def interrupt(self, key, size, mtime, data, confirmed):
+        """ Record journal of transfer interrupted after confirmed chunks """
+        digests = [hashlib.sha1(data[index * CHUNK:(index + 1) * CHUNK]).hexdigest() for index in range(confirmed)]
+        journal = Journal(self.journalFile)
+        journal.update(key, size, mtime, CHUNK, digests, confirmed)
+        journal.save()
+
+    def interruptUpload(self, confirmed):
+        self.interrupt("data.bin", len(self.data), int(os.stat(self.source).st_mtime), self.data, confirmed)
+
+    def testUpload(self):
+        transfer = self.createTransfer()
+        self.assertEqual(transfer.copyTo(self.source, "/data.bin"), 1)
+        self.assertEqual(self.machine.files["/data.bin"], self.data)
+        self.assertEqual((transfer.transferred, transfer.skipped), (len(self.data), 0))
+        self.assertFalse(os.path.exists(self.journalFile)) # Finished transfer is not resumed
+
+    def testUploadIsVerifiedByGuest(self):
+        transfer = self.createTransfer()
+        modes = []
+        fileOpen = transfer.guestSession.fileOpen
+        def recordingOpen(path, accessMode, openAction, creationMode):
+            modes.append(accessMode)
+            return fileOpen(path, accessMode, openAction, creationMode)
+        transfer.guestSession.fileOpen = recordingOpen
+        transfer.copyTo(self.source, "/data.bin")
+        self.assertFalse(self.const.FileAccessMode_ReadOnly in modes) # Checksum tool of guest, nothing is read back
+
+    def testResumeUpload(self):
+        self.interruptUpload(4)
+        self.machine.files["/data.bin"] = self.data[:4 * CHUNK]
+        transfer = self.createTransfer()
+        transfer.copyTo(self.source, "/data.bin")
+        self.assertEqual(self.machine.files["/data.bin"], self.data)
+        self.assertEqual(transfer.skipped, 4 * CHUNK)
+        self.assertEqual(transfer.transferred, len(self.data) - 4 * CHUNK)
+
+    def testUploadRestartsWhenDestinationIsGone(self):
+        self.interruptUpload(4)
+        transfer = self.createTransfer()
+        transfer.copyTo(self.source, "/data.bin")
+        self.assertEqual(self.machine.files["/data.bin"], self.data)
+        self.assertEqual((transfer.transferred, transfer.skipped), (len(self.data), 0))
+
+    def testUploadRestartsWhenDestinationIsTruncated(self):
+        self.interruptUpload(4)
+        self.machine.files["/data.bin"] = self.data[:2 * CHUNK]
+        transfer = self.createTransfer()
+        transfer.copyTo(self.source, "/data.bin")
+        self.assertEqual(self.machine.files["/data.bin"], self.data)
+        self.assertEqual(transfer.skipped, 0)
+
+    def testDamagedUploadIsRepaired(self):
+        self.interruptUpload(4)
+        self.machine.files["/data.bin"] = self.data[:CHUNK] + "x" * CHUNK + self.data[2 * CHUNK:4 * CHUNK]
+        self.assertRaises(TransferException, self.createTransfer().copyTo, self.source, "/data.bin")
+        transfer = self.createTransfer()
+        transfer.copyTo(self.source, "/data.bin") # Continues from the damaged chunk
+        self.assertEqual(self.machine.files["/data.bin"], self.data)
+        self.assertEqual(transfer.skipped, CHUNK)
+
+    def testResumeDownload(self):
+        self.machine.files["/data.bin"] = self.data
+        destination = os.path.join(self.directory, "copy.bin")
+        with open(destination, 'wb') as fp:
+            fp.write(self.data[:3 * CHUNK] + "unconfirmed")
+        self.interrupt("copy.bin", len(self.data), 0, self.data, 3)
+        transfer = self.createTransfer()
+        transfer.copyFrom("/data.bin", destination)
+        with open(destination, 'rb') as fp:
+            self.assertEqual(fp.read(), self.data)
+        self.assertEqual(transfer.skipped, 3 * CHUNK)
+
+    def testDownloadRestartsWhenDestinationIsGone(self):
+        self.machine.files["/data.bin"] = self.data
+        destination = os.path.join(self.directory, "copy.bin")
+        self.interrupt("copy.bin", len(self.data), 0, self.data, 3)
+        transfer = self.createTransfer()
+        transfer.copyFrom("/data.bin", destination)
+        with open(destination, 'rb') as fp:
+            self.assertEqual(fp.read(), self.data)
+        self.assertEqual(transfer.skipped, 0)
+
+if __name__ == '__main__':
+    unittest.main()
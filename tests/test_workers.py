@@ -0,0 +1,90 @@
+"""
+File: test_workers.py
+Author: agent
+Date: 2026-10-17
+Brief: Tests of worker pool and group commands executed by it
+"""
+
+import threading
+import time
+import unittest
+
+from tests.simulated import *
+
+class WorkerPoolTest(unittest.TestCase):
+    def testResultsKeepSubmissionOrder(self):
+        pool = WorkerPool(4)
+        for index in range(8):
+            pool.submit(index, lambda index=index: time.sleep(0.01 * (8 - index)) or index * 2)
+        results = pool.run()
+        self.assertEqual([result.key for result in results], range(8))
+        self.assertEqual([result.value for result in results], [index * 2 for index in range(8)])
+        self.assertTrue(all(result.isOk() and result.getLatency() is not None for result in results))
+
+    def testConcurrencyIsBounded(self):
+        lock = threading.Lock()
+        counts = {'running': 0, 'peak': 0}
+        def task():
+            with lock:
+                counts['running'] += 1
+                counts['peak'] = max(counts['peak'], counts['running'])
+            time.sleep(0.02)
+            with lock:
+                counts['running'] -= 1
+        pool = WorkerPool(3)
+        for index in range(10):
+            pool.submit(index, task)
+        pool.run()
+        self.assertEqual(counts['peak'], 3)
+
+    def testFailureDoesNotStopOtherTasks(self):
+        def fail():
+            raise ValueError("broken")
+        pool = WorkerPool(2)
+        pool.submit('ok', lambda: 1)
+        pool.submit('failed', fail)
+        ok, failed = pool.run()
+        self.assertEqual(ok.status, "OK")
+        self.assertEqual(failed.status, "FAILED")
+        self.assertEqual(failed.error, "broken")
+
+    def testEveryThreadIsInitialized(self):
+        lock = threading.Lock()
+        calls = {'init': 0, 'deinit': 0}
+        def count(name):
+            with lock:
+                calls[name] += 1
+        pool = WorkerPool(3, lambda: count('init'), lambda: count('deinit'))
+        for index in range(5):
+            pool.submit(index, lambda: None)
+        pool.run()
+        self.assertEqual(calls, {'init': 3, 'deinit': 3})
+        self.assertEqual(pool.run(), []) # Tasks are not executed twice
+
+class GroupCommandTest(unittest.TestCase):
+    def createInterpreter(self, *machines):
+        config = "host name=h1\n" + "".join("machine name=%s host=h1 group=g\n"%machname for machname in machines)
+        interpreter = createInterpreter(config)
+        self.addCleanup(closeInterpreter, interpreter)
+        return interpreter
+
+    def testGroupCommandRunsForEveryMachine(self):
+        names = ['vm0001', 'vm0002', 'vm0004', 'vm0005'] # Powered off, they can be locked for writing
+        interpreter = self.createInterpreter(*names)
+        interpreter.runArgs(['setram', 'g', '2048'])
+        self.assertEqual([interpreter.active.vbox.getByName(name)._memorySize for name in names], [2048] * 4)
+        histograms = interpreter.metrics.getHistograms("group")
+        self.assertEqual(len(histograms), 1)
+        self.assertEqual(histograms[0][0], ("group", "setram", "h1"))
+        self.assertEqual(histograms[0][1].count, 4)
+
+    def testStatusOfEveryMachine(self):
+        interpreter = self.createInterpreter('vm0000', 'vm0001', 'vm0003', 'vm0004')
+        results = interpreter.groupCommand('g', interpreter.cmdSetRam, ['g', '2048'], report=False)
+        statuses = dict((result.key[1], result.status) for result in results)
+        self.assertEqual(statuses, {'vm0000': "FAILED", 'vm0001': "OK", 'vm0003': "FAILED", 'vm0004': "OK"})
+        failed = [result for result in results if result.status == "FAILED"]
+        self.assertTrue(all("already locked" in result.error for result in failed)) # Running machines cannot be changed
+
+if __name__ == '__main__':
+    unittest.main()